@@ -0,0 +1,259 @@
+"""
+检测精度评估
+按类别计算 AP（IoU 阈值下的全点插值 AP）和 mAP 以及类别混淆矩阵，
+用于量化模型的精度门槛（与 FP32 模型比较）和标注数据集上的离线评估（evaluate.py）
+
+检测结果与标注都使用 (N, 6) 数组 [x1, y1, x2, y2, conf, cls]，标注的 conf 不参与计算
+"""
+
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from backends import box_iou
+from detections import CLASS_NAMES, class_name
+from mahjong_predictor import IMAGE_EXTENSIONS
+
+
+def yolo_dataset_items(dataset_dir: str, limit: int = 0) -> list:
+    """YOLO 格式数据集（images/ 与 labels/）中的样本，返回 [(相对 images/ 的名称, 图片路径, 标注文件路径), ...]，不读取图片"""
+    image_dir = Path(dataset_dir) / 'images'
+    label_dir = Path(dataset_dir) / 'labels'
+    items = []
+    for image_path in sorted(image_dir.rglob('*')):
+        if image_path.suffix.lower() not in IMAGE_EXTENSIONS:
+            continue
+        relative = image_path.relative_to(image_dir)
+        items.append((relative.as_posix(), str(image_path), str(label_dir / relative.with_suffix('.txt'))))
+        if limit and len(items) >= limit:
+            break
+    return items
+
+
+def read_yolo_labels(label_path: str, width: int, height: int) -> np.ndarray:
+    """读取 YOLO 标注文件（归一化的 cls cx cy w h），返回原图坐标的 (N, 6) 标注框 [x1, y1, x2, y2, 1, cls]"""
+    boxes = []
+    path = Path(label_path)
+    if path.exists():
+        for line in path.read_text().splitlines():
+            parts = line.split()
+            if len(parts) < 5:
+                continue
+            cls, cx, cy, bw, bh = int(parts[0]), *map(float, parts[1:5])
+            boxes.append(((cx - bw / 2) * width, (cy - bh / 2) * height,
+                          (cx + bw / 2) * width, (cy + bh / 2) * height, 1.0, cls))
+    return np.asarray(boxes, dtype=np.float32).reshape(-1, 6)
+
+
+def load_yolo_dataset(dataset_dir: str, limit: int = 0) -> list:
+    """读取 YOLO 格式数据集，返回 [(名称, BGR 图片, (N, 6) 标注框 [x1, y1, x2, y2, 1, cls]), ...]"""
+    samples = []
+    for _, image_path, label_path in yolo_dataset_items(dataset_dir):
+        image = cv2.imread(image_path)
+        if image is None:
+            continue
+        h, w = image.shape[:2]
+        samples.append((Path(image_path).name, image, read_yolo_labels(label_path, w, h)))
+        if limit and len(samples) >= limit:
+            break
+    return samples
+
+
+def match_detections(truth: np.ndarray, predictions: np.ndarray, iou_threshold: float = 0.5) -> np.ndarray:
+    """
+    单张图片内按置信度从高到低把预测框匹配到同类别、IoU 最大且未被匹配的标注框
+
+    Returns:
+        与 predictions 等长的布尔数组，True 表示该预测为真阳性
+    """
+    truth = np.asarray(truth, dtype=np.float32).reshape(-1, 6)
+    predictions = np.asarray(predictions, dtype=np.float32).reshape(-1, 6)
+    tp = np.zeros(len(predictions), dtype=bool)
+    if len(truth) == 0 or len(predictions) == 0:
+        return tp
+
+    ious = box_iou(predictions[:, :4], truth[:, :4])
+    ious[predictions[:, None, 5] != truth[None, :, 5]] = 0.0
+    used = np.zeros(len(truth), dtype=bool)
+    for i in np.argsort(-predictions[:, 4], kind='stable'):
+        candidates = np.where(used, -1.0, ious[i])
+        j = int(np.argmax(candidates))
+        if candidates[j] >= iou_threshold:
+            used[j] = True
+            tp[i] = True
+    return tp
+
+
+def average_precision(tp: np.ndarray, scores: np.ndarray, num_truth: int) -> tuple:
+    """
+    全点插值 AP
+
+    Returns:
+        (AP, 最终精确率, 最终召回率)
+    """
+    if num_truth == 0 or len(tp) == 0:
+        return 0.0, 0.0, 0.0
+    order = np.argsort(-scores, kind='stable')
+    tp_cumsum = np.cumsum(tp[order])
+    fp_cumsum = np.cumsum(~tp[order])
+    recall = tp_cumsum / num_truth
+    precision = tp_cumsum / np.maximum(tp_cumsum + fp_cumsum, 1e-9)
+
+    # 精确率包络：从右向左取最大值，再按召回率变化处积分
+    mrec = np.concatenate(([0.0], recall, [1.0]))
+    mpre = np.concatenate(([1.0], precision, [0.0]))
+    mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+    changes = np.where(mrec[1:] != mrec[:-1])[0]
+    ap = float(np.sum((mrec[changes + 1] - mrec[changes]) * mpre[changes + 1]))
+    return ap, float(precision[-1]), float(recall[-1])
+
+
+class DetectionEvaluator:
+    """
+    逐张图片累积匹配结果，最后按类别计算 AP / 精确率 / 召回率和 mAP
+
+    多个进程分别累积后可以用 merge 合并
+    """
+
+    def __init__(self, num_classes: int = len(CLASS_NAMES), iou_threshold: float = 0.5):
+        self.num_classes = num_classes
+        self.iou_threshold = iou_threshold
+        self.images = 0
+        self.truth_counts = np.zeros(num_classes, dtype=np.int64)
+        self._scores = [[] for _ in range(num_classes)]
+        self._tp = [[] for _ in range(num_classes)]
+
+    def add(self, truth: np.ndarray, predictions: np.ndarray):
+        """加入一张图片的标注和预测"""
+        truth = np.asarray(truth, dtype=np.float32).reshape(-1, 6)
+        predictions = np.asarray(predictions, dtype=np.float32).reshape(-1, 6)
+        tp = match_detections(truth, predictions, self.iou_threshold)
+        self.images += 1
+        truth_classes = truth[:, 5].astype(np.int64)
+        truth_classes = truth_classes[(truth_classes >= 0) & (truth_classes < self.num_classes)]
+        self.truth_counts += np.bincount(truth_classes, minlength=self.num_classes)
+        classes = predictions[:, 5].astype(np.int64)
+        for c in np.unique(classes).tolist():
+            if 0 <= c < self.num_classes:
+                mask = classes == c
+                self._scores[c].append(predictions[mask, 4])
+                self._tp[c].append(tp[mask])
+
+    def merge(self, other: 'DetectionEvaluator'):
+        self.images += other.images
+        self.truth_counts += other.truth_counts
+        for c in range(self.num_classes):
+            self._scores[c].extend(other._scores[c])
+            self._tp[c].extend(other._tp[c])
+
+    def summary(self) -> dict:
+        """
+        Returns:
+            dict: map（有标注的类别的平均 AP）、precision / recall（所有类别合计）、
+            per_class（每个类别的 ap、precision、recall、ground_truth、predictions）
+        """
+        per_class = []
+        aps = []
+        total_tp = total_predictions = 0
+        for c in range(self.num_classes):
+            scores = np.concatenate(self._scores[c]) if self._scores[c] else np.zeros(0, dtype=np.float32)
+            tp = np.concatenate(self._tp[c]) if self._tp[c] else np.zeros(0, dtype=bool)
+            num_truth = int(self.truth_counts[c])
+            ap, precision, recall = average_precision(tp, scores, num_truth)
+            if num_truth:
+                aps.append(ap)
+            total_tp += int(tp.sum())
+            total_predictions += len(tp)
+            if num_truth or len(tp):
+                per_class.append({
+                    'class_id': c,
+                    'class_name': class_name(c),
+                    'ap': ap,
+                    'precision': precision if len(tp) else 0.0,
+                    'recall': recall,
+                    'ground_truth': num_truth,
+                    'predictions': int(len(tp))
+                })
+        total_truth = int(self.truth_counts.sum())
+        return {
+            'images': self.images,
+            'iou_threshold': self.iou_threshold,
+            'map': float(np.mean(aps)) if aps else 0.0,
+            'precision': total_tp / total_predictions if total_predictions else 0.0,
+            'recall': total_tp / total_truth if total_truth else 0.0,
+            'per_class': per_class
+        }
+
+
+class ConfusionMatrix:
+    """
+    类别混淆矩阵（行为标注类别，列为预测类别，最后一行 / 列为背景）
+
+    预测框与标注框不区分类别、按置信度从高到低以 IoU 匹配：
+    匹配上的计入 [标注类别, 预测类别]，未匹配的标注框计入 [标注类别, 背景]（漏检），
+    未匹配的预测框计入 [背景, 预测类别]（误检）
+    """
+
+    def __init__(self, num_classes: int = len(CLASS_NAMES), iou_threshold: float = 0.5):
+        self.num_classes = num_classes
+        self.iou_threshold = iou_threshold
+        self.matrix = np.zeros((num_classes + 1, num_classes + 1), dtype=np.int64)
+
+    def _index(self, classes: np.ndarray) -> np.ndarray:
+        """超出范围的类别 ID 按背景处理"""
+        classes = classes.astype(np.int64)
+        return np.where((classes >= 0) & (classes < self.num_classes), classes, self.num_classes)
+
+    def add(self, truth: np.ndarray, predictions: np.ndarray):
+        """加入一张图片的标注和预测（预测应已按使用的置信度阈值过滤）"""
+        truth = np.asarray(truth, dtype=np.float32).reshape(-1, 6)
+        predictions = np.asarray(predictions, dtype=np.float32).reshape(-1, 6)
+        truth_classes = self._index(truth[:, 5])
+        predicted_classes = self._index(predictions[:, 5])
+        background = self.num_classes
+
+        matched_truth = np.zeros(len(truth), dtype=bool)
+        matched_predictions = np.zeros(len(predictions), dtype=bool)
+        if len(truth) and len(predictions):
+            ious = box_iou(predictions[:, :4], truth[:, :4])
+            for i in np.argsort(-predictions[:, 4], kind='stable'):
+                candidates = np.where(matched_truth, -1.0, ious[i])
+                j = int(np.argmax(candidates))
+                if candidates[j] >= self.iou_threshold:
+                    matched_truth[j] = True
+                    matched_predictions[i] = True
+                    self.matrix[truth_classes[j], predicted_classes[i]] += 1
+        np.add.at(self.matrix, (truth_classes[~matched_truth], background), 1)
+        np.add.at(self.matrix, (background, predicted_classes[~matched_predictions]), 1)
+
+    def merge(self, other: 'ConfusionMatrix'):
+        self.matrix += other.matrix
+
+    def top_confusions(self, limit: int = 10) -> list:
+        """最常见的类别混淆（不含背景），按次数从多到少"""
+        n = self.num_classes
+        off_diagonal = self.matrix[:n, :n].copy()
+        np.fill_diagonal(off_diagonal, 0)
+        order = np.argsort(-off_diagonal, axis=None, kind='stable')[:limit]
+        confusions = []
+        for flat in order.tolist():
+            truth_class, predicted_class = divmod(flat, n)
+            count = int(off_diagonal[truth_class, predicted_class])
+            if count == 0:
+                break
+            confusions.append({
+                'truth': class_name(truth_class),
+                'predicted': class_name(predicted_class),
+                'count': count,
+                # 占该类别全部标注框的比例
+                'rate': count / max(int(self.matrix[truth_class].sum()), 1)
+            })
+        return confusions
+
+    def to_dict(self) -> dict:
+        return {
+            'labels': [class_name(c) for c in range(self.num_classes)] + ['背景'],
+            'iou_threshold': self.iou_threshold,
+            'matrix': self.matrix.tolist()
+        }
@@ -0,0 +1,229 @@
+"""
+准入控制与请求截止时间
+限制每个工作进程同时处理的识别请求数，超出时在有界的等待队列中排队，
+队列已满或等待超时时立即拒绝（503），突发的大量上传只会让少数请求快速失败，
+而不会耗尽内存、拖慢所有请求；请求体大小在读取之前按 Content-Length 检查（413）
+
+每个请求有一个截止时间（contextvar）：微批调度器丢弃已过期的排队图片，
+等待推理结果超过截止时间时取消尚未执行的图片，请求返回 504
+"""
+
+import time
+import threading
+import functools
+import contextvars
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import config
+import metrics
+
+
+class AdmissionError(Exception):
+    """准入控制拒绝或截止时间已过，status_code 为响应状态码"""
+
+    status_code = 503
+    reason = 'rejected'
+
+    def __init__(self, message: str, reason: str = None, retry_after: int = None):
+        super().__init__(message)
+        if reason is not None:
+            self.reason = reason
+        self.retry_after = retry_after
+
+
+class RequestTooLarge(AdmissionError):
+    status_code = 413
+    reason = 'too_large'
+
+
+class AdmissionRejected(AdmissionError):
+    status_code = 503
+
+
+class DeadlineExceeded(AdmissionError):
+    status_code = 504
+    reason = 'deadline'
+
+
+# 视图中的通用异常处理需要原样抛出的异常，由应用级错误处理返回对应状态码
+# （RequestEntityTooLarge 为没有 Content-Length 的分块上传在读取时超过 MAX_CONTENT_LENGTH）
+REJECTIONS = (AdmissionError, RequestEntityTooLarge)
+
+# 不设置截止时间的接口：视频上传流式返回各帧结果，运行时间取决于视频长度（并发数由 video_controller 限制）
+DEADLINE_EXEMPT = {'predict_stream.predict_video'}
+
+_deadline = contextvars.ContextVar('mahjong_deadline', default=None)
+
+
+def start_deadline(timeout: float):
+    """为当前上下文（请求）设置截止时间，timeout <= 0 表示不限制，返回用于 stop_deadline 的令牌"""
+    return _deadline.set(time.monotonic() + timeout if timeout and timeout > 0 else None)
+
+
+def stop_deadline(token):
+    _deadline.reset(token)
+
+
+def current_deadline() -> float:
+    """当前请求的截止时间（time.monotonic()），未设置时返回 None"""
+    return _deadline.get()
+
+
+def remaining() -> float:
+    """距截止时间的剩余秒数（可能为负），未设置时返回 None"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline(stage: str = 'inference'):
+    """截止时间已过时计数并抛出 DeadlineExceeded"""
+    left = remaining()
+    if left is not None and left <= 0:
+        metrics.DEADLINE_EXCEEDED.inc(stage=stage)
+        raise DeadlineExceeded('Request deadline exceeded')
+
+
+def wait_result(future):
+    """
+    在截止时间内等待微批调度器的结果
+
+    超时后取消尚未开始推理的图片；已经在推理中的图片无法中断，其结果被丢弃
+    """
+    try:
+        return future.result(timeout=remaining() if current_deadline() is not None else None)
+    except FutureTimeoutError:
+        stage = 'queue' if future.cancel() else 'inference'
+        metrics.DEADLINE_EXCEEDED.inc(stage=stage)
+        raise DeadlineExceeded('Request deadline exceeded')
+
+
+class AdmissionController:
+    """
+    限制同时处理的请求数，超出的请求在有界队列中等待
+
+    Args:
+        max_in_flight: 同时处理的最大请求数，0 表示不限制
+        max_waiting: 最多等待的请求数，超过时立即拒绝
+        wait_timeout: 最长等待时间（秒），不超过请求剩余的截止时间
+    """
+
+    def __init__(self, max_in_flight: int, max_waiting: int, wait_timeout: float):
+        self.max_in_flight = max(0, int(max_in_flight))
+        self.max_waiting = max(0, int(max_waiting))
+        self.wait_timeout = max(0.0, float(wait_timeout))
+        self._cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = {}
+
+    def _reject(self, reason: str, message: str):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        metrics.ADMISSION_REJECTED.inc(reason=reason)
+        raise AdmissionRejected(message, reason=reason, retry_after=max(1, int(round(self.wait_timeout))))
+
+    def acquire(self):
+        """获取处理名额，队列已满或等待超时时抛出 AdmissionRejected"""
+        if self.max_in_flight == 0:
+            return
+        start = time.monotonic()
+        timeout = self.wait_timeout
+        left = remaining()
+        if left is not None:
+            timeout = min(timeout, max(0.0, left))
+
+        with self._cond:
+            # 有请求在等待时新请求也排队，不插队
+            if self.in_flight >= self.max_in_flight or self.waiting:
+                if self.waiting >= self.max_waiting:
+                    self._reject('queue_full', 'Server busy, try again later')
+                self.waiting += 1
+                try:
+                    end = start + timeout
+                    while self.in_flight >= self.max_in_flight:
+                        wait = end - time.monotonic()
+                        if wait <= 0:
+                            self._reject('wait_timeout', 'Server busy, timed out waiting for capacity')
+                        self._cond.wait(wait)
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+            self.admitted += 1
+        metrics.record_stage('admission_wait', time.monotonic() - start)
+
+    def release(self):
+        if self.max_in_flight == 0:
+            return
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        """在获得的处理名额内执行代码块"""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'max_in_flight': self.max_in_flight,
+                'max_waiting': self.max_waiting,
+                'wait_timeout': self.wait_timeout,
+                'in_flight': self.in_flight,
+                'waiting': self.waiting,
+                'admitted': self.admitted,
+                'rejected': dict(self.rejected)
+            }
+
+
+def admitted(view):
+    """视图装饰器：获得处理名额后才读取请求体并处理请求"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with controller.slot():
+            return view(*args, **kwargs)
+    return wrapper
+
+
+def request_timeout(header_value: str = None) -> float:
+    """请求的截止时间（秒）：配置的上限，客户端可以通过 X-Request-Timeout 请求头缩短"""
+    timeout = config.REQUEST_TIMEOUT
+    try:
+        requested = float(header_value) if header_value else None
+    except ValueError:
+        requested = None
+    if requested is not None and requested > 0:
+        timeout = min(timeout, requested) if timeout > 0 else requested
+    return timeout
+
+
+def max_body_bytes(endpoint: str) -> int:
+    """各接口允许的最大请求体（字节），0 表示不限制"""
+    if endpoint == 'predict_stream.predict_video':
+        # 视频文件另有大小限制，多留 1MB 给表单字段
+        return (config.STREAM_MAX_UPLOAD_MB + 1) * 1024 * 1024
+    if endpoint == 'predict_batch':
+        return config.BATCH_MAX_REQUEST_MB * 1024 * 1024
+    return config.MAX_REQUEST_MB * 1024 * 1024
+
+
+def check_content_length(endpoint: str, content_length: int):
+    """按 Content-Length 在读取请求体之前拒绝过大的请求"""
+    limit = max_body_bytes(endpoint)
+    if limit and content_length is not None and content_length > limit:
+        metrics.ADMISSION_REJECTED.inc(reason='too_large')
+        raise RequestTooLarge(f'Request too large. Maximum size is {limit // (1024 * 1024)}MB')
+
+
+# 进程级准入控制
+controller = AdmissionController(config.ADMISSION_MAX_IN_FLIGHT, config.ADMISSION_MAX_WAITING,
+                                 config.ADMISSION_WAIT_TIMEOUT)
+# 上传视频的并发上限：视频识别的运行时间取决于视频长度，单独限制且不排队，超出时立即拒绝
+video_controller = AdmissionController(config.STREAM_MAX_VIDEO_JOBS, 0, 0)
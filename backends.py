@@ -0,0 +1,459 @@
+"""
+推理后端
+统一不同推理引擎的调用方式，所有后端的 predict 都返回每张图片一个
+(N, 6) 数组 [x1, y1, x2, y2, conf, cls]，坐标为原图坐标
+
+- torch: ultralytics + PyTorch（默认）
+- onnx: 导出为 ONNX 后用 ONNX Runtime 推理
+- openvino: 导出为 OpenVINO IR 后用 OpenVINO 推理
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('torch', 'onnx', 'openvino')
+
+# 与 ultralytics 默认值保持一致
+DEFAULT_IMGSZ = 640
+DEFAULT_IOU = 0.7
+MAX_DETECTIONS = 300
+_CLASS_OFFSET = 7680
+
+_hash_cache = {}
+_hash_lock = threading.Lock()
+_export_lock = threading.Lock()
+
+
+def weights_hash(weights_path: str) -> str:
+    """计算模型文件的 SHA-256，按 (路径, 修改时间, 大小) 缓存"""
+    path = os.path.abspath(weights_path)
+    st = os.stat(path)
+    key = (path, st.st_mtime_ns, st.st_size)
+    with _hash_lock:
+        digest = _hash_cache.get(key)
+    if digest is not None:
+        return digest
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+    with _hash_lock:
+        _hash_cache[key] = digest
+    return digest
+
+
+def exported_model_path(weights_path: str, fmt: str) -> str:
+    """导出模型的缓存路径：与权重文件同目录，文件名包含权重哈希"""
+    weights = Path(weights_path)
+    digest = weights_hash(weights_path)[:16]
+    if fmt == 'onnx':
+        return str(weights.with_name(f"{weights.stem}.{digest}.onnx"))
+    if fmt == 'openvino':
+        return str(weights.with_name(f"{weights.stem}.{digest}_openvino_model"))
+    raise ValueError(f"不支持的导出格式: {fmt}")
+
+
+def quantized_model_path(weights_path: str) -> str:
+    """INT8 量化模型的路径：与权重文件同目录，文件名包含权重哈希"""
+    weights = Path(weights_path)
+    digest = weights_hash(weights_path)[:16]
+    return str(weights.with_name(f"{weights.stem}.{digest}.int8.onnx"))
+
+
+def quantization_report_path(quantized_path: str) -> str:
+    """量化模型旁的精度与性能报告（JSON）"""
+    return str(Path(quantized_path).with_suffix('.json'))
+
+
+_variant_cache = {}
+_VARIANTS = ('fp32', 'int8')
+
+
+def resolve_variant(model_path: str, variant: str = 'fp32') -> str:
+    """
+    根据模型精度变体确定实际加载的模型文件
+
+    int8 变体使用 quantize_model.py 生成且通过精度校验的 INT8 ONNX 模型；
+    量化模型不存在或未通过校验时记录警告并回退到原模型
+
+    Args:
+        model_path: .pt 权重路径（其他格式原样返回）
+        variant: fp32 / int8
+
+    Returns:
+        模型文件路径
+    """
+    if variant not in _VARIANTS:
+        raise ValueError(f"不支持的模型精度变体: {variant}，可选: {', '.join(_VARIANTS)}")
+    if variant == 'fp32' or not str(model_path).endswith('.pt'):
+        return model_path
+
+    quantized = quantized_model_path(model_path)
+    report_path = quantization_report_path(quantized)
+    try:
+        key = (quantized, os.stat(quantized).st_mtime_ns, os.stat(report_path).st_mtime_ns)
+    except OSError:
+        key = None
+    if key is not None and key in _variant_cache:
+        return _variant_cache[key]
+
+    resolved = model_path
+    if key is None:
+        # 每个文件只警告一次，避免每个请求都输出日志
+        if quantized not in _variant_cache:
+            _variant_cache[quantized] = model_path
+            logger.warning(f"INT8 model not found, using FP32 model: {quantized} (run quantize_model.py first)")
+    else:
+        with open(report_path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        if report.get('passed'):
+            resolved = quantized
+        else:
+            logger.warning(f"INT8 model failed accuracy check, using FP32 model: {quantized}")
+        _variant_cache[key] = resolved
+    return resolved
+
+
+def export_model(weights_path: str, fmt: str = 'onnx', imgsz: int = DEFAULT_IMGSZ) -> str:
+    """
+    将 .pt 权重导出为 ONNX / OpenVINO IR，已导出过的直接复用缓存
+
+    Args:
+        weights_path: .pt 权重文件路径
+        fmt: 导出格式（onnx / openvino）
+        imgsz: 导出输入尺寸
+
+    Returns:
+        导出模型路径
+    """
+    target = exported_model_path(weights_path, fmt)
+    if os.path.exists(target):
+        return target
+
+    # 线程锁串行化本进程内的导出，文件锁让多个工作进程只导出一次（其余进程等待后复用）
+    with _export_lock, _file_lock(f"{target}.lock"):
+        if os.path.exists(target):
+            return target
+
+        from ultralytics import YOLO
+
+        # ultralytics 把导出结果写在权重文件旁：复制到本进程的临时目录中导出，完成后原子重命名到缓存路径，
+        # 其他进程不会读到写了一半的文件
+        work_dir = tempfile.mkdtemp(prefix='.export-', dir=os.path.dirname(os.path.abspath(target)))
+        try:
+            weights = os.path.join(work_dir, os.path.basename(weights_path))
+            shutil.copyfile(weights_path, weights)
+            logger.info(f"Exporting {weights_path} to {fmt}: {target}")
+            exported = YOLO(weights).export(format=fmt, imgsz=imgsz, dynamic=True)
+            try:
+                os.replace(str(exported), target)
+            except OSError:
+                # 没有文件锁的平台上其他进程可能已先完成导出（目录不能覆盖）
+                if not os.path.exists(target):
+                    raise
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return target
+
+
+@contextmanager
+def _file_lock(path: str):
+    """跨进程的排他文件锁（fcntl），不支持 fcntl 的平台上不加锁"""
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def letterbox(image: np.ndarray, size: int = DEFAULT_IMGSZ, auto: bool = False, stride: int = 32) -> tuple:
+    """
+    等比缩放并填充，与 ultralytics 的 LetterBox 一致
+
+    Args:
+        image: BGR 图片
+        size: 目标尺寸
+        auto: 只填充到 stride 的整数倍（最小矩形），否则填充到 size x size
+        stride: 模型步长
+
+    Returns:
+        (填充后的图片, 缩放比例, (左侧填充, 顶部填充))
+    """
+    h, w = image.shape[:2]
+    ratio = min(size / h, size / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    dw, dh = size - new_w, size - new_h
+    if auto:
+        dw, dh = dw % stride, dh % stride
+    dw, dh = dw / 2, dh / 2
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+
+    if (w, h) != (new_w, new_h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    padded = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return padded, ratio, (left, top)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float, metric: str = 'iou') -> np.ndarray:
+    """
+    非极大值抑制，返回保留框的下标（按分数降序）
+
+    metric 为 'ios' 时按交集占较小框面积的比例抑制，用于合并切片推理中被切片边界截断的框
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1).clip(0) * (y2 - y1).clip(0)
+    order = scores.argsort()[::-1]
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = (np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest])).clip(0)
+        h = (np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest])).clip(0)
+        inter = w * h
+        if metric == 'ios':
+            overlap = inter / (np.minimum(areas[i], areas[rest]) + 1e-9)
+        else:
+            overlap = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[overlap <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """两组 xyxy 框之间的 IoU 矩阵，形状 (len(a), len(b))"""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    wh = (rb - lt).clip(0)
+    inter = wh[..., 0] * wh[..., 1]
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def _empty_boxes() -> np.ndarray:
+    return np.zeros((0, 6), dtype=np.float32)
+
+
+class TorchBackend:
+    """ultralytics + PyTorch 后端"""
+
+    name = 'torch'
+
+    def __init__(self, model_path: str, device: str = 'cpu'):
+        from ultralytics import YOLO
+
+        self.model_path = model_path
+        self.device = device
+        self.model = YOLO(model_path)
+        if device:
+            self.model.to(device)
+        # ultralytics 的 predictor 不是线程安全的，同一模型的推理需要串行
+        self.lock = threading.Lock()
+
+    def predict(self, images: list, conf_threshold: float = 0.1, save_result: bool = False,
+                output_dir: str = 'run/predict') -> list:
+        with self.lock:
+            results = self.model.predict(
+                source=list(images),
+                save=save_result,
+                show=False,
+                conf=conf_threshold,
+                project=output_dir,
+                device=self.device,
+                verbose=False
+            )
+        # ultralytics 的 speed 是本批次平均到每张图片的耗时（毫秒），postprocess 主要是 NMS
+        for stage, key in (('preprocess', 'preprocess'), ('inference', 'inference'), ('nms', 'postprocess')):
+            metrics.record_stage(stage, sum(result.speed.get(key) or 0.0 for result in results) / 1000.0)
+        return [result.boxes.data.cpu().numpy().astype(np.float32) for result in results]
+
+
+class OnnxBackend:
+    """ONNX Runtime 后端"""
+
+    name = 'onnx'
+
+    def __init__(self, model_path: str, device: str = 'cpu', imgsz: int = DEFAULT_IMGSZ,
+                 intra_op_threads: int = 0, inter_op_threads: int = 0, iou_threshold: float = DEFAULT_IOU):
+        self.model_path = model_path
+        self.device = device
+        self.imgsz = imgsz
+        self.iou_threshold = iou_threshold
+        self._load(intra_op_threads, inter_op_threads)
+
+    def _load(self, intra_op_threads: int, inter_op_threads: int):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("使用 onnx 后端需要安装 onnxruntime: pip install onnxruntime")
+
+        options = ort.SessionOptions()
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            options.inter_op_num_threads = inter_op_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(self.model_path, sess_options=options,
+                                            providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # 静态 batch 的模型只能逐张推理
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+        self.dynamic_shape = not isinstance(model_input.shape[2], int)
+
+    def _run(self, blob: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: blob})[0]
+
+    def preprocess(self, images: list) -> tuple:
+        """letterbox + BGR->RGB + 归一化，返回 NCHW 输入和每张图片的还原参数"""
+        # 与 ultralytics 相同：输入尺寸可变且同批图片尺寸一致时只填充到步长的整数倍
+        auto = self.dynamic_shape and len({image.shape for image in images}) == 1
+        padded_images, metas = [], []
+        for image in images:
+            padded, ratio, pad = letterbox(image, self.imgsz, auto=auto)
+            padded_images.append(padded)
+            metas.append((ratio, pad, image.shape[:2]))
+
+        h, w = padded_images[0].shape[:2]
+        blob = np.empty((len(images), 3, h, w), dtype=np.float32)
+        for i, padded in enumerate(padded_images):
+            blob[i] = padded[:, :, ::-1].transpose(2, 0, 1)
+        blob /= 255.0
+        return blob, metas
+
+    def postprocess(self, output: np.ndarray, conf_threshold: float, meta: tuple) -> np.ndarray:
+        """解码单张图片的输出 (4 + nc, anchors)，执行 NMS 并还原到原图坐标"""
+        ratio, (left, top), (h, w) = meta
+        preds = output.T
+        class_scores = preds[:, 4:]
+        cls = class_scores.argmax(axis=1)
+        conf = class_scores[np.arange(len(cls)), cls]
+        mask = conf > conf_threshold
+        if not mask.any():
+            return _empty_boxes()
+
+        xywh, conf, cls = preds[mask, :4], conf[mask], cls[mask]
+        boxes = np.empty_like(xywh)
+        boxes[:, 0] = xywh[:, 0] - xywh[:, 2] / 2
+        boxes[:, 1] = xywh[:, 1] - xywh[:, 3] / 2
+        boxes[:, 2] = xywh[:, 0] + xywh[:, 2] / 2
+        boxes[:, 3] = xywh[:, 1] + xywh[:, 3] / 2
+
+        # 按类别偏移后统一做 NMS，等价于逐类别 NMS
+        keep = nms(boxes + cls[:, None] * _CLASS_OFFSET, conf, self.iou_threshold)[:MAX_DETECTIONS]
+        boxes, conf, cls = boxes[keep], conf[keep], cls[keep]
+
+        boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - left) / ratio).clip(0, w)
+        boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - top) / ratio).clip(0, h)
+        return np.concatenate(
+            [boxes, conf[:, None], cls[:, None].astype(np.float32)], axis=1
+        ).astype(np.float32)
+
+    def predict(self, images: list, conf_threshold: float = 0.1, **kwargs) -> list:
+        images = list(images)
+        if not images:
+            return []
+        with metrics.stage('preprocess'):
+            blob, metas = self.preprocess(images)
+        with metrics.stage('inference'):
+            if self.dynamic_batch:
+                outputs = self._run(blob)
+            else:
+                outputs = np.concatenate([self._run(blob[i:i + 1]) for i in range(len(images))])
+        with metrics.stage('nms'):
+            return [self.postprocess(outputs[i], conf_threshold, metas[i]) for i in range(len(images))]
+
+
+class OpenVINOBackend(OnnxBackend):
+    """OpenVINO 后端，前后处理与 ONNX 后端相同"""
+
+    name = 'openvino'
+
+    def _load(self, intra_op_threads: int, inter_op_threads: int):
+        try:
+            import openvino as ov
+        except ImportError:
+            raise ImportError("使用 openvino 后端需要安装 openvino: pip install openvino")
+
+        model_dir = Path(self.model_path)
+        xml_path = next(model_dir.glob('*.xml')) if model_dir.is_dir() else model_dir
+        core = ov.Core()
+        properties = {}
+        if intra_op_threads:
+            properties['INFERENCE_NUM_THREADS'] = intra_op_threads
+        if inter_op_threads:
+            properties['NUM_STREAMS'] = inter_op_threads
+        self.compiled = core.compile_model(core.read_model(str(xml_path)), 'CPU', properties)
+        self.output = self.compiled.output(0)
+        input_shape = self.compiled.input(0).get_partial_shape()
+        self.dynamic_batch = input_shape[0].is_dynamic
+        self.dynamic_shape = input_shape[2].is_dynamic
+
+    def _run(self, blob: np.ndarray) -> np.ndarray:
+        return self.compiled([blob])[self.output]
+
+
+def resolve_backend(model_path: str, backend: str) -> str:
+    """根据模型文件类型确定实际使用的后端，已导出的模型直接使用对应后端"""
+    if str(model_path).endswith('.onnx'):
+        return 'onnx'
+    if str(model_path).rstrip('/\\').endswith('_openvino_model'):
+        return 'openvino'
+    if backend not in BACKENDS:
+        raise ValueError(f"不支持的推理后端: {backend}，可选: {', '.join(BACKENDS)}")
+    return backend
+
+
+def load_backend(model_path: str, backend: str = 'torch', device: str = 'cpu', **options):
+    """
+    加载推理后端
+
+    Args:
+        model_path: 模型路径（.pt 权重、.onnx 文件或 OpenVINO 模型目录）
+        backend: 后端名称，.pt 权重使用 onnx / openvino 后端时会先导出（带缓存）
+        device: 推理设备（onnx / openvino 后端仅支持 CPU）
+        options: 传给 ONNX / OpenVINO 后端的参数（imgsz、线程数等），torch 后端忽略
+
+    Returns:
+        后端实例
+    """
+    backend = resolve_backend(model_path, backend)
+    if backend == 'torch':
+        return TorchBackend(model_path, device)
+
+    if str(model_path).endswith('.pt'):
+        model_path = export_model(model_path, backend, options.get('imgsz', DEFAULT_IMGSZ))
+    if backend == 'onnx':
+        return OnnxBackend(model_path, device, **options)
+    return OpenVINOBackend(model_path, device, **options)
@@ -0,0 +1,171 @@
+"""
+动态微批推理调度器
+将并发请求的图片排队，凑满最大批大小或等待超时后执行一次批量推理，
+再把每张图片的结果交还给对应的请求；
+批量推理各阶段耗时（同批共享）和排队时间挂在 Future 的 timings / queue_wait 上，
+供调用方合并到请求的耗时明细；
+提交时可以附带请求的截止时间，凑批后已过期的图片不再推理，直接以 DeadlineExceeded 结束
+"""
+
+import os
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+
+import metrics
+from admission import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+
+class _BatchItem:
+    __slots__ = ('image', 'future', 'enqueued_at', 'deadline')
+
+    def __init__(self, image, deadline: float = None):
+        self.image = image
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.deadline = deadline
+
+
+class BatchScheduler:
+    """
+    微批调度器
+
+    Args:
+        run_batch: 批量推理函数，接收图片列表，返回等长的结果列表
+        max_batch_size: 单批最大图片数
+        max_wait_ms: 第一张图片入队后最多等待多久凑批（毫秒）
+        name: 调度器名称，用于日志
+    """
+
+    def __init__(self, run_batch, max_batch_size: int = 8, max_wait_ms: float = 15.0, name: str = 'default'):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.batches = 0
+        self.items = 0
+        self.batch_size_counts = {}
+        self.expired = 0
+
+    def _ensure_worker(self):
+        # 工作线程在首次提交时才启动；fork 出的子进程不会继承父进程的线程，需要重新启动
+        pid = os.getpid()
+        if self._thread is not None and self._pid == pid and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == pid and self._thread.is_alive():
+                return
+            if self._pid != pid:
+                self._queue = queue.Queue()
+            self._pid = pid
+            self._thread = threading.Thread(
+                target=self._loop, name=f'batch-scheduler-{self.name}', daemon=True
+            )
+            self._thread.start()
+
+    def submit(self, image, deadline: float = None) -> Future:
+        """
+        提交一张图片，返回在推理完成后得到结果的 Future
+
+        Args:
+            image: 图片
+            deadline: 截止时间（time.monotonic()），开始推理时已过期的图片被丢弃
+        """
+        self._ensure_worker()
+        item = _BatchItem(image, deadline)
+        self._queue.put(item)
+        return item.future
+
+    def predict(self, image, timeout: float = None):
+        """提交一张图片并等待结果"""
+        return self.submit(image).result(timeout=timeout)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _collect(self, first) -> list:
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    # 等待时间已到，只取走已经在队列中的图片
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            batch = self._collect(first)
+            # 跳过已被调用方取消的请求
+            batch = [item for item in batch if item.future.set_running_or_notify_cancel()]
+            batch = self._drop_expired(batch)
+            if not batch:
+                continue
+            started_at = time.monotonic()
+            for item in batch:
+                metrics.STAGE_SECONDS.observe(started_at - item.enqueued_at, stage='queue_wait')
+            # 在工作线程中单独收集本批次的阶段耗时
+            token = metrics.start_timings()
+            try:
+                results = self.run_batch([item.image for item in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"批量推理返回 {len(results)} 个结果，期望 {len(batch)} 个")
+            except Exception as e:
+                logger.error(f"Batch inference failed ({len(batch)} images): {str(e)}")
+                for item in batch:
+                    item.future.set_exception(e)
+                continue
+            finally:
+                timings = metrics.current_timings()
+                metrics.stop_timings(token)
+                with self._lock:
+                    self.batches += 1
+                    self.items += len(batch)
+                    self.batch_size_counts[len(batch)] = self.batch_size_counts.get(len(batch), 0) + 1
+
+            for item, result in zip(batch, results):
+                item.future.timings = timings
+                item.future.queue_wait = started_at - item.enqueued_at
+                item.future.set_result(result)
+
+    def _drop_expired(self, batch: list) -> list:
+        """请求已过截止时间的图片不再推理"""
+        now = time.monotonic()
+        live = []
+        for item in batch:
+            if item.deadline is not None and now >= item.deadline:
+                metrics.DEADLINE_EXCEEDED.inc(stage='queue')
+                item.future.set_exception(DeadlineExceeded('Request deadline exceeded'))
+                with self._lock:
+                    self.expired += 1
+            else:
+                live.append(item)
+        return live
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'name': self.name,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'batches': self.batches,
+                'items': self.items,
+                'avg_batch_size': (self.items / self.batches) if self.batches else 0.0,
+                'batch_size_counts': dict(sorted(self.batch_size_counts.items())),
+                'queue_depth': self._queue.qsize(),
+                'expired': self.expired
+            }
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+微批调度器基准测试
+用多个并发线程模拟 /predict_image 请求，比较不同最大批大小下的
+p50/p99 延迟和吞吐量
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+
+from batch_scheduler import BatchScheduler
+from mahjong_predictor import predict_images
+from model_registry import registry
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def run_case(image, model_path: str, batch_size: int, max_wait_ms: float,
+             concurrency: int, requests: int, conf: float, device: str) -> dict:
+    """以指定批大小运行一轮压测"""
+    scheduler = BatchScheduler(
+        partial(predict_images, model_path=model_path, conf_threshold=conf, device=device),
+        max_batch_size=batch_size,
+        max_wait_ms=max_wait_ms,
+        name=f'bench-{batch_size}'
+    )
+    latencies = []
+    latencies_lock = threading.Lock()
+    counter = iter(range(requests))
+    counter_lock = threading.Lock()
+
+    def worker():
+        while True:
+            with counter_lock:
+                if next(counter, None) is None:
+                    return
+            start = time.perf_counter()
+            scheduler.predict(image)
+            elapsed = (time.perf_counter() - start) * 1000.0
+            with latencies_lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    stats = scheduler.stats()
+    return {
+        'max_batch_size': batch_size,
+        'max_wait_ms': max_wait_ms,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+        'throughput_rps': len(latencies) / wall if wall > 0 else 0.0,
+        'avg_batch_size': stats['avg_batch_size']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='微批调度器基准测试')
+    parser.add_argument('--model', '-m', default='best.pt', help='模型文件路径 (默认: best.pt)')
+    parser.add_argument('--image', '-i', default='augmented_1.jpg', help='测试图片 (默认: augmented_1.jpg)')
+    parser.add_argument('--batch-sizes', default='1,2,4,8,16', help='要比较的最大批大小，逗号分隔')
+    parser.add_argument('--max-wait-ms', type=float, default=15.0, help='凑批最长等待时间 (默认: 15ms)')
+    parser.add_argument('--concurrency', type=int, default=16, help='并发请求线程数 (默认: 16)')
+    parser.add_argument('--requests', type=int, default=200, help='每轮请求总数 (默认: 200)')
+    parser.add_argument('--conf', type=float, default=0.1, help='置信度阈值 (默认: 0.1)')
+    parser.add_argument('--device', default='cpu', help='推理设备 (默认: cpu)')
+    parser.add_argument('--output', '-o', help='将结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    image = cv2.imread(args.image)
+    if image is None:
+        print(f"无法读取图片: {args.image}", file=sys.stderr)
+        sys.exit(1)
+
+    # 先加载并预热模型，避免第一轮承担加载开销
+    registry.warmup(args.model, args.device)
+
+    results = []
+    print(f"{'batch':>6} {'p50(ms)':>10} {'p99(ms)':>10} {'rps':>8} {'avg_batch':>10}")
+    for batch_size in [int(x) for x in args.batch_sizes.split(',') if x.strip()]:
+        result = run_case(image, args.model, batch_size, args.max_wait_ms,
+                          args.concurrency, args.requests, args.conf, args.device)
+        results.append(result)
+        print(f"{result['max_batch_size']:>6} {result['p50_ms']:>10.1f} {result['p99_ms']:>10.1f} "
+              f"{result['throughput_rps']:>8.2f} {result['avg_batch_size']:>10.2f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上传图片解码 / 前处理基准测试
+比较全分辨率解码 + letterbox（原流程）与降采样解码 + 复用缓冲区 letterbox（preprocess.py）
+在不同照片尺寸下的单张耗时和峰值内存；每种方式在独立子进程中运行，峰值内存互不影响
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+
+MODES = ('full', 'reduced')
+# 只读取文件、不解码，作为峰值内存的基准
+BASELINE_MODE = 'none'
+
+
+def peak_rss_mb() -> float:
+    from metrics import peak_rss_bytes
+    return peak_rss_bytes() / (1024.0 * 1024.0)
+
+
+def run_child(mode: str, image_path: str, size: int, iterations: int):
+    """子进程：按指定方式处理同一张图片 iterations 次，以 JSON 输出耗时和峰值内存"""
+    import numpy as np
+    from backends import letterbox
+    from preprocess import prepare_image, thread_buffers
+
+    with open(image_path, 'rb') as f:
+        data = f.read()
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        if mode == BASELINE_MODE:
+            pass
+        elif mode == 'full':
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            letterbox(image, size, auto=True)
+        else:
+            prepare_image(data, size, thread_buffers.get(size))
+        latencies.append((time.perf_counter() - start) * 1000.0)
+
+    latencies.sort()
+    print(json.dumps({
+        'mode': mode,
+        'p50_ms': latencies[len(latencies) // 2],
+        'min_ms': latencies[0],
+        'peak_rss_mb': peak_rss_mb()
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='上传图片解码 / 前处理基准测试')
+    parser.add_argument('--resolutions', default='1280x960,1920x1440,4032x3024,6000x4000',
+                        help='照片分辨率，逗号分隔 (默认: 1280x960,1920x1440,4032x3024,6000x4000)')
+    parser.add_argument('--size', type=int, default=640, help='模型输入尺寸 (默认: 640)')
+    parser.add_argument('--iterations', type=int, default=20, help='每种方式的处理次数 (默认: 20)')
+    parser.add_argument('--quality', type=int, default=92, help='JPEG 质量 (默认: 92)')
+    parser.add_argument('--output', '-o', help='将结果写入 JSON 文件')
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'IMAGE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], args.child[1], args.size, args.iterations)
+        return
+
+    from run_benchmarks import make_tile_image, parse_resolutions
+    import tempfile
+
+    results = []
+    for width, height in parse_resolutions(args.resolutions):
+        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as f:
+            image_path = f.name
+        try:
+            cv2.imwrite(image_path, make_tile_image(width, height), [cv2.IMWRITE_JPEG_QUALITY, args.quality])
+            file_kb = os.path.getsize(image_path) / 1024.0
+            baseline_rss = None
+            for mode in (BASELINE_MODE,) + MODES:
+                output = subprocess.check_output([
+                    sys.executable, os.path.abspath(__file__), '--child', mode, image_path,
+                    '--size', str(args.size), '--iterations', str(args.iterations)
+                ], cwd=ROOT)
+                result = json.loads(output.decode().strip().splitlines()[-1])
+                if mode == BASELINE_MODE:
+                    baseline_rss = result['peak_rss_mb']
+                    continue
+                result['peak_rss_delta_mb'] = result['peak_rss_mb'] - baseline_rss
+                result.update({'resolution': f'{width}x{height}', 'file_kb': file_kb})
+                results.append(result)
+        finally:
+            os.remove(image_path)
+
+    print(f"{'分辨率':>12} {'方式':>8} {'p50(ms)':>10} {'峰值内存增量(MB)':>18}")
+    for result in results:
+        print(f"{result['resolution']:>12} {result['mode']:>8} {result['p50_ms']:>10.2f} "
+              f"{result['peak_rss_delta_mb']:>18.1f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
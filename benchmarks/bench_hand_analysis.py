@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+手牌分析基准测试
+测量向听数查找表的构建 / 加载耗时、单手牌分析延迟（向听数、听牌、打牌候选）
+和批量计算吞吐量（默认 200 万手随机手牌），并检查批量结果与逐手计算一致
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from hand_analysis import NUM_TILES, HandAnalyzer, HandTables
+from run_benchmarks import latency_stats
+
+
+def random_hands(count: int, size: int, seed: int = 0, chunk: int = 100000):
+    """从 136 张牌中随机抽 size 张，按块生成 (N, 34) 计数数组"""
+    rng = np.random.default_rng(seed)
+    for start in range(0, count, chunk):
+        n = min(chunk, count - start)
+        tiles = np.argsort(rng.random((n, NUM_TILES * 4)), axis=1)[:, :size] // 4
+        rows = np.repeat(np.arange(n), size)
+        counts = np.bincount(rows * NUM_TILES + tiles.ravel(), minlength=n * NUM_TILES)
+        yield counts.reshape(n, NUM_TILES)
+
+
+def time_per_hand(func, hands: list) -> dict:
+    latencies = []
+    for counts in hands:
+        start = time.perf_counter()
+        func(counts)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    stats = latency_stats(latencies)
+    return {
+        'hands': len(hands),
+        'mean_us': stats['mean_ms'] * 1000.0,
+        'p50_us': stats['p50_ms'] * 1000.0,
+        'p99_us': stats['p99_ms'] * 1000.0
+    }
+
+
+def bench_tables() -> tuple:
+    with tempfile.TemporaryDirectory() as table_dir:
+        start = time.perf_counter()
+        tables = HandTables.load_or_build(table_dir)
+        build_s = time.perf_counter() - start
+        start = time.perf_counter()
+        HandTables.load_or_build(table_dir)
+        load_s = time.perf_counter() - start
+    return tables, {'build_s': build_s, 'load_ms': load_s * 1000.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='手牌分析（向听数 / 听牌）基准测试')
+    parser.add_argument('--hands', type=int, default=2000000, help='批量计算的随机手牌数 (默认: 2000000)')
+    parser.add_argument('--single', type=int, default=20000, help='逐手计算向听数的手牌数 (默认: 20000)')
+    parser.add_argument('--analyze', type=int, default=2000, help='完整分析（听牌 / 打牌候选）的手牌数 (默认: 2000)')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子 (默认: 0)')
+    parser.add_argument('--output', '-o', help='将结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    tables, table_results = bench_tables()
+    analyzer = HandAnalyzer(tables)
+    print(f"查找表: 构建 {table_results['build_s']:.2f}s，从缓存加载 {table_results['load_ms']:.1f}ms")
+
+    results = {'tables': table_results}
+    for size in (13, 14):
+        hands = next(random_hands(max(args.single, args.analyze), size, seed=args.seed + size))
+        single = [row.tolist() for row in hands[:args.single]]
+
+        # 批量结果与逐手结果必须一致
+        expected = analyzer.shanten_batch(hands[:args.single])
+        mismatches = sum(1 for counts, value in zip(single, expected.tolist())
+                         if analyzer.shanten(counts)['shanten'] != value)
+
+        shanten = time_per_hand(analyzer.shanten, single)
+        analyze = time_per_hand(analyzer.analyze, single[:args.analyze])
+
+        distribution = np.zeros(9, dtype=np.int64)
+        elapsed = 0.0
+        for chunk in random_hands(args.hands, size, seed=args.seed + size + 1):
+            # 只统计计算耗时，不含随机手牌生成
+            start = time.perf_counter()
+            values = analyzer.shanten_batch(chunk)
+            elapsed += time.perf_counter() - start
+            distribution += np.bincount(values + 1, minlength=9)[:9]
+
+        results[f'{size}_tiles'] = {
+            'shanten': shanten,
+            'analyze': analyze,
+            'batch': {
+                'hands': args.hands,
+                'elapsed_s': elapsed,
+                'hands_per_s': args.hands / elapsed if elapsed else 0.0
+            },
+            'shanten_distribution': {str(i - 1): int(n) for i, n in enumerate(distribution) if n},
+            'mismatches': mismatches
+        }
+        print(f"\n{size} 张手牌")
+        print(f"  向听数:   p50 {shanten['p50_us']:.1f}us  p99 {shanten['p99_us']:.1f}us")
+        print(f"  完整分析: p50 {analyze['p50_us']:.1f}us  p99 {analyze['p99_us']:.1f}us")
+        print(f"  批量:     {args.hands} 手 {elapsed:.2f}s（{args.hands / elapsed:,.0f} 手/秒）")
+        print(f"  向听数分布: {results[f'{size}_tiles']['shanten_distribution']}")
+        if mismatches:
+            print(f"  批量结果与逐手结果不一致: {mismatches} 手", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.output}")
+
+    if any(results[f'{size}_tiles']['mismatches'] for size in (13, 14)):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
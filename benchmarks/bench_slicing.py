@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+切片推理基准测试
+比较整图推理与切片推理的延迟和检出率（IoU >= 0.5 的召回率 / 精确率）
+
+默认使用合成的整桌照片（多排小牌，只比较位置、不区分类别）；
+指定 --dataset 时使用 YOLO 格式的标注数据集（images/ 与 labels/ 目录），按类别匹配
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+import config
+from accuracy import load_yolo_dataset
+from export_model import match_boxes
+from mahjong_predictor import predict_mahjong
+from run_benchmarks import make_tile_image, parse_resolutions, percentile
+
+
+def synthetic_samples(resolutions: list, tiles: int, per_row: int) -> list:
+    samples = []
+    for i, (width, height) in enumerate(resolutions):
+        image, boxes = make_tile_image(width, height, tiles=tiles, seed=i, per_row=per_row, return_boxes=True)
+        truth = np.zeros((len(boxes), 6), dtype=np.float32)
+        truth[:, :4] = boxes
+        truth[:, 4] = 1.0
+        samples.append((f'{width}x{height}', image, truth))
+    return samples
+
+
+def detections_array(result: list) -> np.ndarray:
+    detections = result[0]['detections'] if result else []
+    return np.asarray([
+        [d['bbox']['x1'], d['bbox']['y1'], d['bbox']['x2'], d['bbox']['y2'], d['confidence'], d['class_id']]
+        for d in detections
+    ], dtype=np.float32).reshape(-1, 6)
+
+
+def run_mode(samples: list, model_path: str, mode: str, conf: float, iterations: int, class_aware: bool) -> dict:
+    latencies = []
+    matched = truth_total = predicted_total = 0
+    for name, image, truth in samples:
+        # 预热（切片模式下批大小与整图不同，需要单独预热）
+        predict_mahjong(image, model_path=model_path, conf_threshold=conf, device=config.MODEL_DEVICE,
+                        slicing=mode)
+        for _ in range(iterations):
+            start = time.perf_counter()
+            result = predict_mahjong(image, model_path=model_path, conf_threshold=conf,
+                                     device=config.MODEL_DEVICE, slicing=mode)
+            latencies.append((time.perf_counter() - start) * 1000.0)
+
+        predicted = detections_array(result)
+        if not class_aware:
+            predicted[:, 5] = 0
+            truth = truth.copy()
+            truth[:, 5] = 0
+        match = match_boxes(truth, predicted, 0.5)
+        matched += match['matched']
+        truth_total += len(truth)
+        predicted_total += len(predicted)
+
+    recall = matched / truth_total if truth_total else 0.0
+    precision = matched / predicted_total if predicted_total else 0.0
+    return {
+        'mode': mode,
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+        'ground_truth': truth_total,
+        'detections': predicted_total,
+        'matched': matched,
+        'recall': recall,
+        'precision': precision,
+        'f1': 2 * recall * precision / (recall + precision) if recall + precision else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='整图推理与切片推理对比')
+    parser.add_argument('--model', '-m', default=config.MODEL_PATH, help='模型文件路径')
+    parser.add_argument('--dataset', help='YOLO 格式数据集目录（包含 images/ 和 labels/），不指定时使用合成图片')
+    parser.add_argument('--limit', type=int, default=0, help='最多使用的数据集图片数，0 表示全部')
+    parser.add_argument('--resolutions', default='3024x2268,4032x3024', help='合成图片分辨率 (默认: 3024x2268,4032x3024)')
+    parser.add_argument('--tiles', type=int, default=144, help='合成图片中的牌数 (默认: 144)')
+    parser.add_argument('--per-row', type=int, default=24, help='合成图片每排牌数 (默认: 24)')
+    parser.add_argument('--conf', type=float, default=config.CONF_THRESHOLD, help='置信度阈值')
+    parser.add_argument('--iterations', type=int, default=3, help='每张图片的计时次数 (默认: 3)')
+    parser.add_argument('--output', '-o', help='将结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    if args.dataset:
+        samples = load_yolo_dataset(args.dataset, args.limit)
+    else:
+        samples = synthetic_samples(parse_resolutions(args.resolutions), args.tiles, args.per_row)
+    if not samples:
+        print("没有可用的图片", file=sys.stderr)
+        sys.exit(1)
+
+    class_aware = bool(args.dataset)
+    results = [
+        run_mode(samples, args.model, mode, args.conf, args.iterations, class_aware)
+        for mode in ('off', 'on')
+    ]
+
+    print(f"\n{'模式':>6} {'p50(ms)':>10} {'p99(ms)':>10} {'召回率':>8} {'精确率':>8} {'F1':>8}")
+    for result in results:
+        label = '整图' if result['mode'] == 'off' else '切片'
+        print(f"{label:>6} {result['p50_ms']:>10.1f} {result['p99_ms']:>10.1f} "
+              f"{result['recall']:>8.3f} {result['precision']:>8.3f} {result['f1']:>8.3f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'dataset': args.dataset or 'synthetic',
+                'images': len(samples),
+                'slice_size': config.SLICE_SIZE,
+                'slice_overlap': config.SLICE_OVERLAP,
+                'results': results
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
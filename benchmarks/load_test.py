@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+/predict_image 压测脚本
+按不同工作进程数启动 gunicorn 服务并发送并发请求，
+统计吞吐量和 p50/p99 延迟，观察吞吐量随工作进程数的变化
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def build_multipart(image_bytes: bytes, filename: str) -> tuple:
+    """构造 multipart/form-data 请求体"""
+    boundary = uuid.uuid4().hex
+    body = b''.join([
+        f'--{boundary}\r\n'.encode(),
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'.encode(),
+        b'Content-Type: application/octet-stream\r\n\r\n',
+        image_bytes,
+        f'\r\n--{boundary}--\r\n'.encode()
+    ])
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def run_load(url: str, image_bytes: bytes, filename: str, concurrency: int, requests: int,
+             bust_cache: bool = True, timeout: float = 300) -> dict:
+    """以固定并发度发送请求，返回吞吐量和延迟统计"""
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            payload = image_bytes
+            if bust_cache:
+                # JPEG 解码会忽略 EOI 之后的数据，追加随机字节使每次请求的内容哈希不同，绕过结果缓存
+                payload = image_bytes + uuid.uuid4().bytes
+            body, content_type = build_multipart(payload, filename)
+            req = urllib.request.Request(url, data=body, headers={'Content-Type': content_type})
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req, timeout=timeout) as resp:
+                    resp.read()
+                elapsed = (time.perf_counter() - start) * 1000.0
+                with lock:
+                    latencies.append(elapsed)
+            except (urllib.error.URLError, OSError) as e:
+                with lock:
+                    errors.append(str(e))
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'succeeded': len(latencies),
+        'errors': len(errors),
+        'p50_ms': percentile(latencies, 50),
+        'p99_ms': percentile(latencies, 99),
+        'throughput_rps': len(latencies) / wall if wall > 0 else 0.0
+    }
+
+
+def wait_ready(base_url: str, timeout: float) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            # 工作进程在后台预热，/readyz 返回 200 表示已完成首次推理
+            with urllib.request.urlopen(f"{base_url}/readyz", timeout=2) as resp:
+                if resp.status == 200:
+                    return True
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def start_server(workers: int, port: int, extra_env: dict) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update(extra_env)
+    env['MAHJONG_WORKERS'] = str(workers)
+    env['MAHJONG_BIND'] = f'127.0.0.1:{port}'
+    # 压测的是推理吞吐量，关闭结果缓存
+    env['MAHJONG_RESULT_CACHE'] = '0'
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'manage:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='/predict_image 压测')
+    parser.add_argument('--url', help='压测已运行的服务（如 http://127.0.0.1:8080），不指定时自动按 --workers 启动 gunicorn')
+    parser.add_argument('--workers', default='1,2,4', help='要比较的工作进程数，逗号分隔 (默认: 1,2,4)')
+    parser.add_argument('--port', type=int, default=18080, help='自动启动服务时使用的端口 (默认: 18080)')
+    parser.add_argument('--image', '-i', default=os.path.join(ROOT, 'augmented_1.jpg'), help='测试图片')
+    parser.add_argument('--concurrency', type=int, default=16, help='并发请求数 (默认: 16)')
+    parser.add_argument('--requests', type=int, default=200, help='每轮请求总数 (默认: 200)')
+    parser.add_argument('--startup-timeout', type=float, default=120, help='等待服务启动的超时时间（秒）')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='传给服务进程的额外环境变量，可重复')
+    parser.add_argument('--output', '-o', help='将结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    with open(args.image, 'rb') as f:
+        image_bytes = f.read()
+    filename = os.path.basename(args.image)
+    extra_env = dict(item.split('=', 1) for item in args.env)
+
+    results = []
+    if args.url:
+        result = run_load(f"{args.url.rstrip('/')}/predict_image", image_bytes, filename,
+                          args.concurrency, args.requests)
+        result['url'] = args.url
+        results.append(result)
+    else:
+        base_url = f'http://127.0.0.1:{args.port}'
+        for workers in [int(x) for x in args.workers.split(',') if x.strip()]:
+            server = start_server(workers, args.port, extra_env)
+            try:
+                if not wait_ready(base_url, args.startup_timeout):
+                    print(f"workers={workers}: 服务启动超时", file=sys.stderr)
+                    continue
+                # 预热每个工作进程
+                run_load(f"{base_url}/predict_image", image_bytes, filename, workers * 2, workers * 4)
+                result = run_load(f"{base_url}/predict_image", image_bytes, filename,
+                                  args.concurrency, args.requests)
+                result['workers'] = workers
+                results.append(result)
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+    print(f"{'workers':>8} {'rps':>8} {'p50(ms)':>10} {'p99(ms)':>10} {'errors':>7}")
+    for result in results:
+        print(f"{result.get('workers', '-'):>8} {result['throughput_rps']:>8.2f} "
+              f"{result['p50_ms']:>10.1f} {result['p99_ms']:>10.1f} {result['errors']:>7}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动耗时分析
+1. 导入耗时：在新进程中用 python -X importtime 依次导入 HTTP 绑定前的模块（init）、
+   后台导入的推理模块和 torch 后端加载模型时导入的 ultralytics，按阶段列出最耗时的模块
+2. 冷启动：多次启动服务进程，测量到 /healthz 可访问（HTTP 绑定）和 /readyz 就绪（首次推理完成）的时间，
+   以及服务报告的各启动阶段耗时；就绪时间的中位数超过目标时以退出码 1 结束
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import config
+from startup import PHASES
+
+# 导入耗时的分析阶段：(阶段名, 说明, 导入语句)
+IMPORT_STAGES = (
+    ('bind', 'HTTP 绑定前（创建应用）', 'import init'),
+    ('background', '后台导入的推理模块', 'import predict, streaming, hand_analysis, model_registry'),
+    ('model', 'torch 后端加载模型时导入', 'import ultralytics'),
+)
+_STAGE_MARKER = '@@stage '
+
+
+def profile_imports() -> dict:
+    """
+    在新进程中按阶段导入并解析 -X importtime 的输出
+
+    Returns:
+        {阶段名: {'total_ms', 'top_level': [(前两层模块, 累计 ms)], 'top_self': [(模块, 自身 ms)]}}，
+        interpreter 阶段为解释器启动时的导入
+    """
+    lines = ['import sys']
+    for name, _, statement in IMPORT_STAGES:
+        lines.append(f"sys.stderr.write('{_STAGE_MARKER}{name}\\n')")
+        # 可选依赖未安装时跳过该阶段
+        lines.append(f"try:\n    {statement}\nexcept ImportError:\n    pass")
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', '\n'.join(lines)],
+                            cwd=ROOT, capture_output=True, text=True)
+
+    stages = {'interpreter': []}
+    current = stages['interpreter']
+    for line in result.stderr.splitlines():
+        if line.startswith(_STAGE_MARKER):
+            current = stages.setdefault(line[len(_STAGE_MARKER):], [])
+            continue
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        # 格式: "import time: 自身[us] | 累计[us] | 模块名"，模块名前的缩进表示嵌套深度
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        current.append((name.strip(), depth, int(self_us) / 1000.0, int(cumulative_us) / 1000.0))
+
+    report = {}
+    for name, entries in stages.items():
+        # 直接导入的模块及其下一层（如 init 导入的 flask、各路由模块）
+        top_level = sorted(((m, c) for m, d, _, c in entries if d <= 1), key=lambda x: -x[1])
+        report[name] = {
+            'total_ms': sum(c for _, d, _, c in entries if d == 0),
+            'top_level': top_level[:10],
+            'top_self': sorted(((m, s) for m, _, s, _ in entries), key=lambda x: -x[1])[:10]
+        }
+    return report
+
+
+def get_json(url: str, timeout: float = 2.0):
+    """GET 请求，返回 (状态码, JSON)，连接失败时返回 (None, None)"""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b'null')
+    except (urllib.error.URLError, OSError, ValueError):
+        return None, None
+
+
+def start_server(server: str, port: int, extra_env: dict) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update(extra_env)
+    if server == 'gunicorn':
+        env.setdefault('MAHJONG_WORKERS', '1')
+        env['MAHJONG_BIND'] = f'127.0.0.1:{port}'
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'manage:app']
+    else:
+        command = [sys.executable, '-c',
+                   f"from init import create_app; create_app().run(host='127.0.0.1', port={port}, threaded=True)"]
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def measure_cold_start(server: str, port: int, extra_env: dict, timeout: float) -> dict:
+    """启动一次服务，测量到 HTTP 可访问和就绪的时间（秒）"""
+    base_url = f'http://127.0.0.1:{port}'
+    start = time.perf_counter()
+    process = start_server(server, port, extra_env)
+    result = {'healthz_seconds': None, 'ready_seconds': None, 'phases': {}}
+    try:
+        deadline = start + timeout
+        while time.perf_counter() < deadline and process.poll() is None:
+            if result['healthz_seconds'] is None:
+                status, _ = get_json(f'{base_url}/healthz')
+                if status == 200:
+                    result['healthz_seconds'] = time.perf_counter() - start
+            else:
+                status, body = get_json(f'{base_url}/readyz')
+                if status == 200:
+                    result['ready_seconds'] = time.perf_counter() - start
+                    result['phases'] = body.get('phases', {})
+                    break
+                if body and body.get('status') == 'failed':
+                    result['error'] = body.get('error')
+                    break
+            time.sleep(0.02)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='启动耗时分析（导入耗时 + 冷启动到就绪时间）')
+    parser.add_argument('--server', choices=['gunicorn', 'flask'], default='gunicorn',
+                        help='启动方式：gunicorn（生产环境，默认 1 个工作进程）或 Flask 开发服务器 (默认: gunicorn)')
+    parser.add_argument('--runs', type=int, default=3, help='冷启动测量次数 (默认: 3)')
+    parser.add_argument('--port', type=int, default=18081, help='服务端口 (默认: 18081)')
+    parser.add_argument('--target', type=float, default=config.STARTUP_TARGET_SECONDS,
+                        help=f'冷启动到就绪的目标时间（秒）(默认: {config.STARTUP_TARGET_SECONDS})')
+    parser.add_argument('--timeout', type=float, default=120, help='单次启动的超时时间（秒）(默认: 120)')
+    parser.add_argument('--skip-imports', action='store_true', help='不分析导入耗时')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='传给服务进程的额外环境变量，可重复')
+    parser.add_argument('--output', '-o', help='将结果写入 JSON 文件')
+    args = parser.parse_args()
+    extra_env = dict(item.split('=', 1) for item in args.env)
+
+    report = {'target_seconds': args.target}
+    if not args.skip_imports:
+        imports = profile_imports()
+        report['imports'] = imports
+        descriptions = {name: description for name, description, _ in IMPORT_STAGES}
+        descriptions['interpreter'] = '解释器启动'
+        for name, stage in imports.items():
+            print(f"\n[{descriptions.get(name, name)}] 导入耗时 {stage['total_ms']:.0f} ms")
+            for module, ms in stage['top_level'][:6]:
+                print(f"  {module:<40} {ms:>8.1f} ms (累计)")
+            for module, ms in stage['top_self'][:5]:
+                print(f"  {module:<40} {ms:>8.1f} ms (自身)")
+
+    runs = []
+    for i in range(args.runs):
+        result = measure_cold_start(args.server, args.port, extra_env, args.timeout)
+        runs.append(result)
+        healthz = f"{result['healthz_seconds']:.2f}s" if result['healthz_seconds'] is not None else '超时'
+        ready = f"{result['ready_seconds']:.2f}s" if result['ready_seconds'] is not None else '未就绪'
+        phases = ', '.join(f"{name} {result['phases'][name]:.2f}s" for name in PHASES if name in result['phases'])
+        print(f"\n第 {i + 1} 次冷启动: /healthz {healthz}  /readyz {ready}  {phases}")
+        if result.get('error'):
+            print(f"  启动失败: {result['error']}")
+    report['cold_starts'] = runs
+
+    ready_times = sorted(r['ready_seconds'] for r in runs if r['ready_seconds'] is not None)
+    median = ready_times[len(ready_times) // 2] if ready_times else None
+    report['ready_seconds_median'] = median
+    report['passed'] = median is not None and len(ready_times) == len(runs) and median <= args.target
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.output}")
+
+    if median is None:
+        print("\n服务未能就绪", file=sys.stderr)
+        sys.exit(1)
+    print(f"\n冷启动到就绪（中位数）: {median:.2f}s，目标 {args.target}s")
+    if not report['passed']:
+        print("超过目标时间", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
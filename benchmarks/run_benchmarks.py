@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+识别流程基准测试
+用合成的麻将牌图片（多种分辨率）离线测量：
+冷启动耗时、单张图片热推理延迟、批量吞吐量、Flask 接口延迟和峰值内存，
+结果写入 JSON，可与保存的基线比较以发现性能回退
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cv2
+import numpy as np
+
+DEFAULT_RESOLUTIONS = '640x480,1280x720,1920x1080,4032x3024'
+TILE_COLORS = ((40, 40, 200), (40, 140, 40), (160, 60, 20), (20, 20, 20))
+
+
+def parse_resolutions(value: str) -> list:
+    resolutions = []
+    for item in value.split(','):
+        if item.strip():
+            width, height = item.lower().split('x')
+            resolutions.append((int(width), int(height)))
+    return resolutions
+
+
+def make_tile_image(width: int, height: int, tiles: int = 14, seed: int = 0, per_row: int = 14,
+                    return_boxes: bool = False):
+    """
+    生成合成的麻将牌图片：绿色桌面上一排（或多排）白色牌面，牌面上画随机的圆点、竖条和字形笔画
+
+    同样的参数总是生成同样的图片，保证不同版本之间的结果可比；
+    return_boxes 为 True 时同时返回每张牌的 (x1, y1, x2, y2) 数组
+    """
+    rng = np.random.RandomState(seed)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = (60, 110, 30)
+    image = cv2.add(image, rng.randint(0, 12, size=image.shape, dtype=np.uint8))
+
+    per_row = min(tiles, per_row)
+    rows = (tiles + per_row - 1) // per_row
+    tile_w = int(width * 0.9 / per_row)
+    tile_h = min(int(tile_w * 1.35), int(height * 0.8 / rows))
+    tile_w = int(tile_h / 1.35)
+    x0 = (width - tile_w * per_row) // 2
+    y0 = (height - tile_h * rows) // 2
+
+    boxes = []
+    for index in range(tiles):
+        row, col = divmod(index, per_row)
+        x1, y1 = x0 + col * tile_w, y0 + row * tile_h
+        x2, y2 = x1 + tile_w - 2, y1 + tile_h - 2
+        boxes.append((x1, y1, x2, y2))
+        cv2.rectangle(image, (x1, y1), (x2, y2), (235, 240, 240), -1)
+        cv2.rectangle(image, (x1, y1), (x2, y2), (150, 160, 160), max(1, tile_w // 40))
+        color = TILE_COLORS[rng.randint(len(TILE_COLORS))]
+        kind = rng.randint(3)
+        count = rng.randint(1, 10)
+        for _ in range(count):
+            cx = rng.randint(x1 + tile_w // 5, x2 - tile_w // 5 + 1)
+            cy = rng.randint(y1 + tile_h // 6, y2 - tile_h // 6 + 1)
+            if kind == 0:
+                cv2.circle(image, (cx, cy), max(2, tile_w // 9), color, -1)
+            elif kind == 1:
+                cv2.line(image, (cx, cy - tile_h // 8), (cx, cy + tile_h // 8), color, max(1, tile_w // 12))
+            else:
+                cv2.line(image, (cx - tile_w // 6, cy), (cx + tile_w // 6, cy), color, max(1, tile_w // 15))
+    if return_boxes:
+        return image, np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    return image
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def latency_stats(latencies_ms: list) -> dict:
+    return {
+        'mean_ms': sum(latencies_ms) / len(latencies_ms) if latencies_ms else 0.0,
+        'p50_ms': percentile(latencies_ms, 50),
+        'p90_ms': percentile(latencies_ms, 90),
+        'p99_ms': percentile(latencies_ms, 99)
+    }
+
+
+def peak_rss_mb() -> float:
+    """本进程峰值常驻内存（MB）"""
+    from metrics import peak_rss_bytes
+    return peak_rss_bytes() / (1024.0 * 1024.0)
+
+
+def environment_info() -> dict:
+    import config
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'backend': config.BACKEND,
+        'device': config.MODEL_DEVICE,
+        'imgsz': config.INFER_IMGSZ,
+        'conf_threshold': config.CONF_THRESHOLD,
+        'thread_env': {k: os.environ.get(k) for k in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS')}
+    }
+    try:
+        import torch
+        info['torch'] = torch.__version__
+        info['torch_threads'] = torch.get_num_threads()
+    except ImportError:
+        pass
+    try:
+        info['git_commit'] = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        info['git_commit'] = None
+    return info
+
+
+def cold_start_child(image_path: str, model_path: str):
+    """子进程：测量导入、首次识别（含模型加载）耗时，以 JSON 输出到 stdout"""
+    start = time.perf_counter()
+    from mahjong_predictor import predict_mahjong
+    import config
+    imported = time.perf_counter()
+    results = predict_mahjong(image_path, model_path=model_path, conf_threshold=config.CONF_THRESHOLD,
+                              device=config.MODEL_DEVICE)
+    first = time.perf_counter()
+    predict_mahjong(image_path, model_path=model_path, conf_threshold=config.CONF_THRESHOLD,
+                    device=config.MODEL_DEVICE)
+    second = time.perf_counter()
+    print(json.dumps({
+        'import_s': imported - start,
+        'first_predict_s': first - imported,
+        'second_predict_s': second - first,
+        'detections': results[0]['total_detections'] if results else 0,
+        'peak_rss_mb': peak_rss_mb()
+    }))
+
+
+def bench_cold_start(image_path: str, model_path: str, runs: int) -> dict:
+    """在新进程中测量冷启动，取多次中的中位数"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), '--cold-start-child', image_path, '--model', model_path],
+            cwd=ROOT, stderr=subprocess.DEVNULL
+        )
+        wall = time.perf_counter() - start
+        sample = json.loads(output.decode().strip().splitlines()[-1])
+        sample['process_wall_s'] = wall
+        samples.append(sample)
+
+    keys = ('import_s', 'first_predict_s', 'second_predict_s', 'process_wall_s', 'peak_rss_mb')
+    return dict({key: percentile([s[key] for s in samples], 50) for key in keys}, runs=runs)
+
+
+def bench_warm_latency(images: dict, model_path: str, iterations: int) -> dict:
+    """单张图片热推理延迟（直接调用 predict_mahjong，不经过微批调度器）"""
+    import config
+    from mahjong_predictor import predict_mahjong
+
+    results = {}
+    for name, image in images.items():
+        predict_mahjong(image, model_path=model_path, conf_threshold=config.CONF_THRESHOLD,
+                        device=config.MODEL_DEVICE)
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            predict_mahjong(image, model_path=model_path, conf_threshold=config.CONF_THRESHOLD,
+                            device=config.MODEL_DEVICE)
+            latencies.append((time.perf_counter() - start) * 1000.0)
+        results[name] = latency_stats(latencies)
+    return results
+
+
+def bench_throughput(image: np.ndarray, model_path: str, batch_sizes: list, total: int) -> dict:
+    """不同批大小下的批量推理吞吐量"""
+    import config
+    from mahjong_predictor import predict_many
+
+    results = {}
+    images = [image] * total
+    for batch_size in batch_sizes:
+        predict_many(images[:batch_size], model_path, config.CONF_THRESHOLD, config.MODEL_DEVICE,
+                     batch_size=batch_size)
+        start = time.perf_counter()
+        predict_many(images, model_path, config.CONF_THRESHOLD, config.MODEL_DEVICE, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        results[f'batch_{batch_size}'] = {
+            'images': total,
+            'elapsed_s': elapsed,
+            'throughput_ips': total / elapsed if elapsed > 0 else 0.0
+        }
+    return results
+
+
+def bench_flask(images: dict, iterations: int) -> dict:
+    """通过 Flask 测试客户端测量 /predict_image 延迟（关闭结果缓存）"""
+    import io
+    import config
+    from init import create_app
+
+    config.RESULT_CACHE_ENABLED = False
+    config.MODEL_WARMUP = False
+    app = create_app()
+    client = app.test_client()
+
+    results = {}
+    for name, image in images.items():
+        ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        data = buffer.tobytes()
+        latencies = []
+        status = None
+        for i in range(iterations + 1):
+            start = time.perf_counter()
+            response = client.post('/predict_image', data={'file': (io.BytesIO(data), f'{name}.jpg')},
+                                   content_type='multipart/form-data')
+            elapsed = (time.perf_counter() - start) * 1000.0
+            status = response.status_code
+            if i > 0:
+                latencies.append(elapsed)
+        results[name] = dict(latency_stats(latencies), status=status, upload_kb=len(data) / 1024.0)
+    return results
+
+
+def flatten(results: dict, prefix: str = '') -> dict:
+    flat = {}
+    for key, value in results.items():
+        path = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def metric_direction(path: str) -> int:
+    """1 表示越大越好，-1 表示越小越好，0 表示不参与比较"""
+    if path.endswith('_ips'):
+        return 1
+    if path.endswith(('_ms', '_s', '_mb')) and not path.endswith('elapsed_s'):
+        return -1
+    return 0
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """返回超出容差的指标列表 [(指标, 基线值, 当前值, 变化比例)]"""
+    current = flatten(results.get('benchmarks', {}))
+    previous = flatten(baseline.get('benchmarks', {}))
+    regressions = []
+    for path, value in sorted(current.items()):
+        direction = metric_direction(path)
+        base = previous.get(path)
+        if direction == 0 or not base:
+            continue
+        change = (value - base) / base
+        if -direction * change > tolerance:
+            regressions.append((path, base, value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='识别流程基准测试')
+    parser.add_argument('--model', '-m', default=None, help='模型文件路径，默认取 MAHJONG_MODEL_PATH')
+    parser.add_argument('--resolutions', default=DEFAULT_RESOLUTIONS,
+                        help=f'合成图片分辨率，逗号分隔 (默认: {DEFAULT_RESOLUTIONS})')
+    parser.add_argument('--tiles', type=int, default=14, help='每张图片的牌数 (默认: 14)')
+    parser.add_argument('--iterations', type=int, default=20, help='每个分辨率的热推理次数 (默认: 20)')
+    parser.add_argument('--batch-sizes', default='1,4,8', help='吞吐量测试的批大小 (默认: 1,4,8)')
+    parser.add_argument('--throughput-images', type=int, default=32, help='吞吐量测试的图片数 (默认: 32)')
+    parser.add_argument('--cold-start-runs', type=int, default=3, help='冷启动测试次数，0 表示跳过 (默认: 3)')
+    parser.add_argument('--skip-flask', action='store_true', help='跳过 Flask 接口测试')
+    parser.add_argument('--output', '-o', help='将结果写入 JSON 文件')
+    parser.add_argument('--baseline', help='与基线结果 JSON 比较，出现回退时以退出码 1 结束')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='允许的性能波动比例 (默认: 0.15)')
+    parser.add_argument('--cold-start-child', metavar='IMAGE', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    import config
+    model_path = args.model or config.MODEL_PATH
+
+    if args.cold_start_child:
+        cold_start_child(args.cold_start_child, model_path)
+        return
+
+    if not os.path.exists(model_path):
+        print(f"找不到模型文件: {model_path}", file=sys.stderr)
+        sys.exit(2)
+
+    resolutions = parse_resolutions(args.resolutions)
+    images = {
+        f'{w}x{h}': make_tile_image(w, h, tiles=args.tiles, seed=i)
+        for i, (w, h) in enumerate(resolutions)
+    }
+    batch_sizes = [int(x) for x in args.batch_sizes.split(',') if x.strip()]
+    benchmarks = {}
+
+    if args.cold_start_runs > 0:
+        # 冷启动使用中间分辨率的图片
+        name, image = list(images.items())[len(images) // 2]
+        with tempfile.NamedTemporaryFile(suffix='.jpg', delete=False) as f:
+            temp_path = f.name
+        try:
+            cv2.imwrite(temp_path, image)
+            print(f"冷启动 ({name}, {args.cold_start_runs} 次)...", file=sys.stderr)
+            benchmarks['cold_start'] = bench_cold_start(temp_path, model_path, args.cold_start_runs)
+        finally:
+            os.remove(temp_path)
+
+    print("单张热推理延迟...", file=sys.stderr)
+    benchmarks['warm_latency'] = bench_warm_latency(images, model_path, args.iterations)
+
+    name, image = list(images.items())[0]
+    print(f"批量吞吐量 ({name})...", file=sys.stderr)
+    benchmarks['throughput'] = bench_throughput(image, model_path, batch_sizes, args.throughput_images)
+
+    if not args.skip_flask:
+        print("Flask /predict_image 延迟...", file=sys.stderr)
+        config.MODEL_PATH = model_path
+        benchmarks['flask'] = bench_flask(images, max(1, args.iterations // 2))
+
+    benchmarks['peak_rss_mb'] = peak_rss_mb()
+    results = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'model': os.path.abspath(model_path),
+        'environment': environment_info(),
+        'benchmarks': benchmarks
+    }
+
+    print(f"\n{'分辨率':>12} {'p50(ms)':>10} {'p99(ms)':>10}")
+    for name, stats in benchmarks['warm_latency'].items():
+        print(f"{name:>12} {stats['p50_ms']:>10.1f} {stats['p99_ms']:>10.1f}")
+    for name, stats in benchmarks['throughput'].items():
+        print(f"{name:>12} {stats['throughput_ips']:>10.2f} img/s")
+    print(f"峰值内存: {benchmarks['peak_rss_mb']:.1f} MB")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已保存到: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n相对基线的性能回退（容差 {args.tolerance:.0%}）:")
+            for path, base, value, change in regressions:
+                print(f"  {path}: {base:.3f} -> {value:.3f} ({change:+.1%})")
+            sys.exit(1)
+        print(f"\n与基线相比无性能回退（容差 {args.tolerance:.0%}）")
+
+
+if __name__ == '__main__':
+    main()
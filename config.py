@@ -0,0 +1,196 @@
+"""
+服务配置
+所有配置项均可通过环境变量覆盖，便于在不同部署环境中调整
+"""
+
+import os
+
+
+def _env_str(name: str, default: str) -> str:
+    value = os.environ.get(name)
+    return value if value not in (None, '') else default
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# 模型配置
+MODEL_PATH = _env_str('MAHJONG_MODEL_PATH', 'best.pt')
+MODEL_DEVICE = _env_str('MAHJONG_DEVICE', 'cpu')
+# 启动时是否用空白图片预热模型
+MODEL_WARMUP = _env_bool('MAHJONG_MODEL_WARMUP', True)
+# 预热图片尺寸（与训练输入尺寸一致）
+MODEL_WARMUP_SIZE = _env_int('MAHJONG_MODEL_WARMUP_SIZE', 640)
+# 后台启动：HTTP 服务先绑定（/healthz 立即可用），推理模块导入、手牌分析查找表加载和模型预热
+# 在后台线程中完成，完成首次推理后 /readyz 才返回就绪；关闭时在创建应用时同步完成
+STARTUP_BACKGROUND = _env_bool('MAHJONG_BACKGROUND_STARTUP', True)
+# 进程启动到就绪的目标时间（秒），超过时记录警告
+STARTUP_TARGET_SECONDS = _env_float('MAHJONG_STARTUP_TARGET_SECONDS', 10.0)
+
+# 微批推理配置：并发请求的图片合并为一次批量推理
+BATCH_ENABLED = _env_bool('MAHJONG_BATCH_ENABLED', True)
+BATCH_MAX_SIZE = _env_int('MAHJONG_BATCH_MAX_SIZE', 8)
+BATCH_MAX_WAIT_MS = _env_float('MAHJONG_BATCH_MAX_WAIT_MS', 15.0)
+
+# 调试模式：将上传图片写入 uploads/ 目录后再从磁盘读取识别（默认在内存中解码）
+SPOOL_UPLOADS = _env_bool('MAHJONG_SPOOL_UPLOADS', False)
+
+# 服务端前处理：JPEG 按接近模型输入的分辨率降采样解码，并 letterbox 到复用的缓冲区（边界框自动还原到原图坐标）
+PREPROCESS_ENABLED = _env_bool('MAHJONG_PREPROCESS', True)
+
+# 切片推理（整桌照片中远处的小牌）：off / on / auto（最长边不小于 MAHJONG_SLICE_AUTO_MIN_SIZE 时切片）
+SLICE_MODE = _env_str('MAHJONG_SLICE_MODE', 'off')
+# 切片边长（像素）和相邻切片的重叠比例
+SLICE_SIZE = _env_int('MAHJONG_SLICE_SIZE', 640)
+SLICE_OVERLAP = _env_float('MAHJONG_SLICE_OVERLAP', 0.25)
+SLICE_AUTO_MIN_SIZE = _env_int('MAHJONG_SLICE_AUTO_MIN_SIZE', 1600)
+# 跨切片 NMS 阈值（交集占较小框面积的比例）
+SLICE_NMS_THRESHOLD = _env_float('MAHJONG_SLICE_NMS_THRESHOLD', 0.6)
+# 每次推理的最多切片数
+SLICE_BATCH_SIZE = _env_int('MAHJONG_SLICE_BATCH_SIZE', 16)
+# 是否同时推理整张图片（保留切片中放不下的大牌）
+SLICE_INCLUDE_FULL = _env_bool('MAHJONG_SLICE_INCLUDE_FULL', True)
+
+# 布局分析：检测结果按阅读顺序排列，并附带行号（row）和组号（group_id，行内连续的一段牌）
+LAYOUT_ENABLED = _env_bool('MAHJONG_LAYOUT', True)
+# 同一行相邻两个框中心 y 的最大距离（中位牌高的比例）
+LAYOUT_ROW_TOLERANCE = _env_float('MAHJONG_LAYOUT_ROW_TOLERANCE', 0.5)
+# 同一组相邻两张牌的最大间隙（中位牌宽的比例），超过时分为不同的组（如手牌与副露）
+LAYOUT_GROUP_GAP = _env_float('MAHJONG_LAYOUT_GROUP_GAP', 0.3)
+
+# 推理后端：torch（ultralytics + PyTorch）/ onnx（ONNX Runtime）/ openvino
+# onnx / openvino 后端会将 .pt 权重导出一次并缓存在权重文件旁（文件名包含权重哈希）
+BACKEND = _env_str('MAHJONG_BACKEND', 'torch')
+INFER_IMGSZ = _env_int('MAHJONG_INFER_IMGSZ', 640)
+# 模型精度变体：fp32（默认）/ int8（使用 quantize_model.py 生成并通过精度校验的 INT8 ONNX 模型，
+# 量化模型不存在或未通过校验时回退到 fp32）
+MODEL_VARIANT = _env_str('MAHJONG_MODEL_VARIANT', 'fp32')
+# 模型清单（model_manifest.py）：多个命名模型、各自的置信度阈值和分流权重，文件不存在时只使用上面的单模型配置
+MODEL_MANIFEST = _env_str('MAHJONG_MODEL_MANIFEST', 'models.json')
+# 检查清单文件是否变化的间隔（秒），变化后自动加载新模型并切换
+MODEL_MANIFEST_POLL = _env_float('MAHJONG_MODEL_MANIFEST_POLL', 2.0)
+# 量化模型允许的最大 mAP 下降（相对 FP32 模型），超过时拒绝该量化模型
+QUANT_MAX_MAP_DROP = _env_float('MAHJONG_QUANT_MAX_MAP_DROP', 0.02)
+# ONNX Runtime / OpenVINO 线程数，0 表示使用运行时默认值
+ORT_INTRA_OP_THREADS = _env_int('MAHJONG_ORT_INTRA_OP_THREADS', 0)
+ORT_INTER_OP_THREADS = _env_int('MAHJONG_ORT_INTER_OP_THREADS', 0)
+
+# 识别置信度阈值
+CONF_THRESHOLD = _env_float('MAHJONG_CONF_THRESHOLD', 0.1)
+
+# 识别结果缓存：按图片内容哈希 + 模型版本 + 置信度阈值缓存
+RESULT_CACHE_ENABLED = _env_bool('MAHJONG_RESULT_CACHE', True)
+RESULT_CACHE_MAX_ENTRIES = _env_int('MAHJONG_RESULT_CACHE_MAX_ENTRIES', 1024)
+# 过期时间（秒），0 表示不过期
+RESULT_CACHE_TTL = _env_float('MAHJONG_RESULT_CACHE_TTL', 3600)
+# 是否启用磁盘缓存层（重启后仍然有效）
+RESULT_CACHE_DISK = _env_bool('MAHJONG_RESULT_CACHE_DISK', False)
+RESULT_CACHE_DIR = _env_str('MAHJONG_RESULT_CACHE_DIR', 'run/cache')
+
+# 识别结果图片（render.py / result_store.py，/predict_image?render=1 生成，/get_result_image 获取）
+# 绘制标签使用的 TrueType 字体路径（如文泉驿微米黑），为空时使用 OpenCV 内置字体绘制简写标签（5p、E 等）
+RENDER_FONT = _env_str('MAHJONG_RENDER_FONT', '')
+# 结果图片最长边（像素），大图先降采样再绘制，0 表示保持原图尺寸
+RENDER_MAX_SIZE = _env_int('MAHJONG_RENDER_MAX_SIZE', 1280)
+RENDER_JPEG_QUALITY = _env_int('MAHJONG_RENDER_JPEG_QUALITY', 85)
+# 结果图片存储目录，多进程部署时各工作进程共享
+RESULT_IMAGE_DIR = _env_str('MAHJONG_RESULT_IMAGE_DIR', 'run/results')
+# 结果图片总大小上限（MB），超过时淘汰最久未访问的图片，0 表示不限制
+RESULT_IMAGE_MAX_MB = _env_int('MAHJONG_RESULT_IMAGE_MAX_MB', 512)
+# 结果图片保存时间（秒），同时作为客户端缓存时间（Cache-Control max-age），0 表示不过期
+RESULT_IMAGE_TTL = _env_float('MAHJONG_RESULT_IMAGE_TTL', 86400)
+
+# 生产环境服务（gunicorn.conf.py）
+SERVE_BIND = _env_str('MAHJONG_BIND', '0.0.0.0:8080')
+# 工作进程数，0 表示按 CPU 核数自动计算
+SERVE_WORKERS = _env_int('MAHJONG_WORKERS', 0)
+# 每个工作进程处理请求的线程数（并发度）
+SERVE_THREADS = _env_int('MAHJONG_THREADS', 4)
+# 每个工作进程的推理线程数（torch / OpenMP / ONNX Runtime），0 表示 CPU 核数 / 工作进程数
+SERVE_INFER_THREADS = _env_int('MAHJONG_INFER_THREADS', 0)
+# 可用 CPU 核数，0 表示自动检测（容器 CPU 配额需要手动指定）
+SERVE_CPUS = _env_int('MAHJONG_CPUS', 0)
+# 监听队列长度
+SERVE_BACKLOG = _env_int('MAHJONG_BACKLOG', 64)
+# 请求超时（秒）
+SERVE_TIMEOUT = _env_int('MAHJONG_TIMEOUT', 120)
+# 模型预加载位置：auto（torch 后端且未启用后台启动时在主进程，否则在工作进程）/ parent / worker
+SERVE_PRELOAD_MODEL = _env_str('MAHJONG_PRELOAD_MODEL', 'auto')
+
+# 异步识别任务（/predict_jobs）
+JOBS_MAX_WORKERS = _env_int('MAHJONG_JOBS_MAX_WORKERS', 2)
+# 最多排队的任务数，超过时返回 429
+JOBS_MAX_QUEUE = _env_int('MAHJONG_JOBS_MAX_QUEUE', 32)
+# 任务完成后结果保留时间（秒）
+JOBS_RESULT_TTL = _env_float('MAHJONG_JOBS_RESULT_TTL', 600)
+# 任务状态目录，多进程部署时各工作进程通过该目录共享任务状态
+JOBS_STATE_DIR = _env_str('MAHJONG_JOBS_STATE_DIR', 'run/jobs')
+# SSE 心跳间隔（秒）
+JOBS_SSE_HEARTBEAT = _env_float('MAHJONG_JOBS_SSE_HEARTBEAT', 15)
+
+# /predict_batch 单次请求最多图片数
+BATCH_MAX_FILES = _env_int('MAHJONG_BATCH_MAX_FILES', 32)
+
+# 准入控制（admission.py）
+# 每个工作进程同时处理的识别请求数，0 表示不限制
+ADMISSION_MAX_IN_FLIGHT = _env_int('MAHJONG_MAX_IN_FLIGHT', 4)
+# 最多等待处理的请求数，超过时立即返回 503
+ADMISSION_MAX_WAITING = _env_int('MAHJONG_MAX_WAITING', 8)
+# 最长等待时间（秒），超时返回 503
+ADMISSION_WAIT_TIMEOUT = _env_float('MAHJONG_ADMISSION_WAIT_TIMEOUT', 5.0)
+# 请求截止时间（秒），超过时取消排队中的推理并返回 504，0 表示不限制；
+# 客户端可以通过 X-Request-Timeout 请求头设置更短的截止时间
+REQUEST_TIMEOUT = _env_float('MAHJONG_REQUEST_TIMEOUT', 30.0)
+# 请求体大小上限（MB），按 Content-Length 在读取前拒绝（413）
+MAX_REQUEST_MB = _env_int('MAHJONG_MAX_REQUEST_MB', 20)
+# /predict_batch 的请求体大小上限（MB）
+BATCH_MAX_REQUEST_MB = _env_int('MAHJONG_BATCH_MAX_REQUEST_MB', 64)
+
+# 指标（/metrics）
+# 是否允许客户端通过 X-Debug-Timings 请求头在响应中获取各阶段耗时
+DEBUG_TIMINGS = _env_bool('MAHJONG_DEBUG_TIMINGS', True)
+
+# 手牌分析（/analyze_hand）
+# 向听数查找表缓存目录（首次使用时构建，之后以内存映射方式加载），为空时每个进程在内存中构建
+HAND_TABLE_DIR = _env_str('MAHJONG_HAND_TABLE_DIR', 'run/hand_tables')
+# 统计手牌时忽略低于该置信度的检测框
+HAND_MIN_CONFIDENCE = _env_float('MAHJONG_HAND_MIN_CONFIDENCE', 0.25)
+
+# 视频流识别（mahjong_predictor.py --video、/predict_stream）
+# 与上一个识别帧的差异（缩略灰度图的平均绝对差，0~255）低于该值时跳过该帧
+STREAM_DIFF_THRESHOLD = _env_float('MAHJONG_STREAM_DIFF_THRESHOLD', 3.0)
+# 计算帧差异的缩略图宽度（像素）
+STREAM_DIFF_WIDTH = _env_int('MAHJONG_STREAM_DIFF_WIDTH', 64)
+# 跟踪：检测框与已有轨迹的 IoU 不低于该值时视为同一张牌
+STREAM_TRACK_IOU = _env_float('MAHJONG_STREAM_TRACK_IOU', 0.3)
+# 连续出现多少帧后才报告新增（过滤偶发误检）
+STREAM_TRACK_MIN_HITS = _env_int('MAHJONG_STREAM_TRACK_MIN_HITS', 2)
+# 连续多少个识别帧未出现后报告移除
+STREAM_TRACK_MAX_MISSES = _env_int('MAHJONG_STREAM_TRACK_MAX_MISSES', 3)
+# 与上次报告的位置 IoU 低于该值（移动）或类别变化时报告更新
+STREAM_UPDATE_IOU = _env_float('MAHJONG_STREAM_UPDATE_IOU', 0.7)
+# /predict_stream 上传视频的大小上限（MB）
+# 每个工作进程同时识别的上传视频数，超过时立即返回 503（视频识别不占用图片请求的准入名额），0 表示不限制
+STREAM_MAX_VIDEO_JOBS = _env_int('MAHJONG_STREAM_MAX_VIDEO_JOBS', 2)
+STREAM_MAX_UPLOAD_MB = _env_int('MAHJONG_STREAM_MAX_UPLOAD_MB', 200)
+# 推帧会话（/predict_stream/sessions）：每个工作进程最多会话数和空闲超时（秒）
+STREAM_MAX_SESSIONS = _env_int('MAHJONG_STREAM_MAX_SESSIONS', 16)
+STREAM_SESSION_TTL = _env_float('MAHJONG_STREAM_SESSION_TTL', 300)
@@ -0,0 +1,170 @@
+"""
+检测结果容器与 JSON 编码
+Detections 用一个 (N, 6) float32 数组 [x1, y1, x2, y2, conf, cls] 保存一张图片的检测结果，
+在推理、缓存和响应之间直接传递，不为每个框创建对象；
+需要原有的嵌套格式时才生成（并缓存）字典列表，也可以输出列式格式（平行数组）
+"""
+
+import json
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 类别名称映射
+CLASS_NAMES = [
+    '一饼', '二饼', '三饼', '四饼', '五饼', '六饼', '七饼', '八饼', '九饼',
+    '一条', '二条', '三条', '四条', '五条', '六条', '七条', '八条', '九条',
+    '一万', '二万', '三万', '四万', '五万', '六万', '七万', '八万', '九万',
+    '东风', '南风', '西风', '北风', '红中', '发财', '白板'
+]
+
+# 响应格式：nested（默认，每个框一个字典）/ columnar（平行数组）
+RESULT_FORMATS = ('nested', 'columnar')
+
+
+def class_name(class_id: int) -> str:
+    return CLASS_NAMES[class_id] if 0 <= class_id < len(CLASS_NAMES) else f"未知类别_{class_id}"
+
+
+class Detections:
+    """
+    单张图片的检测结果
+
+    可以像原来的检测结果字典列表一样使用（len、迭代、下标），字典在首次访问时才生成；
+    经过布局分析（layout.apply_layout）后附带每个框的行号 rows 和组号 groups
+    """
+
+    __slots__ = ('boxes', 'rows', 'groups', '_records')
+
+    def __init__(self, boxes=None, rows=None, groups=None):
+        if boxes is None:
+            boxes = np.zeros((0, 6), dtype=np.float32)
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 6)
+        self.rows = None if rows is None else np.asarray(rows, dtype=np.int64)
+        self.groups = None if groups is None else np.asarray(groups, dtype=np.int64)
+        self._records = None
+
+    @classmethod
+    def from_records(cls, records) -> 'Detections':
+        """由嵌套格式的检测结果字典列表（如磁盘缓存中的结果）创建"""
+        if isinstance(records, Detections):
+            return records
+        boxes = [
+            [r['bbox']['x1'], r['bbox']['y1'], r['bbox']['x2'], r['bbox']['y2'], r['confidence'], r['class_id']]
+            for r in records
+        ]
+        if records and 'row' in records[0]:
+            return cls(boxes, rows=[r['row'] for r in records], groups=[r['group_id'] for r in records])
+        return cls(boxes)
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __iter__(self):
+        return iter(self.records())
+
+    def __getitem__(self, index):
+        return self.records()[index]
+
+    def __repr__(self):
+        return f"Detections({len(self)})"
+
+    @property
+    def class_ids(self) -> np.ndarray:
+        return self.boxes[:, 5].astype(np.int64)
+
+    @property
+    def confidences(self) -> np.ndarray:
+        return self.boxes[:, 4]
+
+    @property
+    def xyxy(self) -> np.ndarray:
+        return self.boxes[:, :4]
+
+    def records(self) -> list:
+        """嵌套格式：每个框一个字典（id、class_id、class_name、confidence、bbox，有布局信息时另含 row、group_id）"""
+        if self._records is None:
+            records = []
+            for i, (x1, y1, x2, y2, conf, cls) in enumerate(self.boxes.tolist()):
+                cls = int(cls)
+                records.append({
+                    'id': i + 1,
+                    'class_id': cls,
+                    'class_name': class_name(cls),
+                    'confidence': conf,
+                    'bbox': {
+                        'x1': x1,
+                        'y1': y1,
+                        'x2': x2,
+                        'y2': y2,
+                        'width': x2 - x1,
+                        'height': y2 - y1
+                    }
+                })
+            if self.rows is not None:
+                for record, row, group in zip(records, self.rows.tolist(), self.groups.tolist()):
+                    record['row'] = row
+                    record['group_id'] = group
+            self._records = records
+        return self._records
+
+    def columnar(self) -> dict:
+        """列式格式：各字段的平行数组，类别名称通过 class_id 查 CLASS_NAMES"""
+        columns = self.boxes.T.tolist() if len(self.boxes) else [[] for _ in range(6)]
+        result = {
+            'class_id': self.class_ids.tolist(),
+            'confidence': columns[4],
+            'x1': columns[0],
+            'y1': columns[1],
+            'x2': columns[2],
+            'y2': columns[3]
+        }
+        if self.rows is not None:
+            result['row'] = self.rows.tolist()
+            result['group_id'] = self.groups.tolist()
+        return result
+
+
+def as_detections(value) -> Detections:
+    """Detections、(N, 6) 数组或嵌套格式字典列表统一转换为 Detections"""
+    if isinstance(value, Detections):
+        return value
+    if isinstance(value, np.ndarray):
+        return Detections(value)
+    return Detections.from_records(value or [])
+
+
+def to_columnar(json_result: list) -> list:
+    """将识别结果列表中每张图片的 detections 转换为列式格式"""
+    return [
+        dict(r, detections=as_detections(r['detections']).columnar()) if 'detections' in r else r
+        for r in json_result
+    ]
+
+
+def json_default(obj):
+    """json / orjson 的 default 钩子：Detections 按嵌套格式输出"""
+    if isinstance(obj, Detections):
+        return obj.records()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj, indent: bool = False, sort_keys: bool = False) -> str:
+    """JSON 编码（安装了 orjson 时使用 orjson），非 ASCII 字符原样输出"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=json_default, option=option).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, default=json_default, indent=2 if indent else None,
+                      sort_keys=sort_keys)
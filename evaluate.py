@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+标注数据集上的离线精度评估
+读取 YOLO 格式数据集（images/ 与 labels/），把图片分片交给进程池识别，每个工作进程加载一份模型，
+与服务使用相同的前处理、推理和切片流程；统计逐类别 AP / 精确率 / 召回率、mAP 和类别混淆矩阵，
+并报告吞吐量（图片/秒）和各工作进程的利用率
+
+每个分片的识别结果写入 JSONL 检查点，中断后用同一命令重新运行时跳过已完成的图片，
+精度指标由检查点中的全部结果重新计算
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+import numpy as np
+
+import config
+from accuracy import ConfusionMatrix, DetectionEvaluator, read_yolo_labels, yolo_dataset_items
+from backends import weights_hash
+from detections import CLASS_NAMES, class_name
+
+# 计算 AP 时使用的置信度阈值：低阈值保留完整的置信度排序，AP 才能反映召回率
+AP_CONF_THRESHOLD = 0.001
+
+# 工作进程状态（由 init_worker 设置）
+_worker = {}
+
+
+def init_worker(options: dict):
+    """工作进程初始化：固定线程数并加载模型（每个工作进程一份）"""
+    # Ctrl+C 由主进程处理（终止进程池），工作进程不打印各自的异常
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from serving import pin_thread_env, pin_threads
+    threads = options['threads']
+    pin_thread_env(threads)
+    config.BACKEND = options['backend']
+    config.MODEL_VARIANT = options['variant']
+    config.PREPROCESS_ENABLED = options['preprocess']
+    pin_threads(threads)
+
+    from model_registry import registry
+    start = time.perf_counter()
+    registry.warmup(options['model'], options['device'], size=config.INFER_IMGSZ)
+    _worker.update(options, load_seconds=time.perf_counter() - start)
+
+
+def evaluate_shard(shard: list) -> dict:
+    """
+    工作进程：识别一个分片的图片
+
+    Args:
+        shard: [(名称, 图片路径, 标注文件路径), ...]
+
+    Returns:
+        dict: pid、busy（本分片耗时，秒）、load_seconds（模型加载耗时，只在该进程的第一个分片中返回）
+        和 records（每张图片的 shape、truth、predictions，或 error）
+    """
+    from mahjong_predictor import load_image, predict_images, predict_sliced, prepare_input
+    from preprocess import PreparedImage
+    from slicing import should_slice
+
+    start = time.perf_counter()
+    model, device, conf, slicing = _worker['model'], _worker['device'], _worker['conf'], _worker['slice']
+    records = []
+    batch = []
+    for name, image_path, label_path in shard:
+        try:
+            if config.PREPROCESS_ENABLED and slicing == 'off':
+                # 与服务相同：JPEG 按接近模型输入的分辨率降采样解码后 letterbox，结果还原到原图坐标
+                image = prepare_input(image_path)
+                height, width = image.original_shape
+            else:
+                image = load_image(image_path)
+                height, width = image.shape[:2]
+            record = {'image': name, 'shape': [height, width],
+                      'truth': read_yolo_labels(label_path, width, height)}
+            if slicing != 'off' and should_slice(width, height, slicing, config.SLICE_AUTO_MIN_SIZE):
+                record['predictions'] = predict_sliced(image, model, conf, device).boxes
+            else:
+                if config.PREPROCESS_ENABLED and not isinstance(image, PreparedImage):
+                    image = prepare_input(image)
+                batch.append((record, image))
+        except Exception as e:
+            record = {'image': name, 'error': str(e)}
+        records.append(record)
+
+    if batch:
+        try:
+            detections_list = predict_images([image for _, image in batch], model, conf, device)
+        except Exception as e:
+            detections_list = [e] * len(batch)
+        for (record, _), detections in zip(batch, detections_list):
+            if isinstance(detections, Exception):
+                error = {'image': record['image'], 'error': str(detections)}
+                record.clear()
+                record.update(error)
+            else:
+                record['predictions'] = detections.boxes
+
+    result = {'pid': os.getpid(), 'busy': time.perf_counter() - start, 'records': records}
+    if 'load_seconds' in _worker:
+        result['load_seconds'] = _worker.pop('load_seconds')
+    return result
+
+
+def boxes_to_list(boxes: np.ndarray) -> list:
+    """(N, 6) 框 -> 写入检查点的列表（坐标保留两位小数，置信度保留四位）"""
+    return [[round(float(x1), 2), round(float(y1), 2), round(float(x2), 2), round(float(y2), 2),
+             round(float(conf), 4), int(cls)] for x1, y1, x2, y2, conf, cls in boxes]
+
+
+def boxes_from_list(boxes: list) -> np.ndarray:
+    return np.asarray(boxes, dtype=np.float32).reshape(-1, 6)
+
+
+class EvaluationReport:
+    """累积每张图片的结果：AP 用低阈值下的全部预测，精确率 / 召回率和混淆矩阵用 conf 阈值过滤后的预测"""
+
+    def __init__(self, conf_threshold: float, iou_threshold: float):
+        self.conf_threshold = conf_threshold
+        self.ranked = DetectionEvaluator(iou_threshold=iou_threshold)
+        self.thresholded = DetectionEvaluator(iou_threshold=iou_threshold)
+        self.confusion = ConfusionMatrix(iou_threshold=iou_threshold)
+        self.errors = []
+
+    def add(self, record: dict):
+        if 'error' in record:
+            self.errors.append({'image': record['image'], 'error': record['error']})
+            return
+        truth = boxes_from_list(record['truth'])
+        predictions = boxes_from_list(record['predictions'])
+        kept = predictions[predictions[:, 4] >= self.conf_threshold]
+        self.ranked.add(truth, predictions)
+        self.thresholded.add(truth, kept)
+        self.confusion.add(truth, kept)
+
+    def summary(self) -> dict:
+        ranked = self.ranked.summary()
+        thresholded = self.thresholded.summary()
+        ap_by_class = {c['class_id']: c['ap'] for c in ranked['per_class']}
+        counts_by_class = {c['class_id']: c for c in thresholded['per_class']}
+        per_class = []
+        for class_id in range(len(CLASS_NAMES)):
+            entry = counts_by_class.get(class_id, {})
+            per_class.append({
+                'class_id': class_id,
+                'class_name': class_name(class_id),
+                'ap': ap_by_class.get(class_id, 0.0),
+                'precision': entry.get('precision', 0.0),
+                'recall': entry.get('recall', 0.0),
+                'ground_truth': int(self.ranked.truth_counts[class_id]),
+                'predictions': entry.get('predictions', 0)
+            })
+        return {
+            'images': ranked['images'],
+            'failed_images': len(self.errors),
+            'iou_threshold': ranked['iou_threshold'],
+            'conf_threshold': self.conf_threshold,
+            'map': ranked['map'],
+            'precision': thresholded['precision'],
+            'recall': thresholded['recall'],
+            'per_class': per_class,
+            'top_confusions': self.confusion.top_confusions(),
+            'confusion_matrix': self.confusion.to_dict(),
+            'errors': self.errors[:100]
+        }
+
+
+def read_checkpoint(path: str, meta: dict, report: EvaluationReport, names: set) -> set:
+    """
+    读取检查点：把已完成图片的结果加入报告，返回已完成的图片名称集合（识别失败的图片下次重试）；
+    只使用本次要评估的图片（names）的结果
+
+    检查点的评估参数与本次不一致时抛出 ValueError；最后一行不完整（写入时被中断）时截掉该行
+    """
+    if not os.path.exists(path):
+        return set()
+    records = {}
+    valid_bytes = 0
+    with open(path, 'rb') as f:
+        for number, line in enumerate(f):
+            if not line.endswith(b'\n'):
+                break
+            valid_bytes += len(line)
+            record = json.loads(line)
+            if number == 0:
+                if record.get('meta') != meta:
+                    raise ValueError(f"检查点的评估参数与本次不一致: {path}（使用 --restart 重新评估）")
+                continue
+            # 同一张图片以最后一次结果为准（之前失败、重试后成功）
+            records[record['image']] = record
+    if valid_bytes < os.path.getsize(path):
+        with open(path, 'r+b') as f:
+            f.truncate(valid_bytes)
+
+    done = {name for name, record in records.items() if name in names and 'error' not in record}
+    for name in done:
+        report.add(records[name])
+    return done
+
+
+def print_report(summary: dict, throughput: dict):
+    print(f"\n图片: {summary['images']}（失败 {summary['failed_images']}）  "
+          f"mAP@{summary['iou_threshold']}: {summary['map']:.4f}  "
+          f"精确率: {summary['precision']:.4f}  召回率: {summary['recall']:.4f}（置信度 >= {summary['conf_threshold']}）")
+    # 中文字符占两列，表头按显示宽度对齐
+    print(f"\n{'类别':<6}{'AP':>10}{'精确率':>7}{'召回率':>7}{'标注':>7}{'预测':>7}")
+    for entry in summary['per_class']:
+        print(f"{entry['class_name']:<6}{entry['ap']:>10.4f}{entry['precision']:>10.4f}{entry['recall']:>10.4f}"
+              f"{entry['ground_truth']:>9}{entry['predictions']:>9}")
+    if summary['top_confusions']:
+        print("\n最常见的类别混淆（标注 -> 预测）:")
+        for entry in summary['top_confusions']:
+            print(f"  {entry['truth']} -> {entry['predicted']}: {entry['count']} ({entry['rate']:.1%})")
+    if throughput['images']:
+        print(f"\n本次识别 {throughput['images']} 张图片，耗时 {throughput['wall_seconds']:.1f} 秒，"
+              f"{throughput['images_per_second']:.2f} 张/秒（{throughput['workers']} 个工作进程）")
+        for worker in throughput['per_worker']:
+            print(f"  进程 {worker['pid']}: {worker['images']} 张，加载模型 {worker['load_seconds']:.1f} 秒，"
+                  f"利用率 {worker['utilization']:.0%}，{worker['images_per_busy_second']:.2f} 张/秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='标注数据集上的离线精度评估（多进程）',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用示例:
+  python evaluate.py datasets/mahjong/val --model best.pt --workers 4
+  python evaluate.py datasets/mahjong/val --backend onnx --variant int8 --output report.json
+  中断后重新运行同一命令即从检查点继续，--restart 丢弃检查点重新评估
+        """
+    )
+    parser.add_argument('dataset', help='YOLO 格式标注数据集目录（包含 images/ 与 labels/）')
+    parser.add_argument('--model', '-m', default=config.MODEL_PATH, help=f'模型文件路径 (默认: {config.MODEL_PATH})')
+    parser.add_argument('--conf', '-c', type=float, default=config.CONF_THRESHOLD,
+                        help=f'计算精确率 / 召回率和混淆矩阵的置信度阈值 (默认: {config.CONF_THRESHOLD})；'
+                             f'AP 按 {AP_CONF_THRESHOLD} 的阈值计算')
+    parser.add_argument('--iou', type=float, default=0.5, help='匹配的 IoU 阈值 (默认: 0.5)')
+    parser.add_argument('--workers', '-w', type=int, default=0, help='工作进程数 (默认: CPU 核数 / 2)')
+    parser.add_argument('--threads', type=int, default=0, help='每个工作进程的推理线程数 (默认: CPU 核数 / 工作进程数)')
+    parser.add_argument('--batch-size', '-b', type=int, default=8, help='每个分片的图片数，分片内批量推理 (默认: 8)')
+    parser.add_argument('--device', default=config.MODEL_DEVICE, help=f'推理设备 (默认: {config.MODEL_DEVICE})')
+    parser.add_argument('--backend', default=config.BACKEND, choices=['torch', 'onnx', 'openvino'],
+                        help=f'推理后端 (默认: {config.BACKEND})')
+    parser.add_argument('--variant', default=config.MODEL_VARIANT, choices=['fp32', 'int8'],
+                        help=f'模型精度变体 (默认: {config.MODEL_VARIANT})')
+    parser.add_argument('--slice', choices=['off', 'on', 'auto'], default=config.SLICE_MODE,
+                        help=f'切片推理模式 (默认: {config.SLICE_MODE})')
+    parser.add_argument('--no-preprocess', action='store_true', help='不使用降采样解码 + letterbox 前处理')
+    parser.add_argument('--limit', type=int, default=0, help='最多评估的图片数，0 表示全部')
+    parser.add_argument('--checkpoint', help='检查点文件 (默认: run/eval/<数据集名>-<参数哈希>.jsonl)')
+    parser.add_argument('--restart', action='store_true', help='丢弃已有检查点，重新评估')
+    parser.add_argument('--output', '-o', help='评估报告 JSON 文件 (默认: 检查点同名 .report.json)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        parser.error(f'模型文件不存在: {args.model}')
+    items = yolo_dataset_items(args.dataset, args.limit)
+    if not items:
+        parser.error(f'数据集中没有图片: {os.path.join(args.dataset, "images")}')
+
+    from serving import cpu_count
+    workers = args.workers or max(1, cpu_count() // 2)
+    workers = min(workers, -(-len(items) // max(1, args.batch_size)))
+    threads = args.threads or max(1, cpu_count() // workers)
+    preprocess = config.PREPROCESS_ENABLED and not args.no_preprocess
+
+    # 影响识别结果的参数；与检查点中的不一致时不能继续
+    meta = {
+        'dataset': os.path.abspath(args.dataset),
+        'weights_hash': weights_hash(args.model),
+        'backend': args.backend,
+        'variant': args.variant,
+        'device': args.device,
+        'imgsz': config.INFER_IMGSZ,
+        'preprocess': preprocess,
+        'slice': args.slice,
+        'ap_conf': AP_CONF_THRESHOLD
+    }
+    if args.slice != 'off':
+        meta['slice_params'] = [config.SLICE_SIZE, config.SLICE_OVERLAP, config.SLICE_AUTO_MIN_SIZE,
+                                config.SLICE_INCLUDE_FULL, config.SLICE_NMS_THRESHOLD]
+    checkpoint = args.checkpoint
+    if checkpoint is None:
+        digest = hashlib.sha256(json.dumps(meta, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+        name = os.path.basename(os.path.normpath(args.dataset))
+        checkpoint = os.path.join('run', 'eval', f"{name}-{digest}.jsonl")
+    output = args.output or f"{os.path.splitext(checkpoint)[0]}.report.json"
+    os.makedirs(os.path.dirname(os.path.abspath(checkpoint)), exist_ok=True)
+    if args.restart and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    report = EvaluationReport(args.conf, args.iou)
+    try:
+        done = read_checkpoint(checkpoint, meta, report, {item[0] for item in items})
+    except ValueError as e:
+        parser.error(str(e))
+    pending = [item for item in items if item[0] not in done]
+    print(f"数据集: {args.dataset}（{len(items)} 张图片，检查点中已完成 {len(items) - len(pending)} 张）")
+    print(f"检查点: {checkpoint}")
+
+    batch_size = max(1, args.batch_size)
+    shards = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    per_worker = {}
+    processed = 0
+    wall_seconds = 0.0
+    interrupted = False
+    if shards:
+        options = {
+            'model': args.model, 'device': args.device, 'backend': args.backend, 'variant': args.variant,
+            'preprocess': preprocess, 'slice': args.slice, 'conf': AP_CONF_THRESHOLD, 'threads': threads
+        }
+        workers = min(workers, len(shards))
+        print(f"启动 {workers} 个工作进程（每个 {threads} 个推理线程），{len(shards)} 个分片")
+        new_file = not os.path.exists(checkpoint) or os.path.getsize(checkpoint) == 0
+        # spawn：工作进程各自导入推理库并加载模型，不继承主进程的线程池状态
+        context = multiprocessing.get_context('spawn')
+        start = last_progress = time.perf_counter()
+        pool = context.Pool(workers, initializer=init_worker, initargs=(options,))
+        try:
+            with open(checkpoint, 'a', encoding='utf-8') as f:
+                if new_file:
+                    f.write(json.dumps({'meta': meta}) + '\n')
+                for result in pool.imap_unordered(evaluate_shard, shards):
+                    for record in result['records']:
+                        if 'error' not in record:
+                            record['truth'] = boxes_to_list(record['truth'])
+                            record['predictions'] = boxes_to_list(record['predictions'])
+                        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                        report.add(record)
+                    f.flush()
+
+                    worker = per_worker.setdefault(result['pid'], {'images': 0, 'busy': 0.0, 'load_seconds': 0.0})
+                    worker['images'] += len(result['records'])
+                    worker['busy'] += result['busy']
+                    worker['load_seconds'] += result.get('load_seconds', 0.0)
+                    processed += len(result['records'])
+                    now = time.perf_counter()
+                    if now - last_progress >= 5 or processed == len(pending):
+                        last_progress = now
+                        print(f"  {processed}/{len(pending)}  {processed / (now - start):.2f} 张/秒", file=sys.stderr)
+            pool.close()
+        except KeyboardInterrupt:
+            interrupted = True
+            pool.terminate()
+            print("\n已中断，已完成的结果保存在检查点中，重新运行同一命令继续", file=sys.stderr)
+        finally:
+            pool.join()
+            wall_seconds = time.perf_counter() - start
+
+    throughput = {
+        'images': processed,
+        'wall_seconds': wall_seconds,
+        'images_per_second': processed / wall_seconds if wall_seconds else 0.0,
+        'workers': len(per_worker),
+        'threads_per_worker': threads,
+        # 利用率：识别耗时占该进程加载模型之后运行时间的比例（其余时间在等待分配分片或传递结果）
+        'per_worker': [
+            {
+                'pid': pid,
+                'images': worker['images'],
+                'load_seconds': worker['load_seconds'],
+                'busy_seconds': worker['busy'],
+                'utilization': min(1.0, worker['busy'] / max(wall_seconds - worker['load_seconds'], 1e-9)),
+                'images_per_busy_second': worker['images'] / worker['busy'] if worker['busy'] else 0.0
+            }
+            for pid, worker in sorted(per_worker.items())
+        ]
+    }
+    summary = report.summary()
+    summary.update(model=os.path.abspath(args.model), meta=meta, checkpoint=checkpoint,
+                   complete=not interrupted, throughput=throughput)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    print_report(summary, throughput)
+    print(f"\n评估报告: {output}")
+    sys.exit(1 if interrupted else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型导出与一致性校验
+将 .pt 权重导出为 ONNX / OpenVINO IR（按权重哈希缓存），
+并用样例图片比较导出模型与 PyTorch 模型的检测框是否一致
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from backends import TorchBackend, box_iou, export_model, load_backend
+from mahjong_predictor import load_image
+
+
+def match_boxes(reference: np.ndarray, candidate: np.ndarray, iou_threshold: float) -> dict:
+    """
+    按类别贪心匹配两组检测框
+
+    Returns:
+        匹配数量、双方框数、匹配框的最大坐标偏差和最大置信度偏差
+    """
+    matched = 0
+    max_coord_diff = 0.0
+    max_conf_diff = 0.0
+    used = np.zeros(len(candidate), dtype=bool)
+
+    if len(reference) and len(candidate):
+        ious = box_iou(reference[:, :4], candidate[:, :4])
+        same_class = reference[:, None, 5] == candidate[None, :, 5]
+        ious = np.where(same_class, ious, 0.0)
+        for i in np.argsort(-reference[:, 4]):
+            j = int(np.argmax(np.where(used, -1.0, ious[i])))
+            if used[j] or ious[i, j] < iou_threshold:
+                continue
+            used[j] = True
+            matched += 1
+            max_coord_diff = max(max_coord_diff, float(np.abs(reference[i, :4] - candidate[j, :4]).max()))
+            max_conf_diff = max(max_conf_diff, abs(float(reference[i, 4] - candidate[j, 4])))
+
+    return {
+        'reference_boxes': int(len(reference)),
+        'candidate_boxes': int(len(candidate)),
+        'matched': matched,
+        'max_coord_diff': max_coord_diff,
+        'max_conf_diff': max_conf_diff
+    }
+
+
+def check_parity(weights_path: str, backend, images: list, conf_threshold: float = 0.25,
+                 iou_threshold: float = 0.9, min_match_rate: float = 0.95) -> dict:
+    """
+    比较后端与 PyTorch 后端在同一批图片上的检测框
+
+    Args:
+        weights_path: .pt 权重路径
+        backend: 待校验的后端实例
+        images: 图片路径列表
+        conf_threshold: 置信度阈值
+        iou_threshold: 视为同一个框的最小 IoU
+        min_match_rate: 通过校验所需的最小匹配率（匹配数 / 两侧框数的较大者）
+
+    Returns:
+        校验报告
+    """
+    reference_backend = TorchBackend(weights_path)
+    report = {'backend': backend.name, 'images': [], 'passed': True}
+
+    for image_path in images:
+        image = load_image(image_path)
+        reference = reference_backend.predict([image], conf_threshold)[0]
+        candidate = backend.predict([image], conf_threshold)[0]
+        result = match_boxes(reference, candidate, iou_threshold)
+        total = max(result['reference_boxes'], result['candidate_boxes'])
+        result['image_path'] = image_path
+        result['match_rate'] = result['matched'] / total if total else 1.0
+        result['passed'] = result['match_rate'] >= min_match_rate
+        report['passed'] = report['passed'] and result['passed']
+        report['images'].append(result)
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='模型导出与一致性校验',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用示例:
+  python export_model.py best.pt
+  python export_model.py best.pt --format openvino
+  python export_model.py best.pt --parity augmented_1.jpg
+        """
+    )
+    parser.add_argument('weights', help='.pt 权重文件路径')
+    parser.add_argument('--format', '-f', choices=['onnx', 'openvino'], default='onnx',
+                        help='导出格式 (默认: onnx)')
+    parser.add_argument('--imgsz', type=int, default=640, help='导出输入尺寸 (默认: 640)')
+    parser.add_argument('--parity', nargs='*', metavar='IMAGE',
+                        help='导出后用这些图片与 PyTorch 模型比较检测框')
+    parser.add_argument('--conf', '-c', type=float, default=0.25, help='一致性校验的置信度阈值 (默认: 0.25)')
+    parser.add_argument('--iou', type=float, default=0.9, help='视为同一个框的最小 IoU (默认: 0.9)')
+    parser.add_argument('--min-match-rate', type=float, default=0.95, help='通过校验的最小匹配率 (默认: 0.95)')
+    args = parser.parse_args()
+
+    exported = export_model(args.weights, args.format, args.imgsz)
+    print(f"导出模型: {exported}")
+
+    if args.parity:
+        backend = load_backend(exported, args.format, imgsz=args.imgsz)
+        report = check_parity(args.weights, backend, args.parity, args.conf, args.iou, args.min_match_rate)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        if not report['passed']:
+            print("一致性校验未通过", file=sys.stderr)
+            sys.exit(1)
+        print("一致性校验通过")
+
+
+if __name__ == '__main__':
+    main()
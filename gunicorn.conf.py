@@ -0,0 +1,44 @@
+"""
+gunicorn 配置（生产环境多进程服务）
+
+启动命令:
+  gunicorn -c gunicorn.conf.py manage:app
+
+所有参数均可通过环境变量调整，见 config.py 中的 MAHJONG_WORKERS / MAHJONG_THREADS /
+MAHJONG_INFER_THREADS / MAHJONG_BACKLOG 等配置项
+"""
+
+import config
+import serving
+from startup import startup
+
+workers = serving.worker_count()
+_infer_threads = serving.threads_per_worker(workers)
+
+# 必须在应用（及 torch）导入之前固定线程数，防止多个工作进程互相抢占 CPU
+serving.pin_thread_env(_infer_threads)
+
+# 模型预热在工作进程启动后进行，主进程中不执行推理（fork 后 OpenMP 线程池不安全）；
+# 启动任务（后台导入、查找表加载、预热）也推迟到工作进程中，主进程在 fork 前不创建线程
+config.MODEL_WARMUP = False
+startup.defer()
+
+bind = config.SERVE_BIND
+worker_class = 'gthread'
+threads = config.SERVE_THREADS
+backlog = config.SERVE_BACKLOG
+timeout = config.SERVE_TIMEOUT
+preload_app = True
+accesslog = '-'
+
+
+def on_starting(server):
+    server.log.info(
+        f"Starting {workers} workers x {threads} threads, "
+        f"{_infer_threads} inference threads per worker, backend={config.BACKEND}"
+    )
+    serving.preload_model()
+
+
+def post_worker_init(worker):
+    serving.init_worker(_infer_threads)
@@ -0,0 +1,449 @@
+"""
+手牌分析
+将识别结果转换为 34 种牌的计数向量，计算向听数（一般形 / 七对子 / 国士无双）、
+听牌（待ち）与和牌判断
+
+一般形的向听数使用预先计算的查找表（按花色分解）：
+每种花色的 9 个计数按 5 进制编码为键，表中保存凑成 0~4 个面子（有 / 无雀头）最少还需要摸几张牌；
+整手牌只需查 4 次表再做一次 min-plus 合并，不做递归搜索。
+查找表第一次使用时构建并缓存到磁盘（MAHJONG_HAND_TABLE_DIR），之后直接以内存映射方式加载
+"""
+
+import os
+import threading
+import logging
+
+import numpy as np
+
+import config
+from detections import CLASS_NAMES, as_detections
+
+logger = logging.getLogger(__name__)
+
+NUM_TILES = 34
+# 类别顺序：0-8 饼、9-17 条、18-26 万、27-33 字牌（东南西北中发白）
+SUIT_RANGES = ((0, 9), (9, 18), (18, 27))
+HONOR_RANGE = (27, 34)
+# 幺九牌（国士无双）
+TERMINALS_AND_HONORS = (0, 8, 9, 17, 18, 26, 27, 28, 29, 30, 31, 32, 33)
+_ORPHAN_SET = frozenset(TERMINALS_AND_HONORS)
+
+MAX_MELDS = 4
+# 查找表每个键对应的 10 个值：下标 0~4 为 m 个面子无雀头，5~9 为 m 个面子加雀头
+TABLE_WIDTH = 2 * (MAX_MELDS + 1)
+TABLE_VERSION = 1
+_INF = 99
+
+_POW5 = tuple(5 ** i for i in range(9))
+_POW5_ARRAY = np.array(_POW5, dtype=np.int64)
+
+
+class HandError(ValueError):
+    """手牌不合法（张数不对、同一种牌超过 4 张等）"""
+
+
+def _build_table(positions: int, allow_sequences: bool, max_tiles: int = 14) -> np.ndarray:
+    """
+    构建一种花色（或字牌）的查找表
+
+    对每个计数组合 h（5 进制编码为键），按位置动态规划求出凑成目标形状的最少摸牌数：
+    状态为 (前一位开始的顺子数, 前两位开始的顺子数, 已用面子数, 是否已有雀头)，
+    每一位可以新开顺子、刻子或雀头，需求超过 h 的部分计入摸牌数
+    """
+    size = 5 ** positions
+    keys = np.arange(size, dtype=np.int64)
+    digits = np.stack([(keys // 5 ** i) % 5 for i in range(positions)], axis=1).astype(np.int16)
+    valid = digits.sum(axis=1) <= max_tiles
+    hands = digits[valid]
+    n = len(hands)
+
+    # dp[(s1, s2, melds, pair)] -> 每个手牌的最少摸牌数
+    dp = {(0, 0, 0, 0): np.zeros(n, dtype=np.int16)}
+    for i in range(positions):
+        # 该位置需求为 d 张时的摸牌数
+        costs = [np.maximum(d - hands[:, i], 0) for d in range(5)]
+        max_new_sequences = 4 if allow_sequences and i <= positions - 3 else 0
+        next_dp = {}
+        for (s1, s2, melds, pair), cost in dp.items():
+            for k in range(max_new_sequences + 1):
+                for triplet in (0, 1):
+                    new_melds = melds + k + triplet
+                    if new_melds > MAX_MELDS:
+                        break
+                    for new_pair in ((0, 1) if pair == 0 else (1,)):
+                        demand = s1 + s2 + k + 3 * triplet + 2 * (new_pair - pair)
+                        if demand > 4:
+                            continue
+                        state = (k, s1, new_melds, new_pair)
+                        value = cost + costs[demand]
+                        current = next_dp.get(state)
+                        next_dp[state] = value if current is None else np.minimum(current, value)
+        dp = next_dp
+
+    table = np.full((size, TABLE_WIDTH), _INF, dtype=np.int8)
+    result = np.full((n, TABLE_WIDTH), _INF, dtype=np.int16)
+    for (s1, s2, melds, pair), cost in dp.items():
+        if s1 or s2:
+            continue
+        column = melds + pair * (MAX_MELDS + 1)
+        result[:, column] = np.minimum(result[:, column], cost)
+    table[valid] = result
+    return table
+
+
+class HandTables:
+    """花色和字牌的查找表"""
+
+    def __init__(self, suit: np.ndarray, honor: np.ndarray):
+        self.suit = suit
+        self.honor = honor
+
+    @classmethod
+    def build(cls) -> 'HandTables':
+        return cls(_build_table(9, allow_sequences=True), _build_table(7, allow_sequences=False))
+
+    @classmethod
+    def load_or_build(cls, table_dir: str = None) -> 'HandTables':
+        """从缓存目录加载（内存映射，多进程共享），不存在时构建并写入缓存"""
+        if not table_dir:
+            return cls.build()
+        suit_path = os.path.join(table_dir, f'suit_v{TABLE_VERSION}.npy')
+        honor_path = os.path.join(table_dir, f'honor_v{TABLE_VERSION}.npy')
+        try:
+            # 以普通数组视图访问内存映射（逐行取值比 np.memmap 快），页面仍由各进程共享
+            return cls(np.load(suit_path, mmap_mode='r').view(np.ndarray),
+                       np.load(honor_path, mmap_mode='r').view(np.ndarray))
+        except (OSError, ValueError):
+            pass
+
+        logger.info("Building hand analysis tables")
+        tables = cls.build()
+        try:
+            os.makedirs(table_dir, exist_ok=True)
+            for path, table in ((suit_path, tables.suit), (honor_path, tables.honor)):
+                tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+                np.save(tmp_path, table)
+                os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to cache hand analysis tables: {str(e)}")
+        return tables
+
+
+_tables = None
+_tables_lock = threading.Lock()
+
+
+def get_tables() -> HandTables:
+    """进程级查找表，第一次调用时加载或构建"""
+    global _tables
+    if _tables is None:
+        with _tables_lock:
+            if _tables is None:
+                _tables = HandTables.load_or_build(config.HAND_TABLE_DIR)
+    return _tables
+
+
+def _key(counts, start: int, end: int) -> int:
+    key = 0
+    for i, c in enumerate(counts[start:end]):
+        key += c * _POW5[i]
+    return key
+
+
+def _combine(a, b) -> list:
+    """两组 (面子数, 雀头) -> 最少摸牌数 的 min-plus 合并"""
+    width = MAX_MELDS + 1
+    result = [_INF] * TABLE_WIDTH
+    for m in range(width):
+        best = best_pair = _INF
+        for i in range(m + 1):
+            j = m - i
+            value = a[i] + b[j]
+            if value < best:
+                best = value
+            value = a[width + i] + b[j]
+            if value < best_pair:
+                best_pair = value
+            value = a[i] + b[width + j]
+            if value < best_pair:
+                best_pair = value
+        result[m] = best
+        result[width + m] = best_pair
+    return result
+
+
+def _combine_batch(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """_combine 的向量化版本，a / b 为 (N, TABLE_WIDTH)"""
+    width = MAX_MELDS + 1
+    result = np.empty_like(a)
+    for m in range(width):
+        i = np.arange(m + 1)
+        j = m - i
+        result[:, m] = (a[:, i] + b[:, j]).min(axis=1)
+        result[:, width + m] = np.minimum(a[:, width + i] + b[:, j], a[:, i] + b[:, width + j]).min(axis=1)
+    return result
+
+
+def _final_distance(a, b, melds: int) -> int:
+    """只求合并后 melds 个面子加雀头的最少摸牌数"""
+    width = MAX_MELDS + 1
+    best = _INF
+    for i in range(melds + 1):
+        j = melds - i
+        value = min(a[width + i] + b[j], a[i] + b[width + j])
+        if value < best:
+            best = value
+    return best
+
+
+class HandAnalyzer:
+    """基于查找表的向听数计算"""
+
+    def __init__(self, tables: HandTables = None):
+        self.tables = tables or get_tables()
+
+    def _parts(self, counts) -> list:
+        suit, honor = self.tables.suit, self.tables.honor
+        parts = [suit[_key(counts, start, end)].tolist() for start, end in SUIT_RANGES]
+        parts.append(honor[_key(counts, *HONOR_RANGE)].tolist())
+        return parts
+
+    def regular_shanten(self, counts, melds: int = None) -> int:
+        """一般形向听数（-1 表示和牌），melds 为手牌中需要凑成的面子数，默认按张数计算"""
+        if melds is None:
+            melds = sum(counts) // 3
+        p = self._parts(counts)
+        return _final_distance(_combine(_combine(p[0], p[1]), p[2]), p[3], melds) - 1
+
+    @staticmethod
+    def chiitoitsu_shanten(counts) -> int:
+        """七对子向听数"""
+        pairs = sum(1 for c in counts if c >= 2)
+        kinds = sum(1 for c in counts if c >= 1)
+        return 6 - pairs + max(0, 7 - kinds)
+
+    @staticmethod
+    def kokushi_shanten(counts) -> int:
+        """国士无双向听数"""
+        kinds = sum(1 for i in TERMINALS_AND_HONORS if counts[i] >= 1)
+        has_pair = any(counts[i] >= 2 for i in TERMINALS_AND_HONORS)
+        return 13 - kinds - (1 if has_pair else 0)
+
+    def shanten(self, counts) -> dict:
+        """各种和牌形的向听数，七对子和国士无双只适用于门前 13 / 14 张"""
+        total = sum(counts)
+        result = {'regular': self.regular_shanten(counts)}
+        if total in (13, 14):
+            result['chiitoitsu'] = self.chiitoitsu_shanten(counts)
+            result['kokushi'] = self.kokushi_shanten(counts)
+        result['shanten'] = min(result.values())
+        return result
+
+    def shanten_batch(self, counts: np.ndarray) -> np.ndarray:
+        """
+        批量计算向听数（三种和牌形取最小），用于离线统计和基准测试
+
+        Args:
+            counts: (N, 34) 计数数组，每行张数相同
+
+        Returns:
+            (N,) int16 向听数
+        """
+        counts = np.asarray(counts, dtype=np.int64).reshape(-1, NUM_TILES)
+        total = int(counts[0].sum()) if len(counts) else 0
+        melds = total // 3
+        parts = [
+            self.tables.suit[counts[:, start:end] @ _POW5_ARRAY].astype(np.int16)
+            for start, end in SUIT_RANGES
+        ]
+        parts.append(self.tables.honor[counts[:, HONOR_RANGE[0]:HONOR_RANGE[1]] @ _POW5_ARRAY[:7]].astype(np.int16))
+        combined = _combine_batch(_combine_batch(parts[0], parts[1]), parts[2])
+        split = np.arange(melds + 1)
+        result = np.minimum(
+            combined[:, MAX_MELDS + 1 + split] + parts[3][:, melds - split],
+            combined[:, split] + parts[3][:, MAX_MELDS + 1 + melds - split]
+        ).min(axis=1) - 1
+
+        if total in (13, 14):
+            pairs = (counts >= 2).sum(axis=1)
+            kinds = (counts >= 1).sum(axis=1)
+            result = np.minimum(result, 6 - pairs + np.maximum(0, 7 - kinds))
+            orphans = counts[:, TERMINALS_AND_HONORS]
+            result = np.minimum(result, 13 - (orphans >= 1).sum(axis=1) - (orphans >= 2).any(axis=1))
+        return result.astype(np.int16)
+
+    def _best_shanten(self, counts, closed: bool) -> int:
+        value = self.regular_shanten(counts)
+        if closed:
+            value = min(value, self.chiitoitsu_shanten(counts), self.kokushi_shanten(counts))
+        return value
+
+    def effective_tiles(self, counts) -> tuple:
+        """
+        3n+1 张手牌：摸到后向听数减少的牌
+
+        Returns:
+            (当前向听数, [牌的类别 ID, ...])
+        """
+        total = sum(counts)
+        closed = total == 13
+        melds = total // 3
+        p = self._parts(counts)
+
+        # 摸牌只改变一种花色，其余三种花色的合并结果由前缀 / 后缀合并得到
+        left = _combine(p[0], p[1])
+        right = _combine(p[2], p[3])
+        others = (
+            _combine(p[1], right),
+            _combine(p[0], right),
+            _combine(left, p[3]),
+            _combine(left, p[2])
+        )
+        current = _final_distance(p[3], others[3], melds) - 1
+
+        if closed:
+            pairs = sum(1 for c in counts if c >= 2)
+            kinds = sum(1 for c in counts if c >= 1)
+            orphans = sum(1 for i in TERMINALS_AND_HONORS if counts[i] >= 1)
+            orphan_pair = any(counts[i] >= 2 for i in TERMINALS_AND_HONORS)
+            current = min(current, 6 - pairs + max(0, 7 - kinds), 13 - orphans - orphan_pair)
+
+        # 每种花色的候选牌一次查表，向量化求合并后的最少摸牌数
+        split = np.arange(melds + 1)
+        tiles = []
+        for s, (start, end) in enumerate(SUIT_RANGES + (HONOR_RANGE,)):
+            table = self.tables.honor if s == 3 else self.tables.suit
+            rest = np.asarray(others[s], dtype=np.int16)
+            # 已有 4 张的牌不能再摸：该位置不加增量（否则会进位到下一位或越过表尾），结果在下面跳过
+            steps = np.where(np.asarray(counts[start:end]) < 4, _POW5_ARRAY[:end - start], 0)
+            rows = table[_key(counts, start, end) + steps].astype(np.int16)
+            values = np.minimum(
+                rows[:, MAX_MELDS + 1 + split] + rest[melds - split],
+                rows[:, split] + rest[MAX_MELDS + 1 + melds - split]
+            ).min(axis=1) - 1
+            for offset, value in enumerate(values.tolist()):
+                i = start + offset
+                c = counts[i]
+                if c >= 4:
+                    continue
+                if closed and value >= current:
+                    # 七对子 / 国士无双按增量计算
+                    value = min(value, 6 - (pairs + (c == 1)) + max(0, 7 - (kinds + (c == 0))))
+                    if i in _ORPHAN_SET:
+                        value = min(value, 13 - (orphans + (c == 0)) - (orphan_pair or c == 1))
+                if value < current:
+                    tiles.append(i)
+        return current, tiles
+
+    def analyze(self, counts) -> dict:
+        """
+        分析手牌
+
+        Args:
+            counts: 34 种牌的计数（类别顺序与 CLASS_NAMES 一致）
+
+        Returns:
+            dict: tile_count、counts、shanten（含各和牌形）、is_win、is_tenpai；
+            3n+1 张时包含 waits（听牌时的待ち）和 effective_tiles（进张），
+            3n+2 张且未和牌时包含 discards（每种打法打出后的向听数和进张）
+
+        Raises:
+            HandError: 手牌张数不是 3n+1 / 3n+2 或同一种牌超过 4 张
+        """
+        counts = validate_counts(counts)
+        total = sum(counts)
+        closed = total in (13, 14)
+        shanten = self.shanten(counts)
+        result = {
+            'tile_count': total,
+            'counts': counts,
+            'shanten': shanten['shanten'],
+            'shanten_by_form': {k: v for k, v in shanten.items() if k != 'shanten'},
+            'is_win': total % 3 == 2 and shanten['shanten'] == -1
+        }
+
+        if total % 3 == 1:
+            current, tiles = self.effective_tiles(counts)
+            result['is_tenpai'] = current == 0
+            result['effective_tiles'] = tile_list(tiles, counts)
+            result['waits'] = result['effective_tiles'] if current == 0 else []
+        else:
+            result['is_tenpai'] = shanten['shanten'] <= 0
+            if not result['is_win']:
+                discards = []
+                for i in range(NUM_TILES):
+                    if counts[i] == 0:
+                        continue
+                    counts[i] -= 1
+                    after, tiles = self.effective_tiles(counts)
+                    counts[i] += 1
+                    if after == self._best_shanten(counts, closed):
+                        entry = tile_info(i)
+                        entry.update({
+                            'shanten': after,
+                            'effective_tiles': tile_list(tiles, counts),
+                            'effective_count': sum(4 - counts[t] for t in tiles)
+                        })
+                        discards.append(entry)
+                discards.sort(key=lambda d: -d['effective_count'])
+                result['discards'] = discards
+        return result
+
+
+def tile_info(tile: int) -> dict:
+    return {'class_id': tile, 'class_name': CLASS_NAMES[tile]}
+
+
+def tile_list(tiles: list, counts: list) -> list:
+    """牌列表，附带剩余张数（4 - 手中张数）"""
+    return [dict(tile_info(t), remaining=4 - counts[t]) for t in tiles]
+
+
+def validate_counts(counts) -> list:
+    counts = [int(c) for c in counts]
+    if len(counts) != NUM_TILES:
+        raise HandError(f"Expected {NUM_TILES} tile counts, got {len(counts)}")
+    if any(c < 0 or c > 4 for c in counts):
+        over = [CLASS_NAMES[i] for i, c in enumerate(counts) if c > 4]
+        raise HandError(f"More than 4 copies of: {', '.join(over)}" if over else "Tile counts cannot be negative")
+    total = sum(counts)
+    if total == 0 or total > 14 or total % 3 == 0:
+        raise HandError(f"Hand must have 3n+1 or 3n+2 tiles (at most 14), got {total}")
+    return counts
+
+
+def counts_from_tiles(tiles) -> list:
+    """牌的类别 ID 或名称列表 -> 34 种牌的计数"""
+    counts = [0] * NUM_TILES
+    for tile in tiles:
+        if isinstance(tile, str):
+            if tile not in CLASS_NAMES:
+                raise HandError(f"Unknown tile: {tile}")
+            tile = CLASS_NAMES.index(tile)
+        try:
+            tile = int(tile)
+        except (TypeError, ValueError):
+            raise HandError(f"Unknown tile: {tile!r}")
+        if not 0 <= tile < NUM_TILES:
+            raise HandError(f"Unknown tile class: {tile}")
+        counts[tile] += 1
+    return counts
+
+
+def counts_from_detections(detections, min_confidence: float = 0.0) -> list:
+    """识别结果（Detections 或检测结果字典列表）-> 34 种牌的计数"""
+    detections = as_detections(detections)
+    class_ids = detections.class_ids[detections.confidences >= min_confidence]
+    counts = np.bincount(class_ids[(class_ids >= 0) & (class_ids < NUM_TILES)], minlength=NUM_TILES)
+    return counts.tolist()
+
+
+_analyzer = None
+
+
+def analyze_hand(counts) -> dict:
+    """使用进程级查找表分析手牌"""
+    global _analyzer
+    if _analyzer is None:
+        _analyzer = HandAnalyzer()
+    return _analyzer.analyze(counts)
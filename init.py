@@ -1,152 +1,390 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, g, url_for
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.utils import secure_filename
 import os
-import mimetypes
+import time
 import logging
 from datetime import datetime
-from pathlib import Path
 
+import config
+import metrics
+import admission
 from route.user import user_bp
 from route.welcome import welcome_bp
-from predict import predict
+from route.predict_jobs import predict_jobs_bp
+from route.analyze_hand import analyze_hand_bp
+from route.predict_stream import predict_stream_bp
+from route.health import health_bp
+from result_cache import get_result_cache, hash_image_bytes
+from result_store import get_result_store
+from uploads import validate_upload, validate_file
+from jobs import job_manager
+from detections import RESULT_FORMATS, CLASS_NAMES, dumps, to_columnar
+from startup import startup
+from model_manifest import UnknownModel, routed
+
+class FastJSONProvider(DefaultJSONProvider):
+    """响应 JSON 编码：安装了 orjson 时使用 orjson，并支持 Detections"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj, sort_keys=self.sort_keys)
 
 def create_app():
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    # 请求体大小的最后防线：有 Content-Length 的请求在 before_request 中按接口检查，
+    # 分块上传在读取请求体时超过该值会被拒绝
+    app.config['MAX_CONTENT_LENGTH'] = max(
+        config.MAX_REQUEST_MB, config.BATCH_MAX_REQUEST_MB, config.STREAM_MAX_UPLOAD_MB + 1
+    ) * 1024 * 1024
     
     # 配置日志
     logging.basicConfig(level=logging.INFO)
     logger = logging.getLogger(__name__)
     
     UPLOAD_FOLDER = 'uploads'
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-    MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
 
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    if config.SPOOL_UPLOADS:
+        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
     os.makedirs('run', exist_ok=True)
-    os.makedirs('run/predict', exist_ok=True)
 
-    def allowed_file(filename):
-        return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    # 推理模块导入、手牌分析查找表加载和模型预热（加载 + 首次推理）默认在后台线程中进行，
+    # 不阻塞 HTTP 服务绑定，完成后 /readyz 返回就绪；推理相关模块在使用处导入
+    startup.begin()
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        g.metrics_started_at = time.perf_counter()
+        metrics.REQUESTS_IN_FLIGHT.inc(endpoint=g.metrics_endpoint)
+        # 客户端发送 X-Debug-Timings: 1 时收集本次请求的阶段耗时
+        if config.DEBUG_TIMINGS and request.headers.get('X-Debug-Timings', '').lower() in ('1', 'true', 'yes'):
+            g.metrics_timings_token = metrics.start_timings()
+
+    @app.before_request
+    def start_request_admission():
+        # 读取请求体之前按 Content-Length 拒绝过大的请求，并设置请求的截止时间
+        admission.check_content_length(request.endpoint, request.content_length)
+        if request.endpoint not in admission.DEADLINE_EXEMPT:
+            g.deadline_token = admission.start_deadline(
+                admission.request_timeout(request.headers.get('X-Request-Timeout'))
+            )
+
+    @app.after_request
+    def finish_request_metrics(response):
+        endpoint = g.get('metrics_endpoint')
+        if endpoint is None:
+            return response
+        metrics.REQUESTS_TOTAL.inc(endpoint=endpoint, status=response.status_code)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.metrics_started_at, endpoint=endpoint)
+        timings = metrics.current_timings()
+        if timings is not None:
+            response.headers['Server-Timing'] = ', '.join(
+                f"{name};dur={seconds * 1000.0:.2f}" for name, seconds in timings.items()
+            )
+        return response
+
+    @app.teardown_request
+    def cleanup_request_metrics(exc):
+        endpoint = g.pop('metrics_endpoint', None)
+        if endpoint is not None:
+            metrics.REQUESTS_IN_FLIGHT.dec(endpoint=endpoint)
+        token = g.pop('metrics_timings_token', None)
+        if token is not None:
+            metrics.stop_timings(token)
+        token = g.pop('deadline_token', None)
+        if token is not None:
+            admission.stop_deadline(token)
+
+    @app.errorhandler(admission.AdmissionError)
+    def handle_admission_error(e):
+        """准入控制拒绝（503 / 413）或超过截止时间（504）"""
+        logger.warning(f"Request rejected ({e.reason}): {request.path}")
+        response = jsonify({'error': str(e), 'reason': e.reason})
+        response.status_code = e.status_code
+        if e.retry_after is not None:
+            response.headers['Retry-After'] = str(e.retry_after)
+        return response
+
+    @app.errorhandler(UnknownModel)
+    def handle_unknown_model(e):
+        return jsonify({'error': str(e)}), 400
+
+    @app.errorhandler(413)
+    def handle_too_large(e):
+        metrics.ADMISSION_REJECTED.inc(reason='too_large')
+        limit = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+        return jsonify({'error': f'Request too large. Maximum size is {limit}MB', 'reason': 'too_large'}), 413
+
+    def debug_timings():
+        """当前请求已收集的阶段耗时（毫秒），未请求调试耗时时返回 None"""
+        timings = metrics.current_timings()
+        if timings is None:
+            return None
+        return {name: round(seconds * 1000.0, 3) for name, seconds in timings.items()}
+
+    def requested_format():
+        """响应格式（?format=nested|columnar），不支持的格式返回 None"""
+        result_format = request.args.get('format', 'nested')
+        return result_format if result_format in RESULT_FORMATS else None
+
+    def requested_render():
+        """是否生成结果图片（?render=1，也可以作为表单字段提交）"""
+        return request.values.get('render', '').lower() in ('1', 'true', 'yes')
+
+    def format_etag(cache_key, result_format, image_name=None):
+        """不同响应格式的内容不同，带结果图片链接的响应也不同，ETag 需要区分"""
+        if cache_key is None:
+            return None
+        if result_format != 'nested':
+            cache_key = f"{cache_key}-{result_format}"
+        if image_name is not None:
+            cache_key = f"{cache_key}-img{image_name[:8]}"
+        return cache_key
+
+    def build_predict_response(result, filename, etag=None, cache_hit=False, result_format='nested',
+                               image_name=None):
+        """构建识别接口的响应，结果中的图片名称使用本次上传的文件名"""
+        json_result = [dict(r, image_path=filename) for r in result['json_result']]
+        response_data = {
+            'success': True,
+            'json_result': json_result,
+            'message': result.get('message', 'Prediction completed'),
+            'output_image_url': url_for('get_result_image', filename=image_name) if image_name else None,
+            'cache_hit': cache_hit,
+            'model': result.get('model')
+        }
+        if result_format == 'columnar':
+            response_data['json_result'] = to_columnar(json_result)
+            response_data['format'] = 'columnar'
+            response_data['class_names'] = CLASS_NAMES
+        timings = debug_timings()
+        if timings is not None:
+            response_data['timings'] = timings
+        with metrics.stage('serialize'):
+            response = jsonify(response_data)
+        if etag:
+            response.set_etag(etag)
+        return response
 
     @app.route('/')
     def hello_world():
         return 'predict!!!'
     
     @app.route('/predict_image', methods=['POST'])
+    @admission.admitted
+    @routed
     def predict_image():
         try:
-            # 检查是否有文件上传
-            if 'file' not in request.files:
-                logger.warning("No file part in request")
-                return jsonify({'error': 'No file part'}), 400
-            
-            file = request.files['file']
-            
-            # 检查是否选择了文件
-            if file.filename == '':
-                logger.warning("No file selected")
-                return jsonify({'error': 'No selected file'}), 400
-            
-            # 检查文件大小
-            file.seek(0, 2)  # 移动到文件末尾
-            file_size = file.tell()
-            file.seek(0)  # 重置到文件开头
-            
-            if file_size > MAX_FILE_SIZE:
-                logger.warning(f"File too large: {file_size} bytes")
-                return jsonify({'error': f'File too large. Maximum size is {MAX_FILE_SIZE // (1024*1024)}MB'}), 400
+            result_format = requested_format()
+            if result_format is None:
+                return jsonify({'error': f"Unsupported format: {request.args.get('format')}"}), 400
             
-            # 检查文件类型是否允许
-            if not allowed_file(file.filename):
-                logger.warning(f"File type not allowed: {file.filename}")
-                return jsonify({'error': 'File type not allowed. Supported formats: PNG, JPG, JPEG, GIF'}), 400
+            # 检查上传文件（是否存在、大小、类型）；访问 request.files 时才接收并解析请求体
+            with metrics.stage('upload'):
+                file, error = validate_upload(request.files)
+                data = file.read() if not error else None
+            if error:
+                logger.warning(f"Invalid upload: {error}")
+                return jsonify({'error': error}), 400
             
-            # 生成唯一文件名
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
             filename = secure_filename(file.filename)
-            name, ext = os.path.splitext(filename)
-            unique_filename = f"{name}_{timestamp}{ext}"
-            temp_path = os.path.join(UPLOAD_FOLDER, unique_filename)
+            from predict import predict_upload, upload_cache_key, result_image_name, render_upload
             
-            logger.info(f"Processing file: {file.filename} -> {unique_filename}")
+            if config.SPOOL_UPLOADS:
+                # 调试模式：保存到磁盘后按路径识别（不使用结果缓存）
+                return predict_spooled(data, file.filename, filename, result_format)
             
-            # 保存文件
-            file.save(temp_path)
+            # 按图片内容哈希 + 模型版本 + 置信度阈值计算缓存键，该键同时作为 ETag；
+            # 结果图片按同样的输入加上绘制参数寻址，同一图片只绘制一次
+            render = requested_render()
+            image_hash = hash_image_bytes(data) if render else None
+            cache_key = upload_cache_key(data, g.model_spec, image_hash)
+            image_name = result_image_name(data, g.model_spec, image_hash) if render else None
+            etag = format_etag(cache_key, result_format, image_name)
+            # 结果图片已被淘汰时不能返回 304，需要重新绘制
+            if (etag is not None and request.if_none_match.contains(etag)
+                    and (image_name is None or get_result_store().contains(image_name))):
+                logger.info(f"Not modified: {file.filename}")
+                response = app.response_class(status=304)
+                response.set_etag(etag)
+                return response
             
             try:
-                # 进行预测
-                result = predict(temp_path)
+                # 进行预测（直接从上传流的字节缓冲区解码，不经过磁盘）
+                logger.info(f"Processing file: {file.filename} (in memory)")
+                try:
+                    result = predict_upload(data, image_name=filename, cache_key=cache_key, spec=g.model_spec)
+                except ValueError as e:
+                    logger.warning(f"Cannot decode image: {file.filename}")
+                    return jsonify({'error': str(e)}), 400
                 
-                # 清理临时文件
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                    logger.info(f"Cleaned up temp file: {temp_path}")
-
                 if not result['success']:
                     logger.error(f"Prediction failed: {result.get('error', 'Unknown error')}")
                     return jsonify({'error': result['error']}), 500
                 
-                # 构建响应数据
-                response_data = {
-                    'success': True,
-                    'json_result': result['json_result'],
-                    'message': result.get('message', 'Prediction completed'),
-                    'output_image_url': None  # 不再生成输出图片
-                }
-                
+                if result['cache_hit']:
+                    logger.info(f"Result cache hit: {file.filename}")
                 logger.info(f"Prediction successful: {result.get('message', '')}")
-                return jsonify(response_data)
+                if image_name is not None:
+                    try:
+                        if not render_upload(data, result['json_result'], image_name):
+                            image_name = None
+                    except OSError as e:
+                        logger.warning(f"Cannot store result image: {str(e)}")
+                        image_name = None
+                return build_predict_response(result, filename, etag, cache_hit=result['cache_hit'],
+                                              result_format=result_format, image_name=image_name)
                 
+            except admission.REJECTIONS:
+                raise
             except Exception as e:
-                # 清理临时文件
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                    logger.info(f"Cleaned up temp file after error: {temp_path}")
-                
                 logger.error(f"Error processing image: {str(e)}")
                 return jsonify({'error': f'Error processing image: {str(e)}'}), 500
         
+        except admission.REJECTIONS:
+            raise
         except Exception as e:
             logger.error(f"Unexpected error in predict_image: {str(e)}")
             return jsonify({'error': 'Internal server error'}), 500
 
+    @app.route('/predict_batch', methods=['POST'])
+    @admission.admitted
+    @routed
+    def predict_batch():
+        """一次上传多张图片，按上传顺序返回每张图片的识别结果"""
+        try:
+            result_format = requested_format()
+            if result_format is None:
+                return jsonify({'error': f"Unsupported format: {request.args.get('format')}"}), 400
+            
+            with metrics.stage('upload'):
+                files = request.files.getlist('files') + request.files.getlist('file')
+            files = [f for f in files if f.filename != '']
+            if not files:
+                logger.warning("No files in batch request")
+                return jsonify({'error': 'No file part'}), 400
+            
+            if len(files) > config.BATCH_MAX_FILES:
+                logger.warning(f"Too many files in batch request: {len(files)}")
+                return jsonify({'error': f'Too many files. Maximum is {config.BATCH_MAX_FILES} per request'}), 400
+            
+            for file in files:
+                error = validate_file(file)
+                if error:
+                    logger.warning(f"Invalid upload {file.filename}: {error}")
+                    return jsonify({'error': f'{file.filename}: {error}'}), 400
+            
+            with metrics.stage('upload'):
+                uploads = [(file.read(), secure_filename(file.filename)) for file in files]
+            logger.info(f"Processing batch of {len(uploads)} files")
+            
+            from predict import predict_uploads
+            results = predict_uploads(uploads, g.model_spec)
+            succeeded = sum(1 for r in results if r['success'])
+            total_detections = sum(r.get('total_detections', 0) for r in results)
+            
+            logger.info(f"Batch prediction finished: {succeeded}/{len(results)} succeeded")
+            response_data = {
+                'success': succeeded > 0,
+                'total_images': len(results),
+                'succeeded': succeeded,
+                'results': results,
+                'model': g.model_spec.name,
+                'message': f"成功识别 {succeeded}/{len(results)} 张图片，共 {total_detections} 张麻将牌"
+            }
+            if result_format == 'columnar':
+                response_data['results'] = to_columnar(results)
+                response_data['format'] = 'columnar'
+                response_data['class_names'] = CLASS_NAMES
+            timings = debug_timings()
+            if timings is not None:
+                response_data['timings'] = timings
+            with metrics.stage('serialize'):
+                return jsonify(response_data)
+        
+        except admission.REJECTIONS:
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error in predict_batch: {str(e)}")
+            return jsonify({'error': 'Internal server error'}), 500
+
+    def predict_spooled(data, original_filename, filename, result_format='nested'):
+        """调试模式：将上传图片写入 uploads/ 后按路径识别，识别后清理"""
+        from predict import predict
+        # 生成唯一文件名
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        name, ext = os.path.splitext(filename)
+        unique_filename = f"{name}_{timestamp}{ext}"
+        temp_path = os.path.join(UPLOAD_FOLDER, unique_filename)
+        
+        logger.info(f"Processing file: {original_filename} -> {unique_filename}")
+        
+        # 保存文件
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        
+        try:
+            # 进行预测
+            result = predict(temp_path, image_name=filename, spec=g.model_spec)
+            
+            if not result['success']:
+                logger.error(f"Prediction failed: {result.get('error', 'Unknown error')}")
+                return jsonify({'error': result['error']}), 500
+            
+            logger.info(f"Prediction successful: {result.get('message', '')}")
+            return build_predict_response(result, filename, result_format=result_format)
+            
+        except admission.AdmissionError:
+            raise
+        except Exception as e:
+            logger.error(f"Error processing image: {str(e)}")
+            return jsonify({'error': f'Error processing image: {str(e)}'}), 500
+        
+        finally:
+            # 清理临时文件
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+                logger.info(f"Cleaned up temp file: {temp_path}")
+
+    @app.route('/model_stats')
+    def model_stats():
+        """模型注册表加载/命中统计、微批调度、结果缓存及异步任务统计"""
+        from model_registry import registry
+        from mahjong_predictor import batch_scheduler_stats
+        stats = registry.stats()
+        stats['batching'] = batch_scheduler_stats()
+        result_cache = get_result_cache()
+        stats['result_cache'] = result_cache.stats() if result_cache is not None else None
+        stats['jobs'] = job_manager.stats()
+        stats['admission'] = admission.controller.stats()
+        stats['video_jobs'] = admission.video_controller.stats()
+        stats['result_images'] = get_result_store().stats()
+        from model_manifest import manifest
+        stats['manifest'] = manifest.stats()
+        return jsonify(stats)
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """Prometheus 文本格式的指标（每个工作进程独立统计）"""
+        return app.response_class(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
     @app.route('/get_result_image/<filename>')
     def get_result_image(filename):
-        """获取识别结果图片"""
+        """获取识别结果图片：按文件名直接定位，内容不变，支持条件请求（If-None-Match / If-Modified-Since）"""
         try:
-            # 确保文件名安全
-            safe_filename = secure_filename(filename)
-            
-            # 在run目录及其子目录中查找图片
-            run_dir = Path('run')
-            image_path = None
-            
-            # 首先在run目录直接查找
-            direct_path = run_dir / safe_filename
-            if direct_path.exists():
-                image_path = direct_path
-            else:
-                # 在predict子目录中查找
-                predict_dir = run_dir / 'predict'
-                if predict_dir.exists():
-                    for subdir in predict_dir.iterdir():
-                        if subdir.is_dir() and subdir.name.startswith('predict'):
-                            potential_path = subdir / safe_filename
-                            if potential_path.exists():
-                                image_path = potential_path
-                                break
-            
-            if not image_path or not image_path.exists():
-                logger.warning(f"Image not found: {safe_filename}")
+            found = get_result_store().get(filename)
+            if found is None:
+                logger.warning(f"Image not found: {secure_filename(filename)}")
                 return jsonify({'error': 'Image not found'}), 404
             
-            # 获取文件的MIME类型
-            mime_type, _ = mimetypes.guess_type(str(image_path))
-            if not mime_type:
-                mime_type = 'application/octet-stream'
-            
-            logger.info(f"Serving image: {image_path}")
-            return send_file(str(image_path), mimetype=mime_type)
+            path, _ = found
+            max_age = int(config.RESULT_IMAGE_TTL) if config.RESULT_IMAGE_TTL > 0 else 365 * 86400
+            response = send_file(path, mimetype='image/jpeg', conditional=True,
+                                 etag=filename.rsplit('.', 1)[0], max_age=max_age)
+            # 文件名由内容决定，同一链接的内容不会变化
+            response.cache_control.immutable = True
+            return response
             
         except Exception as e:
             logger.error(f"Error serving image: {str(e)}")
@@ -155,7 +393,11 @@ def create_app():
 
     with app.app_context():
         # 注册路由
+        app.register_blueprint(health_bp)
         app.register_blueprint(welcome_bp)
         app.register_blueprint(user_bp)
+        app.register_blueprint(predict_jobs_bp)
+        app.register_blueprint(analyze_hand_bp)
+        app.register_blueprint(predict_stream_bp)
 
     return app
@@ -0,0 +1,236 @@
+"""
+异步识别任务
+任务在有界的后台线程池中执行，排队任务数超过上限时拒绝新任务；
+任务状态同时写入 run/jobs/，多进程部署时任意工作进程都能查询
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from detections import json_default
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED_STATES = (DONE, FAILED)
+
+_JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class JobQueueFull(Exception):
+    """排队任务数已达上限"""
+
+
+class JobManager:
+    """
+    异步任务管理器
+
+    Args:
+        max_workers: 同时执行的任务数
+        max_queue: 最多排队（未开始执行）的任务数，超过时 submit 抛出 JobQueueFull
+        result_ttl: 任务完成后结果保留时间（秒）
+        state_dir: 任务状态目录，None 表示只保存在内存中
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 32, result_ttl: float = 600,
+                 state_dir: str = None):
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self.result_ttl = float(result_ttl)
+        self.state_dir = state_dir
+        self._jobs = {}
+        self._events = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._last_cleanup = 0.0
+        self.queued = 0
+        self.running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _ensure_executor(self):
+        # fork 出的子进程不会继承线程池的线程，需要重新创建
+        pid = os.getpid()
+        if self._executor is None or self._pid != pid:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='predict-job')
+            self._pid = pid
+
+    def _state_path(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, f"{job_id}.json")
+
+    def _persist(self, record: dict):
+        if not self.state_dir:
+            return
+        path = self._state_path(record['job_id'])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False, default=json_default)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Failed to persist job {record['job_id']}: {str(e)}")
+
+    def _load(self, job_id: str) -> dict:
+        if not self.state_dir:
+            return None
+        try:
+            with open(self._state_path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _cleanup(self):
+        """清理已过期的任务，调用方持有 self._lock"""
+        now = time.time()
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+
+        for job_id, record in list(self._jobs.items()):
+            if record['status'] in FINISHED_STATES and now - record['finished_at'] > self.result_ttl:
+                del self._jobs[job_id]
+                self._events.pop(job_id, None)
+
+        if self.state_dir and os.path.isdir(self.state_dir):
+            for entry in os.scandir(self.state_dir):
+                try:
+                    if now - entry.stat().st_mtime > self.result_ttl + 60:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def submit(self, fn, *args, **kwargs) -> dict:
+        """
+        提交任务
+
+        Returns:
+            任务状态
+
+        Raises:
+            JobQueueFull: 排队任务数已达上限
+        """
+        with self._lock:
+            self._cleanup()
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise JobQueueFull(f"Too many queued jobs (max {self.max_queue})")
+
+            job_id = uuid.uuid4().hex
+            record = {
+                'job_id': job_id,
+                'status': QUEUED,
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'result': None,
+                'error': None
+            }
+            self._jobs[job_id] = record
+            self._events[job_id] = threading.Event()
+            self.queued += 1
+            self.submitted += 1
+            self._ensure_executor()
+            snapshot = dict(record)
+
+        self._persist(snapshot)
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return snapshot
+
+    def _run(self, job_id: str, fn, args, kwargs):
+        with self._lock:
+            record = self._jobs[job_id]
+            record['status'] = RUNNING
+            record['started_at'] = time.time()
+            self.queued -= 1
+            self.running += 1
+            snapshot = dict(record)
+        self._persist(snapshot)
+
+        try:
+            result = fn(*args, **kwargs)
+            status, error = DONE, None
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            result, status, error = None, FAILED, str(e)
+
+        with self._lock:
+            record['status'] = status
+            record['result'] = result
+            record['error'] = error
+            record['finished_at'] = time.time()
+            self.running -= 1
+            if status == DONE:
+                self.completed += 1
+            else:
+                self.failed += 1
+            snapshot = dict(record)
+            event = self._events.get(job_id)
+        self._persist(snapshot)
+        if event is not None:
+            event.set()
+
+    def get(self, job_id: str) -> dict:
+        """查询任务状态，本进程没有该任务时从状态目录读取；不存在返回 None"""
+        if not _JOB_ID_PATTERN.match(job_id or ''):
+            return None
+        with self._lock:
+            record = self._jobs.get(job_id)
+            if record is not None:
+                return dict(record)
+        return self._load(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> dict:
+        """等待任务完成，最多等待 timeout 秒，返回当前状态"""
+        with self._lock:
+            event = self._events.get(job_id)
+        if event is not None:
+            event.wait(timeout)
+            return self.get(job_id)
+
+        # 其他工作进程提交的任务只能轮询状态文件
+        deadline = time.monotonic() + timeout
+        while True:
+            record = self.get(job_id)
+            if record is None or record['status'] in FINISHED_STATES or time.monotonic() >= deadline:
+                return record
+            time.sleep(min(0.2, max(0.0, deadline - time.monotonic())))
+
+    def queue_depth(self) -> int:
+        with self._lock:
+            return self.queued
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'queued': self.queued,
+                'running': self.running,
+                'submitted': self.submitted,
+                'rejected': self.rejected,
+                'completed': self.completed,
+                'failed': self.failed
+            }
+
+
+# 进程级全局任务管理器
+job_manager = JobManager(
+    max_workers=config.JOBS_MAX_WORKERS,
+    max_queue=config.JOBS_MAX_QUEUE,
+    result_ttl=config.JOBS_RESULT_TTL,
+    state_dir=config.JOBS_STATE_DIR
+)
@@ -0,0 +1,62 @@
+"""
+布局分析
+将一张图片的检测框按位置分成行（row）和行内连续的牌组（group，手牌 / 副露 / 牌河中的一段），
+结果按阅读顺序（从上到下、从左到右）排列
+
+行和牌组都用扫描线求得：框按中心 y 排序后顺次扫描，与上一个框的中心距离超过
+行容差（中位牌高的比例）时开始新行；行内按 x1 排序，与前一张牌的间隙超过
+组间隙（中位牌宽的比例）时开始新组。全部为排序 + 相邻比较，复杂度 O(n log n)
+"""
+
+import numpy as np
+
+import config
+import metrics
+from detections import Detections
+
+
+def compute_layout(boxes: np.ndarray, row_tolerance: float = None, group_gap: float = None) -> tuple:
+    """
+    计算检测框的行和牌组
+
+    Args:
+        boxes: (N, 6) 检测结果 [x1, y1, x2, y2, conf, cls]
+        row_tolerance: 相邻两个框中心 y 的最大距离（中位牌高的比例），默认取配置 MAHJONG_LAYOUT_ROW_TOLERANCE
+        group_gap: 同一组内相邻两张牌的最大间隙（中位牌宽的比例），默认取配置 MAHJONG_LAYOUT_GROUP_GAP
+
+    Returns:
+        (order, rows, groups)：阅读顺序的下标，以及按该顺序排列的行号和组号（均从 0 开始）
+    """
+    row_tolerance = config.LAYOUT_ROW_TOLERANCE if row_tolerance is None else row_tolerance
+    group_gap = config.LAYOUT_GROUP_GAP if group_gap is None else group_gap
+
+    n = len(boxes)
+    if n == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    tile_height = max(float(np.median(y2 - y1)), 1.0)
+    tile_width = max(float(np.median(x2 - x1)), 1.0)
+
+    # 纵向扫描：按中心 y 排序，相邻中心距离超过容差处分行
+    center_y = (y1 + y2) * 0.5
+    by_y = np.argsort(center_y, kind='stable')
+    row_breaks = np.diff(center_y[by_y]) > row_tolerance * tile_height
+    row_of = np.empty(n, dtype=np.int64)
+    row_of[by_y] = np.concatenate(([0], np.cumsum(row_breaks)))
+
+    # 横向扫描：行内按 x1 排序，行号变化或间隙超过阈值处分组
+    order = np.lexsort((x1, row_of))
+    rows = row_of[order]
+    gaps = x1[order][1:] - x2[order][:-1]
+    group_breaks = (np.diff(rows) != 0) | (gaps > group_gap * tile_width)
+    groups = np.concatenate(([0], np.cumsum(group_breaks)))
+    return order, rows, groups
+
+
+def apply_layout(detections: Detections) -> Detections:
+    """按阅读顺序重新排列检测结果，并附带行号和组号"""
+    with metrics.stage('layout'):
+        order, rows, groups = compute_layout(detections.boxes)
+        return Detections(detections.boxes[order], rows=rows, groups=groups)
@@ -9,21 +9,36 @@
 import argparse
 import sys
 import os
-import json
+import glob
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
 from pathlib import Path
-from ultralytics import YOLO
 import cv2
+import numpy as np
 
-# 类别名称映射
-CLASS_NAMES = [
-    '一饼', '二饼', '三饼', '四饼', '五饼', '六饼', '七饼', '八饼', '九饼',
-    '一条', '二条', '三条', '四条', '五条', '六条', '七条', '八条', '九条',
-    '一万', '二万', '三万', '四万', '五万', '六万', '七万', '八万', '九万',
-    '东风', '南风', '西风', '北风', '红中', '发财', '白板'
-]
+import config
+import metrics
+import admission
+from batch_scheduler import BatchScheduler
+from model_registry import registry
+from detections import CLASS_NAMES, Detections, dumps
+from preprocess import PreparedImage, prepare_image, thread_buffers
+from slicing import slice_windows, should_slice, merge_detections
+from layout import apply_layout
+from render import save_rendered
 
 def get_model_path():
-    """获取模型文件路径，支持相对路径和绝对路径"""
+    """获取模型文件路径：优先使用模型清单（MAHJONG_MODEL_MANIFEST）中的默认模型，其次依次尝试常见位置"""
+    from model_manifest import manifest
+    current = manifest.current()
+    default_path = current.models[current.default].path
+    if os.path.exists(default_path):
+        return default_path
+
     # 尝试多个可能的模型路径
     possible_paths = [
         'mj-train/runs/train3/weights/best.pt',
@@ -38,26 +53,251 @@ def get_model_path():
     # 如果都找不到，返回默认路径
     return 'mj-train/runs/train3/weights/best.pt'
 
-def predict_mahjong(image_path: str, model_path: str = None, conf_threshold: float = 0.1, 
-                   save_result: bool = False, output_dir: str = 'run/predict') -> list:
+def format_detections(box_data) -> list:
+    """将单张图片的推理结果转换为检测结果字典列表"""
+    # 边界框数据 [x1, y1, x2, y2, conf, cls]
+    return Detections(box_data).records()
+
+def finish_detections(boxes) -> Detections:
+    """单张图片的推理结果 -> Detections，启用布局分析时附带行号和组号"""
+    detections = Detections(boxes)
+    if config.LAYOUT_ENABLED:
+        detections = apply_layout(detections)
+    return detections
+
+def predict_images(images: list, model_path: str, conf_threshold: float = 0.1,
+                   device: str = 'cpu', variant: str = None) -> list:
+    """
+    对多张已解码图片执行一次批量推理
+
+    Args:
+        images: BGR 图片数组或 PreparedImage（已 letterbox，结果会还原到原图坐标）列表
+        model_path: 模型文件路径
+        conf_threshold: 置信度阈值
+        device: 推理设备
+        variant: 模型精度变体（fp32 / int8），默认取配置 MAHJONG_MODEL_VARIANT
+
+    Returns:
+        与 images 等长的列表，每项为该图片的检测结果（Detections，启用布局分析时按阅读顺序排列）
+    """
+    # 获取模型（同一进程内只加载一次，文件变化时自动重新加载）
+    entry = registry.get(model_path, device, variant=variant)
+
+    results = entry.model.predict(
+        [image.image if isinstance(image, PreparedImage) else image for image in images],
+        conf_threshold=conf_threshold
+    )
+    results = [
+        image.restore(boxes) if isinstance(image, PreparedImage) else boxes
+        for image, boxes in zip(images, results)
+    ]
+
+    return [finish_detections(boxes) for boxes in results]
+
+def predict_sliced(image: np.ndarray, model_path: str, conf_threshold: float = 0.1, device: str = 'cpu',
+                   slice_size: int = None, overlap: float = None, include_full: bool = None,
+                   variant: str = None) -> list:
+    """
+    切片推理：将大图切成互相重叠的切片批量推理，跨切片 NMS 合并后返回原图坐标下的检测结果
+
+    Args:
+        image: BGR 图片数组（全分辨率）
+        model_path: 模型文件路径
+        conf_threshold: 置信度阈值
+        device: 推理设备
+        slice_size: 切片边长，默认取配置 MAHJONG_SLICE_SIZE
+        overlap: 相邻切片重叠比例，默认取配置 MAHJONG_SLICE_OVERLAP
+        include_full: 是否同时推理整张图片，默认取配置 MAHJONG_SLICE_INCLUDE_FULL
+        variant: 模型精度变体，默认取配置 MAHJONG_MODEL_VARIANT
+
+    Returns:
+        检测结果（Detections）
+    """
+    slice_size = slice_size or config.SLICE_SIZE
+    overlap = config.SLICE_OVERLAP if overlap is None else overlap
+    include_full = config.SLICE_INCLUDE_FULL if include_full is None else include_full
+
+    height, width = image.shape[:2]
+    windows = slice_windows(width, height, slice_size, overlap)
+    if include_full and len(windows) > 1:
+        windows.append((0, 0, width, height))
+    crops = [np.ascontiguousarray(image[y1:y2, x1:x2]) for x1, y1, x2, y2 in windows]
+
+    entry = registry.get(model_path, device, variant=variant)
+    batch_size = max(1, config.SLICE_BATCH_SIZE)
+    results = []
+    for start in range(0, len(crops), batch_size):
+        results.extend(entry.model.predict(crops[start:start + batch_size], conf_threshold=conf_threshold))
+
+    with metrics.stage('slice_merge'):
+        boxes = merge_detections(results, windows, width, height, config.SLICE_NMS_THRESHOLD)
+    return finish_detections(boxes)
+
+# 每个 (模型, 精度变体, 置信度阈值, 设备) 组合共享一个微批调度器
+_batch_schedulers = {}
+_batch_schedulers_lock = threading.Lock()
+
+def get_batch_scheduler(model_path: str, conf_threshold: float = 0.1, device: str = 'cpu',
+                        max_batch_size: int = None, max_wait_ms: float = None,
+                        variant: str = None) -> BatchScheduler:
+    """获取（必要时创建）指定模型和阈值的微批调度器"""
+    key = (os.path.abspath(model_path), variant, float(conf_threshold), device)
+    with _batch_schedulers_lock:
+        scheduler = _batch_schedulers.get(key)
+        if scheduler is None:
+            scheduler = BatchScheduler(
+                partial(predict_images, model_path=model_path, conf_threshold=conf_threshold, device=device,
+                        variant=variant),
+                max_batch_size=max_batch_size if max_batch_size is not None else config.BATCH_MAX_SIZE,
+                max_wait_ms=max_wait_ms if max_wait_ms is not None else config.BATCH_MAX_WAIT_MS,
+                name=f"{os.path.basename(model_path)}@{conf_threshold}"
+            )
+            _batch_schedulers[key] = scheduler
+        return scheduler
+
+def batch_scheduler_stats() -> list:
+    """所有微批调度器的统计信息"""
+    with _batch_schedulers_lock:
+        schedulers = list(_batch_schedulers.values())
+    return [scheduler.stats() for scheduler in schedulers]
+
+def merge_batch_timings(futures: list):
+    """把微批调度器中执行的各批次耗时合并到当前请求（同一批次只合并一次，排队时间取最长）"""
+    if metrics.current_timings() is None:
+        return
+    batches = {id(f.timings): f.timings for f in futures if getattr(f, 'timings', None) is not None}
+    for timings in batches.values():
+        metrics.merge_timings(timings)
+    waits = [f.queue_wait for f in futures if hasattr(f, 'queue_wait')]
+    if waits:
+        metrics.merge_timings({'queue_wait': max(waits)})
+
+def wait_batch_results(futures: list) -> list:
+    """
+    在当前请求的截止时间内等待微批调度器的结果，并合并各批次耗时
+
+    超过截止时间或任一图片失败时取消其余尚未推理的图片
+    """
+    try:
+        results = [admission.wait_result(future) for future in futures]
+    except Exception:
+        for future in futures:
+            future.cancel()
+        raise
+    merge_batch_timings(futures)
+    return results
+
+def predict_many(images: list, model_path: str, conf_threshold: float = 0.1, device: str = 'cpu',
+                 batch_size: int = 8, use_batching: bool = False, variant: str = None) -> list:
+    """
+    识别多张已解码图片
+
+    Args:
+        images: BGR 图片数组列表
+        model_path: 模型文件路径
+        conf_threshold: 置信度阈值
+        device: 推理设备
+        batch_size: 不使用微批调度器时每批图片数
+        use_batching: 是否提交给微批调度器（与其他并发请求合并推理）
+        variant: 模型精度变体，默认取配置 MAHJONG_MODEL_VARIANT
+
+    Returns:
+        与 images 等长的列表，每项为该图片的检测结果（Detections）
+    """
+    if use_batching:
+        scheduler = get_batch_scheduler(model_path, conf_threshold, device, variant=variant)
+        deadline = admission.current_deadline()
+        return wait_batch_results([scheduler.submit(image, deadline) for image in images])
+
+    batch_size = max(1, batch_size)
+    results = []
+    for start in range(0, len(images), batch_size):
+        admission.check_deadline()
+        results.extend(predict_images(images[start:start + batch_size], model_path, conf_threshold, device,
+                                      variant=variant))
+    return results
+
+def decode_image(data) -> np.ndarray:
+    """
+    在内存中解码图片字节，不经过磁盘
+
+    Args:
+        data: 图片文件内容（bytes / bytearray / memoryview）
+
+    Returns:
+        BGR 图片数组，无法解码时返回 None
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if buffer.size == 0:
+        return None
+    with metrics.stage('decode'):
+        return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+
+def load_image(source) -> np.ndarray:
+    """
+    读取图片，支持文件路径、图片字节和已解码的数组
+
+    Args:
+        source: 图片路径（str / Path）、图片字节或 BGR 图片数组
+
+    Returns:
+        BGR 图片数组
+    """
+    if isinstance(source, np.ndarray):
+        return source
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        image = decode_image(source)
+        if image is None:
+            raise ValueError("无法解码图片数据")
+        return image
+
+    image_path = str(source)
+    if not os.path.exists(image_path):
+        raise FileNotFoundError(f"图片文件不存在: {image_path}")
+    with metrics.stage('decode'):
+        image = cv2.imread(image_path)
+    if image is None:
+        raise ValueError(f"无法读取图片: {image_path}")
+    return image
+
+def prepare_input(source, reuse_buffer: bool = False) -> PreparedImage:
+    """
+    按配置的模型输入尺寸解码并 letterbox 图片
+
+    Args:
+        source: 图片路径、图片字节或已解码的 BGR 数组
+        reuse_buffer: 使用当前线程的复用缓冲区（结果在本线程下一次调用前有效，只适用于同步识别单张图片；
+            提交给微批调度器的图片不能使用：请求超时放弃等待后，调度器可能仍在读取该缓冲区）
+    """
+    size = config.INFER_IMGSZ
+    return prepare_image(source, size, thread_buffers.get(size) if reuse_buffer else None)
+
+def predict_mahjong(image_path, model_path: str = None, conf_threshold: float = 0.1, 
+                   save_result: bool = False, output_dir: str = 'run/predict',
+                   device: str = 'cpu', use_batching: bool = False,
+                   image_name: str = None, preprocess: bool = None, slicing: str = None,
+                   variant: str = None) -> list:
     """
     预测麻将牌
     
     Args:
-        image_path: 输入图片路径
+        image_path: 输入图片，可以是图片路径、图片字节或已解码的 BGR 数组
         model_path: 模型文件路径
         conf_threshold: 置信度阈值
-        save_result: 是否保存结果图片
+        save_result: 是否保存结果图片（render.py 绘制，保存为 <输出目录>/<图片名>_result.jpg）
         output_dir: 输出目录
+        device: 推理设备
+        use_batching: 是否通过微批调度器与其他并发请求合并推理
+        image_name: 结果中记录的图片名称，默认为图片路径
+        preprocess: 是否先降采样解码并 letterbox（默认取配置 MAHJONG_PREPROCESS，保存结果图片时不使用）
+        slicing: 切片推理模式 off / on / auto（默认取配置 MAHJONG_SLICE_MODE）
+        variant: 模型精度变体，默认取配置 MAHJONG_MODEL_VARIANT
     
     Returns:
         识别结果列表
     """
     try:
-        # 检查图片文件是否存在
-        if not os.path.exists(image_path):
-            raise FileNotFoundError(f"图片文件不存在: {image_path}")
-        
         # 获取模型路径
         if model_path is None:
             model_path = get_model_path()
@@ -65,78 +305,166 @@ def predict_mahjong(image_path: str, model_path: str = None, conf_threshold: flo
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"模型文件不存在: {model_path}")
         
-        # 加载模型
-        print(f"正在加载模型: {model_path}")
-        model = YOLO(model_path)
-        
         # 读取图片
-        print(f"正在读取图片: {image_path}")
-        image = cv2.imread(image_path)
-        if image is None:
-            raise ValueError(f"无法读取图片: {image_path}")
+        if image_name is None:
+            image_name = str(image_path) if isinstance(image_path, (str, Path)) else '<memory>'
+        if preprocess is None:
+            preprocess = config.PREPROCESS_ENABLED
+        if slicing is None:
+            slicing = config.SLICE_MODE
+        sliced = False
+        if isinstance(image_path, PreparedImage):
+            image = image_path
+        elif slicing in ('on', 'auto'):
+            # 切片需要全分辨率图片；auto 模式下图片不够大时仍按整图推理
+            image = load_image(image_path)
+            height, width = image.shape[:2]
+            sliced = should_slice(width, height, slicing, config.SLICE_AUTO_MIN_SIZE)
+            if not sliced and preprocess and not save_result:
+                image = prepare_input(image, reuse_buffer=not use_batching)
+        elif preprocess and not save_result:
+            image = prepare_input(image_path, reuse_buffer=not use_batching)
+        else:
+            image = load_image(image_path)
         
         # 进行推理
-        print("正在进行推理...")
-        results = model.predict(
-            source=image,
-            save=save_result,
-            show=False,
-            conf=conf_threshold,
-            project=output_dir
-        )
+        if sliced:
+            admission.check_deadline()
+            detections = predict_sliced(image, model_path, conf_threshold, device, variant=variant)
+        elif use_batching:
+            scheduler = get_batch_scheduler(model_path, conf_threshold, device, variant=variant)
+            detections = wait_batch_results([scheduler.submit(image, admission.current_deadline())])[0]
+        else:
+            admission.check_deadline()
+            detections = predict_images(
+                [image],
+                model_path=model_path,
+                conf_threshold=conf_threshold,
+                device=device,
+                variant=variant
+            )[0]
         
-        # 处理结果
-        output = []
-        for result in results:
-            # 提取类别ID和边界框数据
-            cls_data = result.boxes.cls  # 类别ID
-            box_data = result.boxes.data  # 边界框数据 [x1, y1, x2, y2, conf, cls]
-            
-            # 转换为列表
-            cls_list = cls_data.tolist() if hasattr(cls_data, 'tolist') else cls_data
-            box_list = box_data.tolist() if hasattr(box_data, 'tolist') else box_data
-            
-            # 格式化输出
-            detections = []
-            for i, (cls_id, box) in enumerate(zip(cls_list, box_list)):
-                x1, y1, x2, y2, conf, cls = box
-                class_name = CLASS_NAMES[int(cls)] if int(cls) < len(CLASS_NAMES) else f"未知类别_{int(cls)}"
-                
-                detection = {
-                    'id': i + 1,
-                    'class_id': int(cls),
-                    'class_name': class_name,
-                    'confidence': float(conf),
-                    'bbox': {
-                        'x1': float(x1),
-                        'y1': float(y1),
-                        'x2': float(x2),
-                        'y2': float(y2),
-                        'width': float(x2 - x1),
-                        'height': float(y2 - y1)
-                    }
-                }
-                detections.append(detection)
-            
-            output.append({
-                'image_path': image_path,
-                'total_detections': len(detections),
-                'detections': detections
-            })
+        if save_result and isinstance(image, np.ndarray):
+            save_path = save_rendered(image, detections, output_dir, image_name or str(image_path))
+            print(f"结果图片已保存: {save_path}", file=sys.stderr)
         
-        return output
+        return [{
+            'image_path': image_name,
+            'total_detections': len(detections),
+            'detections': detections
+        }]
         
+    except admission.AdmissionError:
+        raise
     except Exception as e:
         print(f"预测过程中发生错误: {str(e)}", file=sys.stderr)
         return []
 
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+
+def expand_inputs(inputs: list):
+    """
+    展开输入：图片文件、目录（递归查找图片）、通配符，以及 @列表文件（每行一个路径）
+
+    Returns:
+        逐个产生图片路径的生成器
+    """
+    for item in inputs:
+        if item.startswith('@'):
+            with open(item[1:], 'r', encoding='utf-8') as f:
+                paths = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+            yield from expand_inputs(paths)
+        elif os.path.isdir(item):
+            for path in sorted(Path(item).rglob('*')):
+                if path.suffix.lower() in IMAGE_EXTENSIONS and path.is_file():
+                    yield str(path)
+        elif glob.has_magic(item):
+            for path in sorted(glob.glob(item, recursive=True)):
+                if os.path.isfile(path):
+                    yield path
+        else:
+            yield item
+
+def iter_decoded(paths, prefetch: int = 16, decode_workers: int = 2, preprocess: bool = False):
+    """
+    后台线程预读并解码图片，按输入顺序产生 (路径, 图片, 错误信息)
+
+    Args:
+        paths: 图片路径迭代器
+        prefetch: 最多提前解码的图片数
+        decode_workers: 解码线程数（cv2.imread 会释放 GIL）
+        preprocess: 是否降采样解码并 letterbox（产生 PreparedImage）
+    """
+    def decode(path):
+        try:
+            return path, prepare_input(path) if preprocess else load_image(path), None
+        except Exception as e:
+            return path, None, str(e)
+
+    window = deque()
+    with ThreadPoolExecutor(max_workers=max(1, decode_workers), thread_name_prefix='decode') as executor:
+        for path in paths:
+            window.append(executor.submit(decode, path))
+            if len(window) >= max(1, prefetch):
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+def predict_stream(paths, model_path: str, conf_threshold: float = 0.1, device: str = 'cpu',
+                   batch_size: int = 8, prefetch: int = 16, decode_workers: int = 2,
+                   save_result: bool = False, output_dir: str = 'run/predict', slicing: str = 'off'):
+    """
+    流式批量识别：预读解码 + 批量推理，逐张产生识别结果；
+    slicing 为 on / auto 时需要切片的图片单独切片推理，其余图片照常按批推理
+
+    Returns:
+        生成器，每项为一张图片的结果；无法读取或识别失败的图片包含 error 字段
+    """
+    batch_size = max(1, batch_size)
+    pending = []
+
+    def flush():
+        try:
+            detections_list = predict_images([image for _, image in pending], model_path, conf_threshold, device)
+        except Exception as e:
+            detections_list = [e] * len(pending)
+        for (path, image), detections in zip(pending, detections_list):
+            if isinstance(detections, Exception):
+                yield {'image_path': path, 'error': str(detections)}
+            else:
+                if save_result:
+                    save_rendered(image, detections, output_dir, path)
+                yield {'image_path': path, 'total_detections': len(detections), 'detections': detections}
+        pending.clear()
+
+    slicing_enabled = slicing in ('on', 'auto')
+    preprocess = config.PREPROCESS_ENABLED and not save_result and not slicing_enabled
+    for path, image, error in iter_decoded(paths, prefetch, decode_workers, preprocess):
+        if error is not None:
+            yield {'image_path': path, 'error': error}
+            continue
+        if slicing_enabled and should_slice(image.shape[1], image.shape[0], slicing, config.SLICE_AUTO_MIN_SIZE):
+            try:
+                detections = predict_sliced(image, model_path, conf_threshold, device)
+                if save_result:
+                    save_rendered(image, detections, output_dir, path)
+                yield {'image_path': path, 'total_detections': len(detections), 'detections': detections}
+            except Exception as e:
+                yield {'image_path': path, 'error': str(e)}
+            continue
+        pending.append((path, image))
+        if len(pending) >= batch_size:
+            yield from flush()
+    if pending:
+        yield from flush()
+
 def format_output(results: list, output_format: str = 'json', save_to_file: bool = False, output_dir: str = 'run/predict') -> str:
     """格式化输出结果"""
     if not results:
         return "未检测到任何麻将牌"
     
     if output_format == 'json':
-        output_str = json.dumps(results, ensure_ascii=False, indent=2)
+        output_str = dumps(results, indent=True)
     elif output_format == 'text':
         output_lines = []
         for result in results:
@@ -151,6 +479,7 @@ def format_output(results: list, output_format: str = 'json', save_to_file: bool
                     f"位置: ({bbox['x1']:.1f}, {bbox['y1']:.1f}) - "
                     f"({bbox['x2']:.1f}, {bbox['y2']:.1f}) "
                     f"尺寸: {bbox['width']:.1f}x{bbox['height']:.1f}"
+                    + (f" 行: {detection['row']} 组: {detection['group_id']}" if 'row' in detection else "")
                 )
             output_lines.append("")
         
@@ -178,12 +507,69 @@ def format_output(results: list, output_format: str = 'json', save_to_file: bool
         try:
             with open(filepath, 'w', encoding='utf-8') as f:
                 f.write(output_str)
-            print(f"\n结果已保存到: {filepath}")
+            print(f"结果已保存到: {filepath}", file=sys.stderr)
         except Exception as e:
-            print(f"保存文件失败: {e}")
+            print(f"保存文件失败: {e}", file=sys.stderr)
     
     return output_str
 
+def run_batch(args) -> int:
+    """批量模式：流式识别多张图片，jsonl 格式下每识别完一张就输出一行"""
+    log = sys.stderr if args.output_format == 'jsonl' else sys.stdout
+    stream_file = None
+    if args.output_format == 'jsonl' and args.save_results:
+        os.makedirs(args.output_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        stream_path = os.path.join(args.output_dir, f"mahjong_results_{timestamp}.jsonl")
+        stream_file = open(stream_path, 'w', encoding='utf-8')
+        if not args.quiet:
+            print(f"结果写入: {stream_path}", file=log)
+
+    collected = []
+    processed = failed = total_detections = 0
+    start = time.perf_counter()
+    try:
+        for result in predict_stream(
+            expand_inputs(args.inputs),
+            model_path=args.model,
+            conf_threshold=args.conf,
+            batch_size=args.batch_size,
+            prefetch=args.prefetch,
+            decode_workers=args.decode_workers,
+            save_result=args.save,
+            output_dir=args.output_dir,
+            slicing=args.slice
+        ):
+            if 'error' in result:
+                failed += 1
+                print(f"识别失败: {result['image_path']}: {result['error']}", file=sys.stderr)
+            else:
+                processed += 1
+                total_detections += result['total_detections']
+
+            if args.output_format == 'jsonl':
+                line = dumps(result)
+                print(line, flush=True)
+                if stream_file is not None:
+                    stream_file.write(line + '\n')
+                    stream_file.flush()
+            elif 'error' not in result:
+                collected.append(result)
+    finally:
+        if stream_file is not None:
+            stream_file.close()
+
+    if args.output_format != 'jsonl' and collected:
+        print(format_output(collected, args.output_format, args.save_results, args.output_dir))
+
+    elapsed = time.perf_counter() - start
+    if not args.quiet:
+        rate = processed / elapsed if elapsed > 0 else 0.0
+        print(f"\n检测完成！共处理 {processed} 张图片（失败 {failed} 张），"
+              f"识别出 {total_detections} 张麻将牌，耗时 {elapsed:.1f} 秒（{rate:.2f} 张/秒）", file=log)
+
+    return 0 if processed else 1
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(
@@ -195,15 +581,20 @@ def main():
   python mahjong_predictor.py image.jpg --model models/best.pt
   python mahjong_predictor.py image.jpg --model models/best.pt --conf 0.5 --output-format text
   python mahjong_predictor.py image.jpg --model models/best.pt --save
+  python mahjong_predictor.py photos/ --model models/best.pt --output-format jsonl > results.jsonl
+  python mahjong_predictor.py "photos/**/*.jpg" @more_images.txt --model models/best.pt -f jsonl --batch-size 16
+  python mahjong_predictor.py --video table.mp4 --model models/best.pt > events.jsonl
+  python mahjong_predictor.py --video 0 --model models/best.pt
         """
     )
     
-    parser.add_argument('image_path', help='输入图片路径')
+    parser.add_argument('inputs', nargs='*', metavar='image_path',
+                       help='输入图片路径，也可以是目录、通配符或 @列表文件（每行一个路径）')
     parser.add_argument('--model', '-m', required=True, help='模型文件路径 (必需)')
     parser.add_argument('--conf', '-c', type=float, default=0.1, 
                        help='置信度阈值 (默认: 0.1)')
-    parser.add_argument('--output-format', '-f', choices=['json', 'text'], 
-                       default='json', help='输出格式 (默认: json)')
+    parser.add_argument('--output-format', '-f', choices=['json', 'text', 'jsonl'], 
+                       default='json', help='输出格式，jsonl 为每张图片一行、边识别边输出 (默认: json)')
     parser.add_argument('--save', '-s', action='store_true', 
                        help='保存结果图片')
     parser.add_argument('--output-dir', '-o', default='run/predict', 
@@ -212,24 +603,65 @@ def main():
                        help='静默模式，只输出结果')
     parser.add_argument('--save-results', action='store_true', 
                        help='保存结果到文件')
+    parser.add_argument('--batch-size', '-b', type=int, default=8,
+                       help='批量模式下每批推理的图片数 (默认: 8)')
+    parser.add_argument('--prefetch', type=int, default=16,
+                       help='批量模式下提前解码的图片数 (默认: 16)')
+    parser.add_argument('--decode-workers', type=int, default=2,
+                       help='批量模式下的解码线程数 (默认: 2)')
+    parser.add_argument('--slice', choices=['off', 'on', 'auto'], default=config.SLICE_MODE,
+                       help=f'切片推理模式，auto 表示最长边不小于 {config.SLICE_AUTO_MIN_SIZE} 像素时切片 '
+                            f'(默认: {config.SLICE_MODE})')
+    
+    parser.add_argument('--video', metavar='SOURCE',
+                       help='视频模式：视频文件路径或摄像头编号，每个有变化的帧输出一行 JSON（新增 / 更新 / 移除的牌）')
+    parser.add_argument('--realtime', action='store_true',
+                       help='视频模式下按视频帧率读取，识别跟不上时丢弃积压的帧（摄像头始终如此）')
+    parser.add_argument('--diff-threshold', type=float, default=None,
+                       help=f'视频模式下跳过相似帧的差异阈值 (默认: {config.STREAM_DIFF_THRESHOLD})')
+    parser.add_argument('--emit-empty', action='store_true',
+                       help='视频模式下也输出没有变化的识别帧')
     
     args = parser.parse_args()
     
+    if args.video:
+        if not os.path.exists(args.model):
+            print(f"模型文件不存在: {args.model}", file=sys.stderr)
+            sys.exit(1)
+        from streaming import run_video
+        sys.exit(run_video(args))
+    if not args.inputs:
+        parser.error('需要指定输入图片或 --video')
+    
+    single_image = (
+        len(args.inputs) == 1
+        and args.output_format != 'jsonl'
+        and os.path.isfile(args.inputs[0])
+    )
+    log = sys.stderr if args.output_format == 'jsonl' else sys.stdout
+    
     if not args.quiet:
-        print("=== 麻将牌识别程序 ===")
-        print(f"输入图片: {args.image_path}")
-        print(f"模型文件: {args.model}")
-        print(f"置信度阈值: {args.conf}")
-        print(f"输出格式: {args.output_format}")
-        print()
+        print("=== 麻将牌识别程序 ===", file=log)
+        print(f"输入图片: {' '.join(args.inputs)}", file=log)
+        print(f"模型文件: {args.model}", file=log)
+        print(f"置信度阈值: {args.conf}", file=log)
+        print(f"输出格式: {args.output_format}", file=log)
+        print(file=log)
+    
+    if not single_image:
+        if not os.path.exists(args.model):
+            print(f"模型文件不存在: {args.model}", file=sys.stderr)
+            sys.exit(1)
+        sys.exit(run_batch(args))
     
     # 执行预测
     results = predict_mahjong(
-        image_path=args.image_path,
+        image_path=args.inputs[0],
         model_path=args.model,
         conf_threshold=args.conf,
         save_result=args.save,
-        output_dir=args.output_dir
+        output_dir=args.output_dir,
+        slicing=args.slice
     )
     
     # 输出结果
@@ -240,7 +672,7 @@ def main():
         if not args.quiet:
             print(f"\n检测完成！共识别出 {sum(r['total_detections'] for r in results)} 张麻将牌")
     else:
-        print("未检测到任何麻将牌")
+        print("未检测到任何麻将牌", file=sys.stderr)
         sys.exit(1)
 
 if __name__ == '__main__':
@@ -0,0 +1,379 @@
+"""
+服务指标
+低开销的计数器 / 仪表 / 直方图，按 Prometheus 文本格式导出；
+stage() 记录各处理阶段耗时，同时写入当前请求的耗时明细（调试用）
+"""
+
+import os
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# 阶段耗时直方图的桶边界（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> list:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self) -> list:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(_Metric):
+    """可增可减的仪表，也可以在导出时通过回调取值"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), callback=None):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+        # 回调返回数值，或 {标签值元组: 数值}
+        self._callback = callback
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def _render_samples(self) -> list:
+        if self._callback is not None:
+            try:
+                values = self._callback()
+            except Exception:
+                return []
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(v)}"
+            for key, v in sorted(values.items())
+        ]
+
+
+class CallbackCounter(Gauge):
+    """导出时通过回调取值的计数器（用于已有统计信息的组件）"""
+
+    kind = 'counter'
+
+
+class Histogram(_Metric):
+    """固定桶边界的直方图"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _render_samples(self) -> list:
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.label_names, key, f'le="{_format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _format_labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {count}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics = []
+        self._names = set()
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._names:
+                raise ValueError(f"Duplicate metric: {metric.name}")
+            self._names.add(metric.name)
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'mahjong_stage_seconds', 'Time spent in each processing stage', labels=('stage',)
+))
+REQUESTS_TOTAL = REGISTRY.register(Counter(
+    'mahjong_http_requests_total', 'HTTP requests by endpoint and status', labels=('endpoint', 'status')
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'mahjong_http_request_seconds', 'HTTP request latency by endpoint', labels=('endpoint',)
+))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    'mahjong_http_requests_in_flight', 'HTTP requests currently being handled', labels=('endpoint',)
+))
+STREAM_FRAMES = REGISTRY.register(Counter(
+    'mahjong_stream_frames_total', 'Video stream frames by outcome (processed, skipped, dropped)', labels=('result',)
+))
+STARTUP_PHASE_SECONDS = REGISTRY.register(Gauge(
+    'mahjong_startup_phase_seconds', 'Duration of each startup phase of this worker', labels=('phase',)
+))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    'mahjong_admission_rejected_total', 'Requests rejected by admission control (queue_full, wait_timeout, too_large)',
+    labels=('reason',)
+))
+MODEL_IMAGES = REGISTRY.register(Counter(
+    'mahjong_model_images_total', 'Images inferred by each manifest model', labels=('model',)
+))
+MODEL_DETECTIONS = REGISTRY.register(Counter(
+    'mahjong_model_detections_total', 'Tiles detected by each manifest model', labels=('model',)
+))
+MODEL_ERRORS = REGISTRY.register(Counter(
+    'mahjong_model_errors_total', 'Failed inference calls by manifest model', labels=('model',)
+))
+MODEL_SECONDS = REGISTRY.register(Histogram(
+    'mahjong_model_inference_seconds', 'Inference latency (including batching queue) by manifest model',
+    labels=('model',)
+))
+DEADLINE_EXCEEDED = REGISTRY.register(Counter(
+    'mahjong_deadline_exceeded_total', 'Requests that ran past their deadline by stage (queue, inference)',
+    labels=('stage',)
+))
+
+
+def process_rss_bytes() -> int:
+    """当前进程常驻内存（字节）"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        import resource
+        # 非 Linux 平台只能取峰值常驻内存（macOS 单位为字节，其他为 KB）
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def peak_rss_bytes() -> int:
+    """当前进程峰值常驻内存（字节）
+
+    优先读取 /proc/self/status 的 VmHWM：getrusage 的 ru_maxrss 在 fork + exec 后会保留父进程的峰值，
+    子进程中测得的数值不可靠
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+REGISTRY.register(Gauge('mahjong_process_resident_memory_bytes', 'Resident memory of this worker process',
+                        callback=process_rss_bytes))
+
+
+# 当前请求的阶段耗时明细（仅在调试请求中启用）
+_timings = contextvars.ContextVar('mahjong_timings', default=None)
+
+
+def start_timings():
+    """开始收集当前上下文的阶段耗时明细，返回用于 stop_timings 的令牌"""
+    return _timings.set({})
+
+
+def stop_timings(token):
+    _timings.reset(token)
+
+
+def current_timings() -> dict:
+    """当前上下文收集到的阶段耗时（秒），未启用时返回 None"""
+    return _timings.get()
+
+
+def record_stage(name: str, seconds: float, timings: dict = None):
+    """记录一次阶段耗时：写入直方图，并累加到当前请求的耗时明细"""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    if timings is None:
+        timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def merge_timings(timings: dict):
+    """把其他线程（如微批调度器）收集的耗时合并到当前请求，不重复写入直方图"""
+    current = _timings.get()
+    if current is None or not timings:
+        return
+    for name, seconds in timings.items():
+        current[name] = current.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    """统计代码块耗时"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def _queue_depths() -> dict:
+    from mahjong_predictor import batch_scheduler_stats
+    from jobs import job_manager
+    return {
+        ('batch_scheduler',): sum(s['queue_depth'] for s in batch_scheduler_stats()),
+        ('jobs',): job_manager.queue_depth()
+    }
+
+
+def _result_cache_stat(name: str):
+    def read():
+        from result_cache import get_result_cache
+        cache = get_result_cache()
+        return cache.stats()[name] if cache is not None else 0
+    return read
+
+
+def _result_store_stat(name: str):
+    def read():
+        # 未生成过结果图片时不创建存储
+        import result_store
+        store = result_store._result_store
+        return store.stats()[name] if store is not None else 0
+    return read
+
+
+def _model_registry_stat(name: str):
+    def read():
+        from model_registry import registry
+        return registry.stats()[name]
+    return read
+
+
+def _admission_state() -> dict:
+    from admission import controller
+    stats = controller.stats()
+    return {('in_flight',): stats['in_flight'], ('waiting',): stats['waiting']}
+
+
+def _ready() -> int:
+    from startup import startup
+    return int(startup.ready)
+
+
+REGISTRY.register(Gauge('mahjong_queue_depth', 'Images or jobs waiting to be processed', labels=('queue',),
+                        callback=_queue_depths))
+REGISTRY.register(CallbackCounter('mahjong_result_cache_hits_total', 'Result cache hits',
+                                  callback=_result_cache_stat('hits')))
+REGISTRY.register(CallbackCounter('mahjong_result_cache_misses_total', 'Result cache misses',
+                                  callback=_result_cache_stat('misses')))
+REGISTRY.register(Gauge('mahjong_result_cache_hit_ratio', 'Result cache hit ratio since start',
+                        callback=_result_cache_stat('hit_rate')))
+REGISTRY.register(Gauge('mahjong_result_cache_entries', 'Entries in the in-memory result cache',
+                        callback=_result_cache_stat('entries')))
+REGISTRY.register(CallbackCounter('mahjong_result_images_rendered_total', 'Result images rendered and stored',
+                                  callback=_result_store_stat('writes')))
+REGISTRY.register(CallbackCounter('mahjong_result_images_evicted_total', 'Result images evicted by the size limit',
+                                  callback=_result_store_stat('evictions')))
+REGISTRY.register(Gauge('mahjong_result_images_bytes', 'Total size of stored result images',
+                        callback=_result_store_stat('bytes')))
+REGISTRY.register(CallbackCounter('mahjong_model_loads_total', 'Model loads (including reloads)',
+                                  callback=_model_registry_stat('loads')))
+REGISTRY.register(Gauge('mahjong_admission_requests', 'Requests admitted (in_flight) or waiting for admission',
+                        labels=('state',), callback=_admission_state))
+REGISTRY.register(Gauge('mahjong_ready', 'Whether this worker finished startup and model warm-up',
+                        callback=_ready))
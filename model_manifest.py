@@ -0,0 +1,378 @@
+"""
+模型清单：多个命名模型、按比例分流和热切换
+
+清单为 JSON 文件（MAHJONG_MODEL_MANIFEST，默认 models.json），列出各模型的权重文件、置信度阈值、
+精度变体和分流权重：
+
+    {
+      "default": "train3",
+      "models": {
+        "train3": {"path": "best.pt", "conf": 0.1, "weight": 90},
+        "train4": {"path": "models/train4.pt", "conf": 0.15, "variant": "int8", "weight": 10}
+      }
+    }
+
+请求通过 model 参数指定模型，未指定时按权重随机分流（权重都为 0 时使用 default）。
+清单文件变化后在后台线程中加载并预热新的模型，完成后一次性切换；请求开始时取得当时的清单快照，
+处理过程中始终使用同一个模型，切换不影响进行中的请求，旧清单独有的模型在使用它的请求全部结束后卸载。
+清单文件不存在时只有一个由 MAHJONG_MODEL_PATH / MAHJONG_CONF_THRESHOLD / MAHJONG_MODEL_VARIANT 定义的 default 模型
+"""
+
+import os
+import json
+import random
+import functools
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = 'default'
+# 每个模型保留最近多少次推理的延迟用于计算分位数
+LATENCY_WINDOW = 1000
+
+
+class UnknownModel(ValueError):
+    """请求的模型不在清单中"""
+
+
+class ManifestError(ValueError):
+    """清单文件格式错误"""
+
+
+class ModelSpec:
+    """清单中的一个模型"""
+
+    __slots__ = ('name', 'path', 'conf', 'variant', 'weight')
+
+    def __init__(self, name: str, path: str, conf: float, variant: str, weight: float):
+        self.name = name
+        self.path = path
+        self.conf = conf
+        self.variant = variant
+        self.weight = weight
+
+    @property
+    def key(self) -> str:
+        """实际加载的模型文件（同一模型文件的不同阈值、回退到 FP32 的 int8 变体共用一个已加载模型）"""
+        from backends import resolve_variant
+        path = resolve_variant(self.path, self.variant) if os.path.exists(self.path) else self.path
+        return os.path.abspath(path)
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'path': self.path, 'conf': self.conf, 'variant': self.variant, 'weight': self.weight}
+
+
+class Manifest:
+    """清单快照（加载后不再修改），in_flight 为正在使用该快照的请求数"""
+
+    def __init__(self, models: dict, default: str, source: str = None, mtime: int = None):
+        self.models = models
+        self.default = default
+        self.source = source
+        self.mtime = mtime
+        self.loaded_at = time.time()
+        self.in_flight = 0
+        self._weighted = [spec for spec in models.values() if spec.weight > 0]
+        self._total_weight = sum(spec.weight for spec in self._weighted)
+
+    def select(self, name: str = None) -> ModelSpec:
+        """按名称取模型，未指定时按权重分流"""
+        if name:
+            spec = self.models.get(name)
+            if spec is None:
+                raise UnknownModel(f"Unknown model: {name}. Available: {', '.join(sorted(self.models))}")
+            return spec
+        if self._total_weight > 0:
+            point = random.uniform(0, self._total_weight)
+            for spec in self._weighted:
+                point -= spec.weight
+                if point <= 0:
+                    return spec
+            return self._weighted[-1]
+        return self.models[self.default]
+
+
+def parse_manifest(data: dict, base_dir: str = '.') -> tuple:
+    """
+    解析清单内容
+
+    Args:
+        data: 清单 JSON 对象
+        base_dir: 相对路径的基准目录（清单文件所在目录）
+
+    Returns:
+        ({名称: ModelSpec}, 默认模型名称)
+    """
+    entries = data.get('models') if isinstance(data, dict) else None
+    if not isinstance(entries, dict) or not entries:
+        raise ManifestError("Manifest must contain a non-empty 'models' object")
+
+    models = {}
+    for name, entry in entries.items():
+        if isinstance(entry, str):
+            entry = {'path': entry}
+        if not isinstance(entry, dict) or not entry.get('path'):
+            raise ManifestError(f"Model '{name}' must have a 'path'")
+        path = entry['path']
+        if not os.path.isabs(path):
+            path = os.path.normpath(os.path.join(base_dir, path))
+        try:
+            conf = float(entry.get('conf', config.CONF_THRESHOLD))
+            weight = float(entry.get('weight', 0))
+        except (TypeError, ValueError):
+            raise ManifestError(f"Model '{name}': conf and weight must be numbers")
+        if not 0 <= conf <= 1 or weight < 0:
+            raise ManifestError(f"Model '{name}': conf must be in [0, 1] and weight must not be negative")
+        variant = entry.get('variant', config.MODEL_VARIANT)
+        if variant not in ('fp32', 'int8'):
+            raise ManifestError(f"Model '{name}': unsupported variant {variant}")
+        models[name] = ModelSpec(name, path, conf, variant, weight)
+
+    default = data.get('default') or next(iter(models))
+    if default not in models:
+        raise ManifestError(f"Default model '{default}' is not in the manifest")
+    return models, default
+
+
+def implicit_manifest() -> Manifest:
+    """没有清单文件时由单模型配置构成的清单"""
+    spec = ModelSpec(DEFAULT_MODEL, config.MODEL_PATH, config.CONF_THRESHOLD, config.MODEL_VARIANT, 0)
+    return Manifest({DEFAULT_MODEL: spec}, DEFAULT_MODEL)
+
+
+class ModelStats:
+    """单个模型在本工作进程中的推理统计"""
+
+    def __init__(self):
+        self.requests = 0
+        self.images = 0
+        self.detections = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def snapshot(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(q):
+            return round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000.0, 2) if latencies else None
+
+        return {
+            'requests': self.requests,
+            'images': self.images,
+            'detections': self.detections,
+            'errors': self.errors,
+            'detections_per_image': round(self.detections / self.images, 2) if self.images else 0.0,
+            'latency_ms': {
+                'mean': round(sum(latencies) / len(latencies) * 1000.0, 2) if latencies else None,
+                'p50': percentile(0.5),
+                'p95': percentile(0.95)
+            }
+        }
+
+
+class ModelManifest:
+    """
+    进程级模型清单：监视清单文件，变化时在后台加载新模型后切换
+
+    Args:
+        path: 清单文件路径，不存在时使用单模型配置
+        poll_interval: 检查清单文件是否变化的最短间隔（秒）
+    """
+
+    def __init__(self, path: str = None, poll_interval: float = None):
+        self.path = config.MODEL_MANIFEST if path is None else path
+        self.poll_interval = config.MODEL_MANIFEST_POLL if poll_interval is None else poll_interval
+        self._lock = threading.Lock()
+        self._current = None
+        self._retired = []
+        self._checked_at = 0.0
+        self._reloading = False
+        self._failed_mtime = None
+        self._stats = {}
+        self.swaps = 0
+        self.last_error = None
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+
+    def _read(self) -> Manifest:
+        mtime = self._file_mtime()
+        if mtime is None:
+            return implicit_manifest()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        models, default = parse_manifest(data, os.path.dirname(os.path.abspath(self.path)))
+        return Manifest(models, default, source=self.path, mtime=mtime)
+
+    def current(self) -> Manifest:
+        """当前清单；清单文件变化时在后台加载新清单，加载完成前仍返回旧清单"""
+        manifest = self._current
+        if manifest is None:
+            with self._lock:
+                if self._current is None:
+                    self._current = self._read()
+                    self._checked_at = time.monotonic()
+                return self._current
+
+        now = time.monotonic()
+        if now - self._checked_at >= self.poll_interval:
+            with self._lock:
+                self._checked_at = now
+                mtime = self._file_mtime()
+                # 加载失败的文件不重复尝试，直到再次修改
+                changed = mtime != manifest.mtime and mtime != self._failed_mtime and not self._reloading
+                if changed:
+                    self._reloading = True
+            if changed:
+                threading.Thread(target=self._reload_in_background, name='model-manifest-reload',
+                                 daemon=True).start()
+        return manifest
+
+    def _reload_in_background(self):
+        try:
+            self.reload()
+        except Exception as e:
+            logger.error(f"Model manifest reload failed, keeping current models: {str(e)}")
+        finally:
+            with self._lock:
+                self._reloading = False
+
+    def reload(self, warmup: bool = True) -> Manifest:
+        """
+        重新读取清单文件，加载（并预热）新模型后切换
+
+        清单无效或模型加载失败时抛出异常，继续使用当前清单
+        """
+        mtime = self._file_mtime()
+        try:
+            manifest = self._read()
+            if warmup:
+                self.warmup(manifest)
+        except Exception as e:
+            self.last_error = str(e)
+            self._failed_mtime = mtime
+            raise
+        self.last_error = None
+        self._failed_mtime = None
+
+        with self._lock:
+            previous = self._current
+            self._current = manifest
+            if previous is not None:
+                self.swaps += 1
+                self._retired.append(previous)
+        logger.info(f"Model manifest loaded: {', '.join(sorted(manifest.models))} (default {manifest.default})")
+        self._unload_retired()
+        return manifest
+
+    def warmup(self, manifest: Manifest = None, run: bool = True):
+        """加载清单中的所有模型，run 为 True 时各执行一次推理"""
+        from model_registry import registry
+        manifest = manifest or self.current()
+        for key, spec in {spec.key: spec for spec in manifest.models.values()}.items():
+            if run:
+                registry.warmup(spec.path, config.MODEL_DEVICE, config.MODEL_WARMUP_SIZE, variant=spec.variant)
+            else:
+                registry.get(spec.path, config.MODEL_DEVICE, variant=spec.variant)
+
+    def _unload_retired(self):
+        """卸载已没有请求使用、且当前清单中不再存在的模型"""
+        from model_registry import registry
+        with self._lock:
+            idle = [m for m in self._retired if m.in_flight == 0]
+            if not idle:
+                return
+            self._retired = [m for m in self._retired if m.in_flight > 0]
+            keep = {spec.key for m in [self._current] + self._retired for spec in m.models.values()}
+            unload = {spec.key: spec for m in idle for spec in m.models.values() if spec.key not in keep}
+        for spec in unload.values():
+            if registry.unload(spec.path, variant=spec.variant):
+                logger.info(f"Model unloaded: {spec.name} ({spec.path})")
+
+    @contextmanager
+    def use(self, name: str = None):
+        """
+        选择本次请求使用的模型，处理期间保持对清单快照的引用
+
+        Raises:
+            UnknownModel: 指定的模型不在清单中
+        """
+        manifest = self.current()
+        spec = manifest.select(name)
+        with self._lock:
+            manifest.in_flight += 1
+        try:
+            yield spec
+        finally:
+            with self._lock:
+                manifest.in_flight -= 1
+                retired = manifest.in_flight == 0 and manifest in self._retired
+            if retired:
+                self._unload_retired()
+
+    def record(self, spec: ModelSpec, seconds: float, images: int = 1, detections: int = 0, error: bool = False):
+        """记录一次推理的延迟和检测数"""
+        with self._lock:
+            stats = self._stats.setdefault(spec.name, ModelStats())
+            stats.requests += 1
+            stats.images += images
+            stats.detections += detections
+            if error:
+                stats.errors += 1
+            else:
+                stats.latencies.append(seconds)
+        metrics.MODEL_IMAGES.inc(images, model=spec.name)
+        if error:
+            metrics.MODEL_ERRORS.inc(model=spec.name)
+        else:
+            metrics.MODEL_DETECTIONS.inc(detections, model=spec.name)
+            metrics.MODEL_SECONDS.observe(seconds, model=spec.name)
+
+    def stats(self) -> dict:
+        manifest = self.current()
+        with self._lock:
+            per_model = {name: s.snapshot() for name, s in self._stats.items()}
+            retired = len(self._retired)
+        return {
+            'source': manifest.source,
+            'default': manifest.default,
+            'loaded_at': manifest.loaded_at,
+            'swaps': self.swaps,
+            'retired_in_use': retired,
+            'last_error': self.last_error,
+            'models': [
+                dict(spec.to_dict(), stats=per_model.get(spec.name, ModelStats().snapshot()))
+                for spec in manifest.models.values()
+            ]
+        }
+
+
+# 进程级模型清单
+manifest = ModelManifest()
+
+
+def routed(view):
+    """
+    视图装饰器：按请求的 model 参数（查询参数或表单字段）或分流权重选择模型，保存在 flask.g.model_spec，
+    视图返回前保持对清单快照的引用；放在准入控制之后，读取表单字段时才接收请求体
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        from flask import g, request
+        # 表单字段随请求体一起解析，计入接收上传的耗时
+        with metrics.stage('upload'):
+            name = request.values.get('model')
+        with manifest.use(name) as spec:
+            g.model_spec = spec
+            return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,162 @@
+"""
+进程级模型注册表
+每个工作进程对同一模型只加载一次，按 (路径, 修改时间, 设备, 后端) 缓存，
+模型文件在磁盘上被替换后自动重新加载
+"""
+
+import os
+import threading
+import logging
+
+import numpy as np
+
+import config
+import metrics
+from backends import load_backend, resolve_backend, resolve_variant
+
+logger = logging.getLogger(__name__)
+
+
+class ModelEntry:
+    """已加载的推理后端及其元信息"""
+
+    def __init__(self, model, key):
+        self.model = model
+        self.key = key
+
+    @property
+    def path(self):
+        return self.key[0]
+
+    @property
+    def mtime(self):
+        return self.key[1]
+
+    @property
+    def device(self):
+        return self.key[2]
+
+    @property
+    def backend(self):
+        return self.key[3]
+
+
+class ModelRegistry:
+    """按路径缓存已加载模型的注册表"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.loads = 0
+        self.hits = 0
+        self.reloads = 0
+
+    def _make_key(self, model_path: str, device: str, backend: str) -> tuple:
+        path = os.path.abspath(model_path)
+        mtime = os.stat(path).st_mtime_ns
+        return (path, mtime, device, resolve_backend(path, backend))
+
+    def _load(self, key: tuple):
+        path, _, device, backend = key
+        logger.info(f"Loading model: {path} (device={device}, backend={backend})")
+        return load_backend(
+            path,
+            backend,
+            device,
+            imgsz=config.INFER_IMGSZ,
+            intra_op_threads=config.ORT_INTRA_OP_THREADS,
+            inter_op_threads=config.ORT_INTER_OP_THREADS
+        )
+
+    def get(self, model_path: str, device: str = 'cpu', backend: str = None, variant: str = None) -> ModelEntry:
+        """
+        获取已加载的模型，不存在或文件已变化时加载
+
+        Args:
+            model_path: 模型文件路径
+            device: 推理设备
+            backend: 推理后端（torch / onnx / openvino），默认取配置 MAHJONG_BACKEND
+            variant: 模型精度变体（fp32 / int8），默认取配置 MAHJONG_MODEL_VARIANT
+
+        Returns:
+            ModelEntry
+        """
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"模型文件不存在: {model_path}")
+        # int8 变体加载量化后的 ONNX 模型（按文件类型自动使用 onnx 后端）
+        model_path = resolve_variant(model_path, variant or config.MODEL_VARIANT)
+
+        key = self._make_key(model_path, device, backend or config.BACKEND)
+        slot = (key[0], device, key[3])
+
+        with self._lock:
+            entry = self._entries.get(slot)
+            if entry is not None and entry.key == key:
+                self.hits += 1
+                return entry
+            load_lock = self._load_locks.setdefault(slot, threading.Lock())
+
+        # 同一模型只允许一个线程加载，其余线程等待后直接复用
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(slot)
+                if entry is not None and entry.key == key:
+                    self.hits += 1
+                    return entry
+                reloading = entry is not None
+
+            with metrics.stage('model_load'):
+                model = self._load(key)
+            entry = ModelEntry(model, key)
+
+            with self._lock:
+                self._entries[slot] = entry
+                self.loads += 1
+                if reloading:
+                    self.reloads += 1
+                    logger.info(f"Model file changed on disk, reloaded: {key[0]}")
+
+        return entry
+
+    def warmup(self, model_path: str, device: str = 'cpu', size: int = 640, backend: str = None,
+               variant: str = None) -> ModelEntry:
+        """加载模型并用空白图片执行一次推理，避免首个请求承担初始化开销"""
+        entry = self.get(model_path, device, backend, variant)
+        dummy = np.zeros((size, size, 3), dtype=np.uint8)
+        entry.model.predict([dummy])
+        logger.info(f"Model warmed up: {entry.path} ({entry.backend})")
+        return entry
+
+    def unload(self, model_path: str, variant: str = None) -> bool:
+        """卸载指定模型（所有设备和后端），返回是否有模型被卸载"""
+        if os.path.exists(model_path):
+            model_path = resolve_variant(model_path, variant or config.MODEL_VARIANT)
+        path = os.path.abspath(model_path)
+        with self._lock:
+            slots = [slot for slot in self._entries if slot[0] == path]
+            for slot in slots:
+                del self._entries[slot]
+        return bool(slots)
+
+    def clear(self):
+        """清空注册表（主要用于测试和热更新）"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """返回加载/命中计数及当前已加载模型"""
+        with self._lock:
+            return {
+                'loads': self.loads,
+                'hits': self.hits,
+                'reloads': self.reloads,
+                'models': [
+                    {'path': e.path, 'mtime': e.mtime, 'device': e.device, 'backend': e.backend}
+                    for e in self._entries.values()
+                ]
+            }
+
+
+# 进程级全局注册表
+registry = ModelRegistry()
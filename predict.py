@@ -1,21 +1,47 @@
 import os
 import json
+import time
 from pathlib import Path
-from mahjong_predictor import predict_mahjong
+import numpy as np
+import config
+import metrics
+from admission import AdmissionError, check_deadline
+from backends import resolve_backend, resolve_variant, weights_hash
+from mahjong_predictor import predict_mahjong, predict_many, predict_sliced, decode_image, prepare_input
+from model_manifest import manifest
+from preprocess import jpeg_dimensions
+from render import encode_jpeg, render_image, render_signature
+from result_cache import get_result_cache, hash_image_bytes, make_cache_key
+from result_store import ResultImageStore, get_result_store
+from slicing import should_slice
 
-def predict(image_path: str) -> dict:
+def model_version(model_path: str = None, variant: str = None) -> str:
+    """当前模型版本：实际加载的模型文件哈希 + 推理后端，模型文件不存在时返回 None"""
+    model_path = model_path or config.MODEL_PATH
+    if not os.path.exists(model_path):
+        return None
+    model_path = resolve_variant(model_path, variant or config.MODEL_VARIANT)
+    return f"{weights_hash(model_path)[:16]}-{resolve_backend(model_path, config.BACKEND)}"
+
+def predict(image_path, image_name: str = None, spec=None) -> dict:
     """
     使用YOLO模型进行麻将牌识别
     
     Args:
-        image_path: 输入图片路径
+        image_path: 输入图片路径，也可以是图片字节或已解码的图片数组
+        image_name: 结果中记录的图片名称（内存图片时使用）
+        spec: 使用的模型（model_manifest.ModelSpec），默认按模型清单分流
         
     Returns:
-        dict: 包含JSON结果和输出图片路径的字典
+        dict: 包含JSON结果和输出图片路径的字典，model 为使用的模型名称
     """
+    if spec is None:
+        with manifest.use() as spec:
+            return predict(image_path, image_name, spec)
+    
     try:
-        # 检查输入文件是否存在
-        if not os.path.exists(image_path):
+        # 检查输入文件是否存在（内存中的图片无需检查）
+        if isinstance(image_path, (str, Path)) and not os.path.exists(image_path):
             raise Exception(f"输入图片文件不存在: {image_path}")
         
         # 确保run目录存在
@@ -23,38 +49,260 @@ def predict(image_path: str) -> dict:
         run_dir.mkdir(exist_ok=True)
         
         # 检查模型文件是否存在
-        model_path = "best.pt"
+        model_path = spec.path
         if not os.path.exists(model_path):
             raise Exception(f"找不到模型文件: {model_path}")
         
-        # 使用YOLO模型进行预测（禁用图片保存以避免字体下载阻塞）
+        # 使用YOLO模型进行预测（不保存结果图片，/predict_image?render=1 时由 render.py 按需绘制）
+        start = time.perf_counter()
         results = predict_mahjong(
             image_path=image_path,
             model_path=model_path,
-            conf_threshold=0.1,
+            conf_threshold=spec.conf,
             save_result=False,  # 禁用图片保存
-            output_dir="run/predict"
+            output_dir="run/predict",
+            device=config.MODEL_DEVICE,
+            use_batching=config.BATCH_ENABLED,
+            image_name=image_name,
+            variant=spec.variant
         )
+        total = sum(r['total_detections'] for r in results)
+        manifest.record(spec, time.perf_counter() - start, detections=total, error=not results)
         
         if not results:
             return {
                 "success": True,
                 "json_result": [],
                 "output_image_path": None,
-                "message": "未检测到任何麻将牌"
+                "message": "未检测到任何麻将牌",
+                "model": spec.name
             }
         
         return {
             "success": True,
             "json_result": results,
             "output_image_path": None,  # 不再生成输出图片
-            "message": f"成功识别出 {sum(r['total_detections'] for r in results)} 张麻将牌"
+            "message": f"成功识别出 {total} 张麻将牌",
+            "model": spec.name
         }
         
+    except AdmissionError:
+        raise
     except Exception as e:
         return {
             "success": False,
             "error": str(e),
             "json_result": None,
-            "output_image_path": None
-        }
\ No newline at end of file
+            "output_image_path": None,
+            "model": spec.name
+        }
+
+def decode_upload(data, reuse_buffer: bool = False, allow_slicing: bool = False):
+    """
+    解码上传的图片：启用前处理时降采样解码并 letterbox，无法解码时返回 None
+
+    allow_slicing 为 True 且图片可能需要切片推理时按全分辨率解码（由 predict_mahjong 决定是否切片）
+    """
+    if allow_slicing and config.SLICE_MODE in ('on', 'auto'):
+        dims = jpeg_dimensions(data)
+        if dims is None or should_slice(dims[0], dims[1], config.SLICE_MODE, config.SLICE_AUTO_MIN_SIZE):
+            return decode_image(data)
+    if not config.PREPROCESS_ENABLED:
+        return decode_image(data)
+    try:
+        return prepare_input(data, reuse_buffer=reuse_buffer)
+    except ValueError:
+        return None
+
+def result_key(data, spec=None, extra: str = None, image_hash: str = None) -> str:
+    """
+    上传图片在指定模型下的结果键：图片内容哈希 + 模型版本（含切片、布局参数）+ 置信度阈值，模型不存在时返回 None
+
+    Args:
+        extra: 附加到模型版本中的参数（如结果图片的绘制参数）
+        image_hash: 已计算的图片内容哈希，None 时按 data 计算
+    """
+    spec = spec or manifest.current().select()
+    version = model_version(spec.path, spec.variant)
+    if version is None:
+        return None
+    if config.SLICE_MODE in ('on', 'auto'):
+        # 切片推理的结果与整图推理不同，切片参数也计入缓存键
+        version = (f"{version}-slice:{config.SLICE_MODE}:{config.SLICE_SIZE}:{config.SLICE_OVERLAP}:"
+                   f"{config.SLICE_AUTO_MIN_SIZE}:{config.SLICE_INCLUDE_FULL}")
+    if config.LAYOUT_ENABLED:
+        # 布局分析改变结果的顺序和字段
+        version = f"{version}-layout:{config.LAYOUT_ROW_TOLERANCE}:{config.LAYOUT_GROUP_GAP}"
+    if extra:
+        version = f"{version}-{extra}"
+    return make_cache_key(image_hash or hash_image_bytes(data), version, spec.conf)
+
+def upload_cache_key(data, spec=None, image_hash: str = None) -> str:
+    """上传图片在指定模型下的结果缓存键（同时用作 ETag），未启用缓存或模型不存在时返回 None"""
+    if get_result_cache() is None:
+        return None
+    return result_key(data, spec, image_hash=image_hash)
+
+def result_image_name(data, spec=None, image_hash: str = None) -> str:
+    """上传图片的结果图片在存储中的文件名（内容寻址，与绘制参数有关），模型不存在时返回 None"""
+    key = result_key(data, spec, extra=f"render:{render_signature()}", image_hash=image_hash)
+    return ResultImageStore.name_for(key) if key is not None else None
+
+def render_upload(data, json_result, name: str) -> bool:
+    """
+    把识别结果画在上传图片上并存入结果图片存储，存储中已有该图片时直接复用
+
+    Args:
+        data: 图片文件内容
+        json_result: 识别结果（predict_upload 返回的 json_result）
+        name: 结果图片文件名（result_image_name）
+
+    Returns:
+        结果图片是否可用（图片无法解码时为 False）
+    """
+    store = get_result_store()
+    if store.contains(name):
+        return True
+    detections = json_result[0]['detections'] if json_result else []
+    with metrics.stage('render'):
+        image = render_image(data, detections)
+        if image is None:
+            return False
+        store.put(name, encode_jpeg(image))
+    return True
+
+def predict_upload(data, image_name: str = None, cache_key: str = None, spec=None) -> dict:
+    """
+    识别上传的图片字节：先查结果缓存，未命中时在内存中解码并识别
+
+    Args:
+        data: 图片文件内容
+        image_name: 结果中记录的图片名称
+        cache_key: 结果缓存键，None 时按图片内容计算
+        spec: 使用的模型（model_manifest.ModelSpec），默认按模型清单分流
+
+    Returns:
+        dict: 与 predict 相同的结果，另含 cache_key、cache_hit 和 model
+
+    Raises:
+        ValueError: 图片无法解码
+    """
+    if spec is None:
+        with manifest.use() as spec:
+            return predict_upload(data, image_name, cache_key, spec)
+
+    cache = get_result_cache()
+    if cache_key is None:
+        cache_key = upload_cache_key(data, spec)
+
+    if cache is not None and cache_key is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return dict(cached, success=True, cache_key=cache_key, cache_hit=True, model=spec.name)
+
+    # 直接从字节缓冲区解码，不经过磁盘
+    # 经过微批调度器时每个请求使用独立的缓冲区（超时返回后调度器可能仍在读取）
+    image = decode_upload(data, reuse_buffer=not config.BATCH_ENABLED, allow_slicing=True)
+    if image is None:
+        raise ValueError("Invalid image data")
+
+    result = predict(image, image_name=image_name, spec=spec)
+    if not result['success']:
+        return dict(result, cache_key=cache_key, cache_hit=False)
+
+    cached = {
+        'json_result': result['json_result'],
+        'message': result.get('message', 'Prediction completed')
+    }
+    # predict_mahjong 出错时返回空的 json_result，不缓存，避免把偶发错误缓存下来；
+    # 识别成功但没有检出牌的图片（json_result 中 total_detections 为 0）同样缓存
+    if cache is not None and cache_key is not None and result['json_result']:
+        cache.put(cache_key, cached)
+
+    return dict(cached, success=True, cache_key=cache_key, cache_hit=False, model=spec.name)
+
+def predict_uploads(uploads: list, spec=None) -> list:
+    """
+    批量识别多张上传图片：逐张查结果缓存，未命中的图片合并推理；
+    启用切片推理时需要切片的图片单独切片推理（与 predict_upload 一致，结果缓存键中包含切片参数）
+
+    Args:
+        uploads: [(图片文件内容, 图片名称), ...]
+        spec: 使用的模型（model_manifest.ModelSpec），默认按模型清单分流（整批使用同一个模型）
+
+    Returns:
+        与 uploads 顺序一致的结果列表，每项包含 image_path、success，
+        成功时包含 total_detections、detections 和 cache_hit，失败时包含 error
+    """
+    if spec is None:
+        with manifest.use() as spec:
+            return predict_uploads(uploads, spec)
+
+    cache = get_result_cache()
+    results = [None] * len(uploads)
+    pending = []
+    sliced = []
+
+    for index, (data, image_name) in enumerate(uploads):
+        cache_key = upload_cache_key(data, spec)
+        cached = cache.get(cache_key) if cache is not None and cache_key is not None else None
+        if cached is not None:
+            result = cached['json_result'][0] if cached['json_result'] else {'total_detections': 0, 'detections': []}
+            results[index] = dict(result, image_path=image_name, success=True, cache_hit=True)
+            continue
+
+        image = decode_upload(data, allow_slicing=True)
+        if image is None:
+            results[index] = {'image_path': image_name, 'success': False, 'error': 'Invalid image data'}
+            continue
+        if isinstance(image, np.ndarray) and config.SLICE_MODE in ('on', 'auto'):
+            # 按全分辨率解码的图片：需要切片时单独切片推理，否则照常 letterbox 后合并推理
+            height, width = image.shape[:2]
+            if should_slice(width, height, config.SLICE_MODE, config.SLICE_AUTO_MIN_SIZE):
+                sliced.append((index, image, cache_key))
+                continue
+            if config.PREPROCESS_ENABLED:
+                image = prepare_input(image)
+        pending.append((index, image, cache_key))
+
+    if pending or sliced:
+        model_path = spec.path
+        start = time.perf_counter()
+        try:
+            if not os.path.exists(model_path):
+                raise Exception(f"找不到模型文件: {model_path}")
+            detections_list = predict_many(
+                [image for _, image, _ in pending],
+                model_path=model_path,
+                conf_threshold=spec.conf,
+                device=config.MODEL_DEVICE,
+                batch_size=config.BATCH_MAX_SIZE,
+                use_batching=config.BATCH_ENABLED,
+                variant=spec.variant
+            ) if pending else []
+            for _, image, _ in sliced:
+                check_deadline()
+                detections_list.append(predict_sliced(image, model_path, spec.conf, config.MODEL_DEVICE,
+                                                      variant=spec.variant))
+        except AdmissionError:
+            raise
+        except Exception as e:
+            manifest.record(spec, time.perf_counter() - start, images=len(pending) + len(sliced), error=True)
+            for index, _, _ in pending + sliced:
+                results[index] = {'image_path': uploads[index][1], 'success': False, 'error': str(e)}
+            return results
+        manifest.record(spec, time.perf_counter() - start, images=len(pending) + len(sliced),
+                        detections=sum(len(d) for d in detections_list))
+
+        for (index, _, cache_key), detections in zip(pending + sliced, detections_list):
+            image_name = uploads[index][1]
+            result = {'image_path': image_name, 'total_detections': len(detections), 'detections': detections}
+            # 与 predict_upload 相同：缓存每张识别成功的图片（包括没有检出牌的），出错的图片在上面已返回
+            if cache is not None and cache_key is not None:
+                cache.put(cache_key, {
+                    'json_result': [result],
+                    'message': f"成功识别出 {len(detections)} 张麻将牌"
+                })
+            results[index] = dict(result, success=True, cache_hit=False)
+
+    return results
@@ -0,0 +1,211 @@
+"""
+推理前处理
+上传的手机照片通常远大于模型输入尺寸：JPEG 按接近模型输入的分辨率降采样解码
+（cv2.IMREAD_REDUCED_*，解码时跳过高频系数，耗时和内存都大幅减少），
+再 letterbox 到预先分配、按线程复用的缓冲区中；推理得到的边界框通过
+PreparedImage.restore 还原到原图坐标
+"""
+
+import os
+import struct
+import threading
+
+import cv2
+import numpy as np
+
+import metrics
+
+# 降采样解码的倍数及对应的 imread 标志
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+# JPEG 中携带图片尺寸的 SOF 标记（排除 DHT / JPG / DAC）
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+PAD_VALUE = 114
+
+
+def jpeg_dimensions(data) -> tuple:
+    """从 JPEG 文件头读取 (宽, 高)，不是 JPEG 或文件头不完整时返回 None"""
+    data = memoryview(data)
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    offset = 2
+    size = len(data)
+    while offset + 4 <= size:
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        length = struct.unpack('>H', data[offset + 2:offset + 4])[0]
+        if marker in _SOF_MARKERS:
+            if offset + 9 > size:
+                return None
+            height, width = struct.unpack('>HH', data[offset + 5:offset + 9])
+            return (width, height) if width and height else None
+        if marker == 0xDA:
+            return None
+        offset += 2 + length
+    return None
+
+
+def reduction_factor(width: int, height: int, size: int) -> int:
+    """不低于模型输入尺寸前提下可用的最大降采样倍数（1 / 2 / 4 / 8）"""
+    longest = max(width, height)
+    for factor, _ in _REDUCED_FLAGS:
+        if -(-longest // factor) >= size:
+            return factor
+    return 1
+
+
+class PreparedImage:
+    """
+    letterbox 后的模型输入及还原到原图坐标所需的参数
+
+    Attributes:
+        image: letterbox 后的 BGR 图片（可能是线程复用缓冲区的视图）
+        ratio: (x 方向, y 方向) 原图到 letterbox 图的缩放比例
+        pad: (左侧填充, 顶部填充)
+        original_shape: 原图 (高, 宽)
+    """
+
+    __slots__ = ('image', 'ratio', 'pad', 'original_shape')
+
+    def __init__(self, image: np.ndarray, ratio: tuple, pad: tuple, original_shape: tuple):
+        self.image = image
+        self.ratio = ratio
+        self.pad = pad
+        self.original_shape = original_shape
+
+    def restore(self, boxes: np.ndarray) -> np.ndarray:
+        """将 (N, 6) 检测结果 [x1, y1, x2, y2, conf, cls] 的坐标还原到原图"""
+        if len(boxes) == 0:
+            return boxes
+        boxes = np.array(boxes, dtype=np.float32, copy=True)
+        (rx, ry), (left, top), (h, w) = self.ratio, self.pad, self.original_shape
+        boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - left) / rx).clip(0, w)
+        boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - top) / ry).clip(0, h)
+        return boxes
+
+
+class LetterboxBuffer:
+    """按线程复用的 letterbox 输出缓冲区，避免每个请求重新分配模型输入大小的数组"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get(self, size: int) -> np.ndarray:
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None or buffer.size < size * size * 3:
+            buffer = np.empty(size * size * 3, dtype=np.uint8)
+            self._local.buffer = buffer
+        return buffer
+
+
+thread_buffers = LetterboxBuffer()
+
+
+def decode_reduced(data, size: int) -> tuple:
+    """
+    按接近 size 的分辨率解码图片
+
+    Returns:
+        (BGR 图片, 原图 (高, 宽))，无法解码时图片为 None
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    if buffer.size == 0:
+        return None, None
+
+    flag = cv2.IMREAD_COLOR
+    dims = jpeg_dimensions(buffer)
+    if dims is not None:
+        factor = reduction_factor(dims[0], dims[1], size)
+        flag = dict(_REDUCED_FLAGS).get(factor, cv2.IMREAD_COLOR)
+
+    with metrics.stage('decode'):
+        image = cv2.imdecode(buffer, flag)
+    if image is None:
+        return None, None
+    if flag == cv2.IMREAD_COLOR:
+        return image, image.shape[:2]
+
+    # 解码时会按 EXIF 方向旋转，文件头中的尺寸需要对应交换
+    width, height = dims
+    decoded_h, decoded_w = image.shape[:2]
+    if (decoded_w > decoded_h) != (width > height) and width != height:
+        width, height = height, width
+    return image, (height, width)
+
+
+def letterbox_into(image: np.ndarray, size: int, buffer: np.ndarray = None, stride: int = 32) -> tuple:
+    """
+    等比缩放并填充到 stride 整数倍的最小矩形（与 ultralytics 单张推理一致），写入 buffer
+
+    Returns:
+        (letterbox 后的图片, 缩放比例, (左侧填充, 顶部填充))
+    """
+    h, w = image.shape[:2]
+    ratio = min(size / h, size / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    dw, dh = (size - new_w) % stride / 2, (size - new_h) % stride / 2
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    out_h, out_w = new_h + top + bottom, new_w + left + right
+
+    if buffer is None or buffer.size < out_h * out_w * 3:
+        out = np.empty((out_h, out_w, 3), dtype=np.uint8)
+    else:
+        out = buffer[:out_h * out_w * 3].reshape(out_h, out_w, 3)
+
+    if top or bottom or left or right:
+        out[:top] = PAD_VALUE
+        out[top + new_h:] = PAD_VALUE
+        out[top:top + new_h, :left] = PAD_VALUE
+        out[top:top + new_h, left + new_w:] = PAD_VALUE
+    target = out[top:top + new_h, left:left + new_w]
+    if (w, h) != (new_w, new_h):
+        cv2.resize(image, (new_w, new_h), dst=target, interpolation=cv2.INTER_LINEAR)
+    else:
+        target[...] = image
+    return out, ratio, (left, top)
+
+
+def prepare_image(source, size: int, buffer: np.ndarray = None) -> PreparedImage:
+    """
+    解码（如需要）并 letterbox 图片
+
+    Args:
+        source: 图片字节、图片路径或已解码的 BGR 数组
+        size: 模型输入尺寸
+        buffer: letterbox 输出缓冲区（如 thread_buffers.get(size)），None 时新分配；
+            使用复用缓冲区时，返回结果在同一线程下一次调用前有效
+
+    Returns:
+        PreparedImage
+
+    Raises:
+        ValueError: 图片无法解码
+        FileNotFoundError: 图片文件不存在
+    """
+    if isinstance(source, np.ndarray):
+        image, original_shape = source, source.shape[:2]
+    else:
+        if isinstance(source, (str, os.PathLike)):
+            if not os.path.exists(source):
+                raise FileNotFoundError(f"图片文件不存在: {source}")
+            source = np.fromfile(str(source), dtype=np.uint8)
+        image, original_shape = decode_reduced(source, size)
+        if image is None:
+            raise ValueError("Invalid image data")
+
+    with metrics.stage('letterbox'):
+        padded, ratio, pad = letterbox_into(image, size, buffer)
+    # 降采样解码后图片与原图的比例在两个方向上可能略有不同（解码尺寸向上取整）
+    decoded_h, decoded_w = image.shape[:2]
+    height, width = original_shape
+    scale = (ratio * decoded_w / width, ratio * decoded_h / height)
+    return PreparedImage(padded, scale, pad, (height, width))
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+INT8 模型量化与精度门槛
+将 .pt 权重导出为 ONNX 后用 ONNX Runtime 量化为 INT8（静态量化用样例图片校准，动态量化无需校准），
+再在评估图片上比较 INT8 与 FP32 模型的逐类别检测结果：mAP 下降超过阈值时拒绝该量化模型。
+最后分别在子进程中测量 PyTorch、FP32 ONNX 和 INT8 ONNX 模型的推理延迟和峰值内存
+
+通过校验的模型保存为 <权重名>.<权重哈希>.int8.onnx，报告保存在同名 .json 文件中，
+服务设置 MAHJONG_MODEL_VARIANT=int8 后通过同一模型加载路径使用该模型
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+import config
+from accuracy import DetectionEvaluator, load_yolo_dataset
+from backends import (OnnxBackend, export_model, letterbox, load_backend, quantization_report_path,
+                      quantized_model_path, weights_hash)
+from mahjong_predictor import IMAGE_EXTENSIONS, load_image
+
+
+def list_images(image_dir: str, limit: int = 0) -> list:
+    """目录下（递归）的图片路径，按文件名排序"""
+    paths = [str(p) for p in sorted(Path(image_dir).rglob('*')) if p.suffix.lower() in IMAGE_EXTENSIONS]
+    return paths[:limit] if limit else paths
+
+
+def calibration_reader(image_paths: list, input_name: str, imgsz: int):
+    """静态量化的校准数据：与推理相同的 letterbox + 归一化，每次提供一张图片"""
+    from onnxruntime.quantization import CalibrationDataReader
+
+    class ImageCalibrationReader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(image_paths)
+
+        def get_next(self):
+            for path in self._paths:
+                image = load_image(path)
+                if image is None:
+                    continue
+                padded, _, _ = letterbox(image, imgsz, auto=False)
+                blob = padded[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+                return {input_name: blob}
+            return None
+
+    return ImageCalibrationReader()
+
+
+def head_nodes(model_path: str) -> list:
+    """
+    检测头（最后一个模块）中除卷积以外的节点
+
+    框解码（DFL、sigmoid、坐标还原）对量化误差很敏感，这些节点保持浮点，只量化检测头中的卷积
+    """
+    import onnx
+
+    model = onnx.load(model_path)
+    prefixes = {node.name.split('/')[1] for node in model.graph.node if node.name.startswith('/model.')}
+    indices = [int(p.split('.')[1]) for p in prefixes if p.split('.')[-1].isdigit()]
+    if not indices:
+        return []
+    prefix = f'/model.{max(indices)}/'
+    return [node.name for node in model.graph.node if node.name.startswith(prefix) and node.op_type != 'Conv']
+
+
+def quantize(fp32_path: str, output_path: str, mode: str, calibration: list, imgsz: int,
+             per_channel: bool = True, quantize_head: bool = False):
+    """
+    量化 FP32 ONNX 模型
+
+    Args:
+        fp32_path: FP32 ONNX 模型
+        output_path: INT8 模型输出路径
+        mode: static（QDQ 格式，需要校准图片）/ dynamic（仅权重量化，推理时计算激活的量化参数）
+        calibration: 校准图片路径列表（静态量化）
+        imgsz: 输入尺寸
+        per_channel: 权重按输出通道量化
+        quantize_head: 是否量化检测头的框解码部分
+    """
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    exclude = [] if quantize_head else head_nodes(fp32_path)
+    work_dir = os.path.dirname(output_path)
+    prepared = os.path.join(work_dir, 'prepared.onnx')
+    # 量化前先做形状推断和图优化（融合 BN 等），量化参数才能覆盖到融合后的节点
+    quant_pre_process(fp32_path, prepared, skip_symbolic_shape=True)
+
+    if mode == 'dynamic':
+        quantize_dynamic(prepared, output_path, weight_type=QuantType.QInt8, per_channel=per_channel,
+                         nodes_to_exclude=exclude)
+        return
+
+    import onnx
+    input_name = onnx.load(prepared, load_external_data=False).graph.input[0].name
+    quantize_static(
+        prepared, output_path, calibration_reader(calibration, input_name, imgsz),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=per_channel,
+        nodes_to_exclude=exclude
+    )
+
+
+def evaluate(fp32_backend, int8_backend, samples: list, conf_threshold: float, iou_threshold: float) -> dict:
+    """
+    比较 FP32 与 INT8 模型的逐类别 AP
+
+    有标注时两个模型分别与标注比较，mAP 下降 = FP32 mAP - INT8 mAP；
+    没有标注时以 FP32 模型置信度不低于 conf_threshold 的检测结果作为参考答案
+    （此时 FP32 模型的 mAP 为 1），mAP 下降 = 1 - INT8 mAP
+
+    Args:
+        samples: [(名称, BGR 图片, 标注框或 None), ...]
+    """
+    fp32_eval = DetectionEvaluator(iou_threshold=iou_threshold)
+    int8_eval = DetectionEvaluator(iou_threshold=iou_threshold)
+    labeled = all(truth is not None for _, _, truth in samples)
+
+    # 低阈值保留完整的置信度排序，AP 才能反映召回率
+    eval_conf = min(0.001, conf_threshold)
+    for _, image, truth in samples:
+        fp32 = fp32_backend.predict([image], eval_conf)[0]
+        int8 = int8_backend.predict([image], eval_conf)[0]
+        if truth is None:
+            truth = fp32[fp32[:, 4] >= conf_threshold]
+        fp32_eval.add(truth, fp32)
+        int8_eval.add(truth, int8)
+
+    fp32_summary = fp32_eval.summary()
+    int8_summary = int8_eval.summary()
+    fp32_map = fp32_summary['map']
+    fp32_by_class = {c['class_id']: c for c in fp32_summary['per_class']}
+    per_class = []
+    for entry in int8_summary['per_class']:
+        if not entry['ground_truth']:
+            continue
+        reference = fp32_by_class.get(entry['class_id'], {})
+        fp32_ap = reference.get('ap', 0.0)
+        per_class.append({
+            'class_id': entry['class_id'],
+            'class_name': entry['class_name'],
+            'ground_truth': entry['ground_truth'],
+            'fp32_ap': fp32_ap,
+            'int8_ap': entry['ap'],
+            'ap_drop': fp32_ap - entry['ap'],
+            'int8_precision': entry['precision'],
+            'int8_recall': entry['recall']
+        })
+
+    return {
+        'images': len(samples),
+        'reference': 'labels' if labeled else 'fp32',
+        'reference_boxes': int(int8_eval.truth_counts.sum()),
+        'iou_threshold': iou_threshold,
+        'fp32_map': fp32_map,
+        'int8_map': int8_summary['map'],
+        'map_drop': fp32_map - int8_summary['map'],
+        'per_class': sorted(per_class, key=lambda c: -c['ap_drop'])
+    }
+
+
+def run_bench_child(model_path: str, backend: str, image_paths: list, imgsz: int, iterations: int):
+    """子进程：加载模型并测量单张推理延迟和峰值内存，结果以 JSON 输出到标准输出"""
+    from metrics import peak_rss_bytes
+
+    start = time.perf_counter()
+    model = load_backend(model_path, backend, imgsz=imgsz)
+    load_ms = (time.perf_counter() - start) * 1000
+    images = [load_image(path) for path in image_paths]
+    model.predict([images[0]])
+
+    latencies = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        model.predict([images[i % len(images)]], config.CONF_THRESHOLD)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    print(json.dumps({
+        'load_ms': load_ms,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'mean_ms': float(np.mean(latencies)),
+        'peak_rss_mb': peak_rss_bytes() / (1024.0 * 1024.0)
+    }))
+
+
+def benchmark(variants: list, image_paths: list, imgsz: int, iterations: int) -> list:
+    """每个模型在独立子进程中测量，峰值内存互不影响"""
+    results = []
+    for name, model_path, backend in variants:
+        output = subprocess.check_output([
+            sys.executable, os.path.abspath(__file__), model_path, '--bench-child', backend,
+            '--imgsz', str(imgsz), '--bench-iterations', str(iterations), '--eval', *image_paths
+        ])
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        path = Path(model_path)
+        size = sum(p.stat().st_size for p in path.rglob('*')) if path.is_dir() else path.stat().st_size
+        results.append(dict(result, model=name, path=model_path, size_mb=size / (1024.0 * 1024.0)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='INT8 模型量化与精度校验',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+使用示例:
+  python quantize_model.py best.pt --calibration samples/
+  python quantize_model.py best.pt --calibration samples/ --dataset datasets/val --max-map-drop 0.01
+  python quantize_model.py best.pt --mode dynamic --eval samples/
+        """
+    )
+    parser.add_argument('weights', help='.pt 权重文件路径')
+    parser.add_argument('--mode', choices=['static', 'dynamic'], default='static',
+                        help='量化方式：static 用校准图片统计激活范围，dynamic 只量化权重 (默认: static)')
+    parser.add_argument('--calibration', help='校准图片目录（静态量化必需）')
+    parser.add_argument('--calibration-limit', type=int, default=200, help='最多使用的校准图片数 (默认: 200)')
+    parser.add_argument('--dataset', help='YOLO 格式标注数据集（images/ 与 labels/），用于精度校验')
+    parser.add_argument('--eval', nargs='*', metavar='IMAGE',
+                        help='无标注的精度校验图片或目录（以 FP32 模型结果为参考），默认使用校准图片')
+    parser.add_argument('--eval-limit', type=int, default=200, help='最多使用的精度校验图片数 (默认: 200)')
+    parser.add_argument('--max-map-drop', type=float, default=config.QUANT_MAX_MAP_DROP,
+                        help=f'允许的最大 mAP 下降 (默认: {config.QUANT_MAX_MAP_DROP})')
+    parser.add_argument('--conf', '-c', type=float, default=0.25,
+                        help='无标注时 FP32 参考结果的置信度阈值 (默认: 0.25)')
+    parser.add_argument('--iou', type=float, default=0.5, help='AP 计算的 IoU 阈值 (默认: 0.5)')
+    parser.add_argument('--imgsz', type=int, default=config.INFER_IMGSZ,
+                        help=f'导出和校准的输入尺寸 (默认: {config.INFER_IMGSZ})')
+    parser.add_argument('--per-tensor', action='store_true', help='权重按张量量化（默认按输出通道）')
+    parser.add_argument('--quantize-head', action='store_true', help='同时量化检测头的框解码部分')
+    parser.add_argument('--bench-iterations', type=int, default=20,
+                        help='延迟测量的推理次数，0 表示不测量 (默认: 20)')
+    parser.add_argument('--force', action='store_true', help='已存在通过校验的量化模型时也重新量化')
+    parser.add_argument('--bench-child', metavar='BACKEND', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.bench_child:
+        run_bench_child(args.weights, args.bench_child, args.eval, args.imgsz, args.bench_iterations)
+        return
+
+    if not args.weights.endswith('.pt'):
+        parser.error('只支持量化 .pt 权重')
+    if args.mode == 'static' and not args.calibration:
+        parser.error('静态量化需要 --calibration 校准图片目录')
+
+    target = quantized_model_path(args.weights)
+    report_path = quantization_report_path(target)
+    if not args.force and os.path.exists(target) and os.path.exists(report_path):
+        with open(report_path, 'r', encoding='utf-8') as f:
+            if json.load(f).get('passed'):
+                print(f"量化模型已存在且已通过校验: {target}（使用 --force 重新量化）")
+                return
+
+    # 精度校验样本：标注数据集 > 指定图片 > 校准图片
+    if args.dataset:
+        samples = load_yolo_dataset(args.dataset, args.eval_limit)
+    else:
+        eval_paths = []
+        for item in args.eval or ([args.calibration] if args.calibration else []):
+            eval_paths.extend(list_images(item) if os.path.isdir(item) else [item])
+        eval_paths = eval_paths[:args.eval_limit]
+        samples = [(path, load_image(path), None) for path in eval_paths]
+        samples = [sample for sample in samples if sample[1] is not None]
+    if not samples:
+        parser.error('没有可用于精度校验的图片（--dataset / --eval / --calibration）')
+
+    calibration = list_images(args.calibration, args.calibration_limit) if args.calibration else []
+    if args.mode == 'static' and not calibration:
+        parser.error(f'校准目录中没有图片: {args.calibration}')
+
+    fp32_path = export_model(args.weights, 'onnx', args.imgsz)
+    print(f"FP32 模型: {fp32_path}")
+
+    work_dir = tempfile.mkdtemp(prefix='.quantize-', dir=os.path.dirname(os.path.abspath(target)))
+    try:
+        candidate = os.path.join(work_dir, 'int8.onnx')
+        print(f"正在量化 ({args.mode}, 校准图片 {len(calibration)} 张)...")
+        start = time.perf_counter()
+        quantize(fp32_path, candidate, args.mode, calibration, args.imgsz,
+                 per_channel=not args.per_tensor, quantize_head=args.quantize_head)
+        quantize_seconds = time.perf_counter() - start
+
+        print(f"正在校验精度 ({len(samples)} 张图片)...")
+        fp32_backend = OnnxBackend(fp32_path, imgsz=args.imgsz)
+        int8_backend = OnnxBackend(candidate, imgsz=args.imgsz)
+        accuracy = evaluate(fp32_backend, int8_backend, samples, args.conf, args.iou)
+        # 没有任何参考框时无法判断精度，不能放行
+        passed = accuracy['reference_boxes'] > 0 and accuracy['map_drop'] <= args.max_map_drop
+        del fp32_backend, int8_backend
+
+        bench = []
+        if args.bench_iterations > 0:
+            print("正在测量延迟和内存...")
+            bench_images = [s[0] for s in samples if os.path.exists(s[0])][:5]
+            if args.dataset:
+                bench_images = list_images(os.path.join(args.dataset, 'images'), 5)
+            bench = benchmark([
+                ('fp32-torch', args.weights, 'torch'),
+                ('fp32-onnx', fp32_path, 'onnx'),
+                ('int8-onnx', candidate, 'onnx')
+            ], bench_images, args.imgsz, args.bench_iterations)
+            for result in bench:
+                if result['model'] == 'int8-onnx':
+                    result['path'] = target
+
+        report = {
+            'weights': os.path.abspath(args.weights),
+            'weights_hash': weights_hash(args.weights),
+            'fp32_model': os.path.abspath(fp32_path),
+            'int8_model': os.path.abspath(target),
+            'mode': args.mode,
+            'per_channel': not args.per_tensor,
+            'quantize_head': args.quantize_head,
+            'calibration_images': len(calibration),
+            'quantize_seconds': quantize_seconds,
+            'max_map_drop': args.max_map_drop,
+            'passed': passed,
+            'accuracy': accuracy,
+            'benchmark': bench
+        }
+        if passed:
+            os.replace(candidate, target)
+        elif os.path.exists(target):
+            # 旧的量化模型不再对应当前校验结果
+            os.remove(target)
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if not accuracy['reference_boxes']:
+        print("\n校验图片中没有参考框（标注为空或 FP32 模型未检测到任何牌），无法校验精度", file=sys.stderr)
+    print(f"\nmAP@{args.iou}: FP32 {accuracy['fp32_map']:.4f}  INT8 {accuracy['int8_map']:.4f}  "
+          f"下降 {accuracy['map_drop']:.4f}（阈值 {args.max_map_drop}，参考: {accuracy['reference']}）")
+    worst = [c for c in accuracy['per_class'] if c['ap_drop'] > args.max_map_drop][:5]
+    for c in worst:
+        print(f"  {c['class_name']:<6} AP {c['fp32_ap']:.3f} -> {c['int8_ap']:.3f}")
+    if bench:
+        print(f"\n{'模型':<12} {'文件(MB)':>10} {'加载(ms)':>10} {'P50(ms)':>10} {'平均(ms)':>10} {'峰值内存(MB)':>14}")
+        for r in bench:
+            print(f"{r['model']:<12} {r['size_mb']:>10.1f} {r['load_ms']:>10.0f} {r['p50_ms']:>10.1f} "
+                  f"{r['mean_ms']:>10.1f} {r['peak_rss_mb']:>14.1f}")
+    print(f"\n报告: {report_path}")
+
+    if not passed:
+        print("精度校验未通过，已拒绝量化模型", file=sys.stderr)
+        sys.exit(1)
+    print(f"精度校验通过，量化模型: {target}")
+
+
+if __name__ == '__main__':
+    main()
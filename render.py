@@ -0,0 +1,214 @@
+"""
+识别结果图片绘制
+直接用检测结果数组 (N, 6) 在原图上画框和标签，不经过 ultralytics 的绘图（首次使用时会下载字体并阻塞）；
+默认用 OpenCV 内置的 Hershey 字体绘制简写标签（如 5p、E、Zhong），
+配置 MAHJONG_RENDER_FONT 指向本地 TrueType 字体时绘制中文牌名（标签图块按文字和字号缓存）；
+大图按最长边不超过 MAHJONG_RENDER_MAX_SIZE 降采样解码后再绘制
+"""
+
+import os
+import threading
+
+import cv2
+import numpy as np
+
+import config
+from detections import as_detections, class_name
+from preprocess import decode_reduced
+
+# Hershey 字体只支持 ASCII，使用牌的简写：饼 p / 条 s / 万 m，字牌为风向和中发白的拼音
+SHORT_NAMES = (
+    [f'{n}p' for n in range(1, 10)] +
+    [f'{n}s' for n in range(1, 10)] +
+    [f'{n}m' for n in range(1, 10)] +
+    ['E', 'S', 'W', 'N', 'Zhong', 'Fa', 'Bai']
+)
+
+# 各花色的框颜色（BGR）：饼 / 条 / 万 / 字牌
+SUIT_COLORS = ((200, 120, 0), (40, 160, 40), (40, 40, 220), (160, 40, 160))
+
+# 绘制参数的版本，修改绘制效果时递增，使结果图片存储中的旧图片失效
+RENDER_VERSION = 1
+
+_font_lock = threading.Lock()
+_fonts = {}
+_label_cache = {}
+# 标签遮罩缓存上限（牌名和置信度分别缓存，正常情况下远小于该值）
+_LABEL_CACHE_SIZE = 4096
+
+
+def short_name(class_id: int) -> str:
+    return SHORT_NAMES[class_id] if 0 <= class_id < len(SHORT_NAMES) else f'#{class_id}'
+
+
+def suit_color(class_id: int) -> tuple:
+    return SUIT_COLORS[min(max(class_id, 0) // 9, len(SUIT_COLORS) - 1)]
+
+
+def render_signature() -> str:
+    """影响绘制结果的参数，计入结果图片存储的键"""
+    return (f"v{RENDER_VERSION}:{config.RENDER_MAX_SIZE}:{config.RENDER_JPEG_QUALITY}:"
+            f"{os.path.basename(config.RENDER_FONT) if config.RENDER_FONT else 'hershey'}")
+
+
+def _load_font(font_path: str, size: int):
+    """加载 TrueType 字体（Pillow），字体不可用时返回 None 并回退到 Hershey 字体"""
+    key = (font_path, size)
+    with _font_lock:
+        if key not in _fonts:
+            try:
+                from PIL import ImageFont
+                _fonts[key] = ImageFont.truetype(font_path, size)
+            except (ImportError, OSError):
+                _fonts[key] = None
+        return _fonts[key]
+
+
+def _label_mask(text: str, font_path: str, size: int):
+    """TrueType 文字的灰度遮罩（0~255，高度为字体的行高），按 (文字, 字体, 字号) 缓存"""
+    key = (text, font_path, size)
+    mask = _label_cache.get(key)
+    if mask is None:
+        font = _load_font(font_path, size)
+        if font is None:
+            return None
+        from PIL import Image, ImageDraw
+        ascent, descent = font.getmetrics()
+        left, _, right, _ = font.getbbox(text)
+        canvas = Image.new('L', (max(1, right - left), ascent + descent), 0)
+        ImageDraw.Draw(canvas).text((-left, 0), text, fill=255, font=font)
+        mask = np.asarray(canvas)
+        if len(_label_cache) >= _LABEL_CACHE_SIZE:
+            _label_cache.clear()
+        _label_cache[key] = mask
+    return mask
+
+
+def _draw_mask(image: np.ndarray, mask: np.ndarray, x: int, y: int, color: tuple):
+    """把文字遮罩按 alpha 混合到图片的 (x, y) 处（超出图片的部分裁掉）"""
+    height, width = image.shape[:2]
+    h, w = mask.shape
+    x0, y0, x1, y1 = max(x, 0), max(y, 0), min(x + w, width), min(y + h, height)
+    if x0 >= x1 or y0 >= y1:
+        return
+    alpha = mask[y0 - y:y1 - y, x0 - x:x1 - x, None].astype(np.float32) / 255.0
+    region = image[y0:y1, x0:x1]
+    region[:] = (region * (1.0 - alpha) + np.array(color, dtype=np.float32) * alpha).astype(np.uint8)
+
+
+def _draw_label(image: np.ndarray, parts: list, x: int, y: int, color: tuple, scale: float, font_path: str):
+    """在框的左上角上方绘制带底色的标签，放不下时画在框内"""
+    thickness = max(1, int(round(scale * 2)))
+    text = ' '.join(parts)
+    mask = None
+    if font_path:
+        # 牌名和置信度分别取缓存的遮罩再拼接，缓存不会随置信度取值增长
+        size = max(10, int(round(scale * 28)))
+        masks = [_label_mask(part, font_path, size) for part in parts]
+        if all(m is not None for m in masks):
+            gap = np.zeros((masks[0].shape[0], size // 3), dtype=np.uint8)
+            mask = np.hstack([piece for m in masks for piece in (m, gap)][:-1])
+    if mask is not None:
+        text_h, text_w = mask.shape
+        baseline = 0
+    else:
+        (text_w, text_h), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+    pad = max(2, int(round(scale * 4)))
+    box_h = text_h + baseline + pad * 2
+    top = y - box_h if y - box_h >= 0 else y
+    cv2.rectangle(image, (x, top), (x + text_w + pad * 2, top + box_h), color, -1)
+    if mask is not None:
+        _draw_mask(image, mask, x + pad, top + pad, (255, 255, 255))
+    else:
+        cv2.putText(image, text, (x + pad, top + pad + text_h), cv2.FONT_HERSHEY_SIMPLEX, scale,
+                    (255, 255, 255), thickness, cv2.LINE_AA)
+
+
+def render_detections(image: np.ndarray, detections, scale: float = 1.0, font_path: str = None,
+                      show_confidence: bool = True) -> np.ndarray:
+    """
+    在图片上绘制检测框和标签（直接修改并返回 image）
+
+    Args:
+        image: BGR 图片数组
+        detections: Detections、(N, 6) 数组或嵌套格式的检测结果列表（原图坐标）
+        scale: 原图坐标到 image 的缩放比例（image 为降采样后的图片时小于 1）
+        font_path: TrueType 字体路径，为空时使用 Hershey 字体绘制简写标签
+        show_confidence: 标签中是否包含置信度
+
+    Returns:
+        绘制后的图片
+    """
+    boxes = as_detections(detections).boxes
+    height, width = image.shape[:2]
+    # 线宽和字号随图片尺寸变化，保证缩略图和大图上的标签都清晰可读
+    line = max(1, int(round(min(height, width) / 400)))
+    text_scale = max(0.4, min(height, width) / 1000)
+    for x1, y1, x2, y2, confidence, class_id in boxes:
+        class_id = int(class_id)
+        color = suit_color(class_id)
+        p1 = (int(round(x1 * scale)), int(round(y1 * scale)))
+        p2 = (int(round(x2 * scale)), int(round(y2 * scale)))
+        cv2.rectangle(image, p1, p2, color, line, cv2.LINE_AA)
+        parts = [class_name(class_id) if font_path else short_name(class_id)]
+        if show_confidence:
+            parts.append(f"{confidence:.2f}")
+        _draw_label(image, parts, p1[0], p1[1], color, text_scale, font_path)
+    return image
+
+
+def load_for_render(source, max_size: int = None) -> tuple:
+    """
+    读取要绘制的图片，最长边超过 max_size 时降采样
+
+    Args:
+        source: 图片字节或 BGR 图片数组
+        max_size: 最长边上限，0 / None 表示不缩放
+
+    Returns:
+        (BGR 图片, 原图坐标到该图片的缩放比例)，无法解码时图片为 None
+    """
+    if isinstance(source, np.ndarray):
+        image, original = source.copy(), source.shape[:2]
+    else:
+        # JPEG 按接近目标尺寸的分辨率解码，跳过大部分解码开销
+        image, original = decode_reduced(source, max_size or 1 << 30)
+        if image is None:
+            return None, 1.0
+    longest = max(image.shape[:2])
+    if max_size and longest > max_size:
+        ratio = max_size / longest
+        image = cv2.resize(image, (max(1, round(image.shape[1] * ratio)), max(1, round(image.shape[0] * ratio))),
+                           interpolation=cv2.INTER_AREA)
+    return image, image.shape[1] / original[1]
+
+
+def render_image(source, detections, max_size: int = None, font_path: str = None) -> np.ndarray:
+    """读取图片（按需降采样）并绘制检测结果，无法解码时返回 None"""
+    max_size = config.RENDER_MAX_SIZE if max_size is None else max_size
+    font_path = config.RENDER_FONT if font_path is None else font_path
+    image, scale = load_for_render(source, max_size)
+    if image is None:
+        return None
+    return render_detections(image, detections, scale, font_path)
+
+
+def encode_jpeg(image: np.ndarray, quality: int = None) -> bytes:
+    """编码为 JPEG 字节"""
+    quality = config.RENDER_JPEG_QUALITY if quality is None else quality
+    ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+    if not ok:
+        raise ValueError("Cannot encode result image")
+    return buffer.tobytes()
+
+
+def save_rendered(source, detections, output_dir: str, name: str) -> str:
+    """绘制检测结果并保存到 output_dir/<name 去扩展名>_result.jpg（命令行 --save），返回保存路径"""
+    image = render_image(source, detections, max_size=0)
+    if image is None:
+        return None
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{os.path.splitext(os.path.basename(name))[0]}_result.jpg")
+    with open(path, 'wb') as f:
+        f.write(encode_jpeg(image))
+    return path
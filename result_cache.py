@@ -0,0 +1,167 @@
+"""
+识别结果缓存
+按 (图片内容哈希, 模型版本, 置信度阈值) 缓存识别结果，
+内存层为带过期时间的 LRU，可选磁盘层在重启后仍然有效
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+import config
+from detections import json_default
+
+logger = logging.getLogger(__name__)
+
+
+def hash_image_bytes(data) -> str:
+    """图片内容的 SHA-256"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_cache_key(image_hash: str, model_version: str, conf_threshold: float) -> str:
+    """组合图片哈希、模型版本和置信度阈值，得到缓存键（同时用作 ETag）"""
+    raw = f"{image_hash}:{model_version}:{float(conf_threshold):.4f}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+class ResultCache:
+    """
+    LRU + TTL 结果缓存
+
+    Args:
+        max_entries: 内存中最多缓存的结果数
+        ttl: 过期时间（秒），0 表示不过期
+        disk_dir: 磁盘缓存目录，None 表示不启用磁盘层
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600, disk_dir: str = None):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = float(ttl)
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def _expired(self, stored_at: float) -> bool:
+        return self.ttl > 0 and time.time() - stored_at > self.ttl
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _put_memory(self, key: str, value, stored_at: float):
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _get_disk(self, key: str):
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        if self._expired(record.get('stored_at', 0)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None, None
+        return record['value'], record['stored_at']
+
+    def _put_disk(self, key: str, value, stored_at: float):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'stored_at': stored_at, 'value': value}, f, ensure_ascii=False, default=json_default)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Failed to write result cache entry {key}: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get(self, key: str):
+        """查找缓存结果，未命中或已过期返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if not self._expired(stored_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        if self.disk_dir:
+            value, stored_at = self._get_disk(key)
+            if value is not None:
+                with self._lock:
+                    self._put_memory(key, value, stored_at)
+                    self.hits += 1
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value):
+        """写入缓存结果（value 需可 JSON 序列化，可包含 Detections）"""
+        stored_at = time.time()
+        with self._lock:
+            self._put_memory(key, value, stored_at)
+        if self.disk_dir:
+            self._put_disk(key, value, stored_at)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'disk': bool(self.disk_dir),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """按配置创建的进程级结果缓存，未启用时返回 None"""
+    global _result_cache
+
+    if not config.RESULT_CACHE_ENABLED:
+        return None
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache(
+                max_entries=config.RESULT_CACHE_MAX_ENTRIES,
+                ttl=config.RESULT_CACHE_TTL,
+                disk_dir=config.RESULT_CACHE_DIR if config.RESULT_CACHE_DISK else None
+            )
+        return _result_cache
@@ -0,0 +1,240 @@
+"""
+识别结果图片存储
+结果图片按内容寻址：文件名由图片内容哈希 + 模型版本 + 置信度阈值 + 绘制参数计算，
+同一输入只绘制一次，内容不会变化（可以长期缓存）；
+文件保存在 <目录>/<文件名前两位>/<文件名>，按文件名直接定位，不遍历目录；
+内存索引按最近访问顺序记录文件大小，总大小超过上限时淘汰最久未访问的图片，超过保存时间的图片过期删除
+"""
+
+import os
+import re
+import time
+import threading
+import logging
+from collections import OrderedDict
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# 存储中的文件名：十六进制内容键 + .jpg
+_NAME_PATTERN = re.compile(r'^[0-9a-f]{16,64}\.jpg$')
+
+
+class ResultImageStore:
+    """
+    按内容寻址的结果图片存储
+
+    Args:
+        root: 存储目录
+        max_bytes: 图片总大小上限（字节），0 表示不限制
+        max_age: 图片保存时间（秒），0 表示不过期
+        sweep_interval: 重新扫描目录的间隔（秒），用于同步其他工作进程写入和删除的图片
+    """
+
+    def __init__(self, root: str = 'run/results', max_bytes: int = 0, max_age: float = 0,
+                 sweep_interval: float = 60.0):
+        self.root = root
+        self.max_bytes = max(0, int(max_bytes))
+        self.max_age = float(max_age)
+        self.sweep_interval = float(sweep_interval)
+        # 文件名 -> (大小, 写入时间)，按最近访问顺序排列
+        self._index = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        os.makedirs(self.root, exist_ok=True)
+        self.sweep()
+
+    @staticmethod
+    def name_for(key: str) -> str:
+        return f"{key}.jpg"
+
+    @staticmethod
+    def valid_name(name: str) -> bool:
+        return bool(_NAME_PATTERN.match(name or ''))
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name[:2], name)
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.max_age > 0 and now - stored_at > self.max_age
+
+    def _add(self, name: str, size: int, stored_at: float):
+        previous = self._index.pop(name, None)
+        if previous is not None:
+            self._bytes -= previous[0]
+        self._index[name] = (size, stored_at)
+        self._bytes += size
+
+    def _drop(self, name: str):
+        """从索引和磁盘删除图片（调用方持有锁）"""
+        entry = self._index.pop(name, None)
+        if entry is not None:
+            self._bytes -= entry[0]
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            pass
+
+    def get(self, name: str):
+        """
+        查找结果图片
+
+        Returns:
+            (文件路径, 写入时间)，不存在、文件名无效或已过期时返回 None
+        """
+        if not self.valid_name(name):
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._index.get(name)
+            if entry is None:
+                # 可能由其他工作进程写入：按文件名直接检查一次
+                try:
+                    stat = os.stat(self._path(name))
+                except OSError:
+                    self.misses += 1
+                    return None
+                self._add(name, stat.st_size, stat.st_mtime)
+                entry = self._index[name]
+            if self._expired(entry[1], now):
+                self._drop(name)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._index.move_to_end(name)
+            self.hits += 1
+            return self._path(name), entry[1]
+
+    def contains(self, name: str) -> bool:
+        return self.get(name) is not None
+
+    def put(self, name: str, data: bytes) -> str:
+        """写入结果图片（先写临时文件再重命名，读者不会看到写了一半的文件），返回文件路径"""
+        if not self.valid_name(name):
+            raise ValueError(f"Invalid result image name: {name}")
+        path = self._path(name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        now = time.time()
+        with self._lock:
+            self._add(name, len(data), now)
+            self.writes += 1
+            self._evict()
+            sweep_due = now - self._last_sweep >= self.sweep_interval
+        if sweep_due:
+            self.sweep()
+        return path
+
+    def _evict(self):
+        """总大小超过上限时按最久未访问的顺序删除到上限的 90%（调用方持有锁）"""
+        if not self.max_bytes or self._bytes <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        while self._index and self._bytes > target:
+            name = next(iter(self._index))
+            self._drop(name)
+            self.evictions += 1
+
+    def sweep(self):
+        """重新扫描存储目录：同步其他工作进程的写入和删除，删除过期图片和残留的临时文件，再按大小上限淘汰"""
+        now = time.time()
+        found = []
+        try:
+            prefixes = list(os.scandir(self.root))
+        except OSError:
+            prefixes = []
+        for prefix in prefixes:
+            if not prefix.is_dir():
+                continue
+            try:
+                entries = list(os.scandir(prefix.path))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if entry.name.endswith('.tmp'):
+                    # 写入中途退出留下的临时文件
+                    if now - stat.st_mtime > 3600:
+                        try:
+                            os.remove(entry.path)
+                        except OSError:
+                            pass
+                    continue
+                if self.valid_name(entry.name):
+                    found.append((stat.st_mtime, entry.name, stat.st_size))
+
+        with self._lock:
+            # 本进程访问过的图片保持访问顺序，新发现的图片按写入时间排在最前面（最先淘汰）
+            known = {name: entry for name, entry in self._index.items()}
+            present = {name for _, name, _ in found}
+            index = OrderedDict()
+            for stored_at, name, size in sorted(found):
+                if name not in known:
+                    index[name] = (size, stored_at)
+            for name, entry in known.items():
+                if name in present:
+                    index[name] = entry
+            self._index = index
+            self._bytes = sum(size for size, _ in index.values())
+            for name in [name for name, (_, stored_at) in index.items() if self._expired(stored_at, now)]:
+                self._drop(name)
+                self.expirations += 1
+            self._evict()
+            self._last_sweep = now
+
+    def clear(self):
+        with self._lock:
+            for name in list(self._index):
+                self._drop(name)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'images': len(self._index),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'max_age': self.max_age,
+                'hits': self.hits,
+                'misses': self.misses,
+                'writes': self.writes,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+_result_store = None
+_result_store_lock = threading.Lock()
+
+
+def get_result_store() -> ResultImageStore:
+    """按配置创建的进程级结果图片存储"""
+    global _result_store
+
+    with _result_store_lock:
+        if _result_store is None:
+            _result_store = ResultImageStore(
+                root=config.RESULT_IMAGE_DIR,
+                max_bytes=config.RESULT_IMAGE_MAX_MB * 1024 * 1024,
+                max_age=config.RESULT_IMAGE_TTL
+            )
+        return _result_store
@@ -0,0 +1,86 @@
+import logging
+
+from flask import Blueprint, jsonify, request
+from werkzeug.utils import secure_filename
+
+import admission
+import config
+import metrics
+from hand_analysis import HandError, analyze_hand, counts_from_detections, counts_from_tiles
+from model_manifest import UnknownModel, manifest
+from uploads import validate_upload
+
+logger = logging.getLogger(__name__)
+
+analyze_hand_bp = Blueprint('analyze_hand', __name__, url_prefix='/analyze_hand')
+
+
+@analyze_hand_bp.route('', methods=['POST'])
+def analyze():
+    """
+    手牌分析：向听数、听牌（待ち）和和牌判断
+
+    上传图片（file 字段）时先识别再统计手牌；
+    也可以直接提交 JSON：{"tiles": [类别 ID 或名称, ...]} 或 {"counts": [34 个计数]}
+    """
+    try:
+        json_result = None
+        # 只有上传图片的请求需要准入控制，判断时不能访问 request.files（会在获得名额前读取请求体）
+        if request.mimetype == 'multipart/form-data':
+            with admission.controller.slot(), manifest.use(request.values.get('model')) as spec:
+                with metrics.stage('upload'):
+                    file, error = validate_upload(request.files)
+                    data = file.read() if not error else None
+                if error:
+                    logger.warning(f"Invalid upload: {error}")
+                    return jsonify({'error': error}), 400
+
+                filename = secure_filename(file.filename)
+                from predict import predict_upload
+                try:
+                    result = predict_upload(data, image_name=filename, spec=spec)
+                except ValueError as e:
+                    logger.warning(f"Cannot decode image: {file.filename}")
+                    return jsonify({'error': str(e)}), 400
+            if not result['success']:
+                logger.error(f"Prediction failed: {result.get('error', 'Unknown error')}")
+                return jsonify({'error': result['error']}), 500
+
+            json_result = [dict(r, image_path=filename) for r in result['json_result']]
+            detections = json_result[0]['detections'] if json_result else []
+            counts = counts_from_detections(detections, config.HAND_MIN_CONFIDENCE)
+        else:
+            body = request.get_json(silent=True)
+            if body is None:
+                body = {}
+            if not isinstance(body, dict):
+                return jsonify({'error': 'Request body must be a JSON object'}), 400
+            if 'counts' in body:
+                counts = body['counts']
+            elif 'tiles' in body:
+                if not isinstance(body['tiles'], list):
+                    return jsonify({'error': 'tiles must be a list'}), 400
+                counts = counts_from_tiles(body['tiles'])
+            else:
+                return jsonify({'error': 'No image, tiles or counts provided'}), 400
+
+        try:
+            with metrics.stage('hand_analysis'):
+                analysis = analyze_hand(counts)
+        except (HandError, TypeError, ValueError) as e:
+            return jsonify({'error': str(e), 'json_result': json_result}), 400
+
+        return jsonify({
+            'success': True,
+            'analysis': analysis,
+            'json_result': json_result,
+            'model': spec.name if json_result is not None else None
+        })
+
+    except (HandError, UnknownModel) as e:
+        return jsonify({'error': str(e)}), 400
+    except admission.REJECTIONS:
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error in analyze_hand: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
@@ -0,0 +1,18 @@
+from flask import Blueprint, jsonify
+
+from startup import startup
+
+health_bp = Blueprint('health', __name__)
+
+
+@health_bp.route('/healthz')
+def healthz():
+    """存活检查：进程能处理 HTTP 请求即返回 200，不依赖模型"""
+    return jsonify({'status': 'ok'})
+
+
+@health_bp.route('/readyz')
+def readyz():
+    """就绪检查：推理模块已导入、模型已完成首次推理时返回 200，否则返回 503 和启动进度"""
+    state = startup.snapshot()
+    return jsonify(state), 200 if state['ready'] else 503
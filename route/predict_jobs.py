@@ -0,0 +1,118 @@
+import logging
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context, url_for
+from werkzeug.utils import secure_filename
+
+import config
+from admission import REJECTIONS
+from detections import RESULT_FORMATS, CLASS_NAMES, dumps, to_columnar
+from jobs import FINISHED_STATES, JobQueueFull, job_manager
+from model_manifest import UnknownModel, manifest
+from uploads import validate_upload
+
+logger = logging.getLogger(__name__)
+
+predict_jobs_bp = Blueprint('predict_jobs', __name__, url_prefix='/predict_jobs')
+
+
+def run_prediction_job(data, filename, model=None):
+    """后台执行的识别任务，model 为提交时选定的模型名称"""
+    from predict import predict_upload
+    with manifest.use(model) as spec:
+        result = predict_upload(data, image_name=filename, spec=spec)
+    if not result['success']:
+        raise RuntimeError(result['error'])
+    return {
+        'json_result': [dict(r, image_path=filename) for r in result['json_result']],
+        'message': result.get('message', 'Prediction completed'),
+        'cache_hit': result['cache_hit'],
+        'model': result['model']
+    }
+
+
+def job_response(record, result_format: str = 'nested'):
+    data = dict(record)
+    if result_format == 'columnar' and data.get('result'):
+        data['result'] = dict(data['result'], json_result=to_columnar(data['result']['json_result']),
+                              format='columnar', class_names=CLASS_NAMES)
+    data['status_url'] = url_for('predict_jobs.get_job', job_id=record['job_id'])
+    data['events_url'] = url_for('predict_jobs.job_events', job_id=record['job_id'])
+    return data
+
+
+@predict_jobs_bp.route('', methods=['POST'])
+def create_job():
+    """提交识别任务，立即返回任务ID"""
+    try:
+        file, error = validate_upload(request.files)
+        if error:
+            logger.warning(f"Invalid upload: {error}")
+            return jsonify({'error': error}), 400
+
+        # 提交时按 model 参数或分流权重选定模型，任务执行时使用同一个模型
+        try:
+            model = manifest.current().select(request.values.get('model')).name
+        except UnknownModel as e:
+            return jsonify({'error': str(e)}), 400
+
+        filename = secure_filename(file.filename)
+        data = file.read()
+
+        try:
+            record = job_manager.submit(run_prediction_job, data, filename, model)
+        except JobQueueFull as e:
+            logger.warning(f"Job rejected: {str(e)}")
+            response = jsonify({'error': str(e)})
+            response.status_code = 429
+            response.headers['Retry-After'] = '1'
+            return response
+
+        logger.info(f"Job queued: {record['job_id']} ({file.filename})")
+        return jsonify(job_response(record)), 202
+
+    except REJECTIONS:
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error in create_job: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@predict_jobs_bp.route('/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询任务状态和结果，format=columnar 时结果中的检测框为列式格式"""
+    result_format = request.args.get('format', 'nested')
+    if result_format not in RESULT_FORMATS:
+        return jsonify({'error': f'Unsupported format: {result_format}'}), 400
+    record = job_manager.get(job_id)
+    if record is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_response(record, result_format))
+
+
+@predict_jobs_bp.route('/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """以 SSE 推送任务状态，任务完成时推送结果后结束"""
+    record = job_manager.get(job_id)
+    if record is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def generate():
+        last_status = None
+        while True:
+            record = job_manager.wait(job_id, config.JOBS_SSE_HEARTBEAT)
+            if record is None:
+                yield f"event: error\ndata: {dumps({'error': 'Job not found'})}\n\n"
+                return
+            if record['status'] != last_status:
+                last_status = record['status']
+                event = 'result' if last_status in FINISHED_STATES else 'status'
+                yield f"event: {event}\ndata: {dumps(record)}\n\n"
+            if last_status in FINISHED_STATES:
+                return
+            yield ": keep-alive\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
@@ -0,0 +1,172 @@
+import logging
+import os
+import tempfile
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+
+import admission
+import config
+from detections import dumps
+from model_manifest import UnknownModel
+from uploads import file_size, validate_upload
+
+logger = logging.getLogger(__name__)
+
+predict_stream_bp = Blueprint('predict_stream', __name__, url_prefix='/predict_stream')
+
+STREAM_UPLOAD_DIR = 'run/stream'
+
+
+def request_options() -> dict:
+    """查询参数：diff_threshold（帧差异阈值）、emit_empty（是否输出没有变化的识别帧）"""
+    options = {'diff_threshold': None, 'emit_empty': request.args.get('emit_empty', '').lower() in ('1', 'true', 'yes')}
+    if 'diff_threshold' in request.args:
+        options['diff_threshold'] = float(request.args['diff_threshold'])
+    return options
+
+
+@predict_stream_bp.route('', methods=['POST'])
+def predict_video():
+    """上传视频文件，以分块传输的 NDJSON 逐帧返回识别结果的变化，最后一行为汇总"""
+    from streaming import VIDEO_EXTENSIONS, StreamSession, iter_video, stream_events
+    # 读取请求体之前获取视频名额，同时识别的视频数超过上限时返回 503；名额在响应结束（含客户端断开）时释放
+    admission.video_controller.acquire()
+    streaming = False
+    try:
+        try:
+            options = request_options()
+        except ValueError:
+            return jsonify({'error': 'Invalid diff_threshold'}), 400
+
+        if 'file' not in request.files or request.files['file'].filename == '':
+            return jsonify({'error': 'No file part'}), 400
+        file = request.files['file']
+        extension = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
+        if extension not in VIDEO_EXTENSIONS:
+            return jsonify({'error': f"File type not allowed. Supported formats: "
+                                     f"{', '.join(sorted(VIDEO_EXTENSIONS)).upper()}"}), 400
+        if file_size(file) > config.STREAM_MAX_UPLOAD_MB * 1024 * 1024:
+            return jsonify({'error': f'File too large. Maximum size is {config.STREAM_MAX_UPLOAD_MB}MB'}), 400
+
+        try:
+            session = StreamSession(diff_threshold=options['diff_threshold'], model=request.values.get('model'))
+        except UnknownModel as e:
+            return jsonify({'error': str(e)}), 400
+
+        # OpenCV 只能从文件读取视频，先写入临时文件，响应结束后删除
+        os.makedirs(STREAM_UPLOAD_DIR, exist_ok=True)
+        fd, video_path = tempfile.mkstemp(suffix=f'.{extension}', dir=STREAM_UPLOAD_DIR)
+        with os.fdopen(fd, 'wb') as f:
+            file.save(f)
+
+        logger.info(f"Streaming video: {file.filename} (session {session.session_id})")
+
+        def generate():
+            try:
+                for event in stream_events(session, iter_video(video_path), emit_empty=options['emit_empty']):
+                    yield dumps(event) + '\n'
+            except ValueError as e:
+                yield dumps({'type': 'error', 'error': str(e)}) + '\n'
+            finally:
+                try:
+                    os.remove(video_path)
+                except OSError:
+                    pass
+                stats = session.stats()
+                logger.info(f"Stream finished: {stats['frames_processed']}/{stats['frames_received']} frames processed")
+
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                            headers={'X-Accel-Buffering': 'no', 'Cache-Control': 'no-cache'})
+        response.call_on_close(admission.video_controller.release)
+        streaming = True
+        return response
+
+    except admission.REJECTIONS:
+        raise
+    except Exception as e:
+        logger.error(f"Unexpected error in predict_video: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+    finally:
+        if not streaming:
+            admission.video_controller.release()
+
+
+@predict_stream_bp.route('/sessions', methods=['POST'])
+def create_session():
+    """创建推帧会话（摄像头客户端逐帧上传），会话保存在处理该请求的工作进程中"""
+    from streaming import SessionLimitReached, session_manager
+    try:
+        options = request_options()
+    except ValueError:
+        return jsonify({'error': 'Invalid diff_threshold'}), 400
+    try:
+        session = session_manager.create(diff_threshold=options['diff_threshold'],
+                                         model=request.values.get('model'))
+    except UnknownModel as e:
+        return jsonify({'error': str(e)}), 400
+    except SessionLimitReached as e:
+        response = jsonify({'error': str(e)})
+        response.status_code = 429
+        response.headers['Retry-After'] = '5'
+        return response
+    return jsonify({'session_id': session.session_id, 'stats': session.stats()}), 201
+
+
+@predict_stream_bp.route('/sessions/<session_id>/frames', methods=['POST'])
+@admission.admitted
+def push_frame(session_id):
+    """
+    推送一帧（file 字段），返回该帧相对之前结果的变化
+
+    与上一个识别帧几乎相同时返回 skipped；该会话上一帧仍在识别时丢弃本帧并返回 dropped
+    """
+    from mahjong_predictor import decode_image
+    from streaming import session_manager
+    session = session_manager.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Session not found'}), 404
+
+    file, error = validate_upload(request.files)
+    if error:
+        return jsonify({'error': error}), 400
+    frame = decode_image(file.read())
+    if frame is None:
+        return jsonify({'error': 'Invalid image data'}), 400
+
+    if not session.lock.acquire(blocking=False):
+        session.record_dropped()
+        return jsonify({'session_id': session_id, 'dropped': True})
+    try:
+        timestamp = request.args.get('timestamp_ms', type=float)
+        event = session.process(frame, timestamp)
+    except admission.AdmissionError:
+        raise
+    except Exception as e:
+        logger.error(f"Stream frame failed: {str(e)}")
+        return jsonify({'error': f'Error processing frame: {str(e)}'}), 500
+    finally:
+        session.lock.release()
+
+    if event is None:
+        return jsonify({'session_id': session_id, 'skipped': True})
+    return jsonify(dict(event, session_id=session_id))
+
+
+@predict_stream_bp.route('/sessions/<session_id>', methods=['GET'])
+def get_session(session_id):
+    """会话统计和当前识别到的全部牌"""
+    from streaming import session_manager
+    session = session_manager.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Session not found'}), 404
+    return jsonify(session.summary())
+
+
+@predict_stream_bp.route('/sessions/<session_id>', methods=['DELETE'])
+def close_session(session_id):
+    """结束会话，返回汇总"""
+    from streaming import session_manager
+    session = session_manager.close(session_id)
+    if session is None:
+        return jsonify({'error': 'Session not found'}), 404
+    return jsonify(session.summary())
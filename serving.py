@@ -0,0 +1,116 @@
+"""
+生产环境多进程服务
+供 gunicorn.conf.py 调用：计算每个工作进程的线程数、在主进程预加载模型、
+在工作进程中固定线程数并预热模型
+"""
+
+import os
+import logging
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# 影响 PyTorch / OpenCV / BLAS 线程池大小的环境变量，必须在导入 torch 之前设置
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS')
+
+
+def cpu_count() -> int:
+    """可用 CPU 核数，优先使用 MAHJONG_CPUS（容器 CPU 配额无法从亲和性中读出）"""
+    if config.SERVE_CPUS > 0:
+        return config.SERVE_CPUS
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def worker_count() -> int:
+    """工作进程数，默认按每个进程至少 2 个推理线程计算"""
+    if config.SERVE_WORKERS > 0:
+        return config.SERVE_WORKERS
+    return max(1, cpu_count() // 2)
+
+
+def threads_per_worker(workers: int = None) -> int:
+    """每个工作进程的推理线程数，默认把 CPU 核数平均分给各工作进程，避免互相抢占"""
+    if config.SERVE_INFER_THREADS > 0:
+        return config.SERVE_INFER_THREADS
+    return max(1, cpu_count() // (workers or worker_count()))
+
+
+def pin_thread_env(threads: int):
+    """设置线程池相关的环境变量（在导入 torch / onnxruntime 之前调用）"""
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    # ONNX Runtime / OpenVINO 会话未单独配置线程数时使用同样的值
+    if config.ORT_INTRA_OP_THREADS == 0:
+        config.ORT_INTRA_OP_THREADS = threads
+    if config.ORT_INTER_OP_THREADS == 0:
+        config.ORT_INTER_OP_THREADS = 1
+
+
+def pin_threads(threads: int):
+    """在当前进程中固定 PyTorch / OpenCV 线程数"""
+    try:
+        import cv2
+        cv2.setNumThreads(threads)
+    except ImportError:
+        pass
+
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # 已经执行过并行计算的进程不能再修改 inter-op 线程数
+        pass
+
+
+def preload_in_parent() -> bool:
+    """
+    是否在主进程中预加载模型
+
+    torch 后端只反序列化权重、不执行推理时可以安全 fork，工作进程通过写时复制共享权重；
+    onnx / openvino 后端创建会话时就会启动线程池，fork 后不安全，必须在工作进程中加载
+    """
+    mode = config.SERVE_PRELOAD_MODEL
+    if mode == 'parent':
+        return True
+    if mode == 'worker':
+        return False
+    # 主进程加载模型要先导入 torch，会推迟服务绑定；后台启动时改为在工作进程中加载
+    if config.STARTUP_BACKGROUND:
+        return False
+    from backends import resolve_backend, resolve_variant
+    model_path = config.MODEL_PATH
+    if os.path.exists(model_path):
+        model_path = resolve_variant(model_path, config.MODEL_VARIANT)
+    return resolve_backend(model_path, config.BACKEND) == 'torch'
+
+
+def preload_model():
+    """主进程中加载模型（不执行推理）"""
+    if not preload_in_parent():
+        logger.info("Model will be loaded in each worker")
+        return
+    from model_registry import registry
+    try:
+        registry.get(config.MODEL_PATH, config.MODEL_DEVICE)
+        logger.info(f"Model preloaded in parent: {config.MODEL_PATH}")
+    except Exception as e:
+        logger.warning(f"Model preload failed: {str(e)}")
+
+
+def init_worker(threads: int):
+    """
+    工作进程启动后固定线程数，并加载（如未预加载）和预热模型
+
+    默认在后台线程中进行（固定线程数需要导入 torch，也放在后台），工作进程立即开始处理请求，
+    预热完成前 /readyz 返回 503
+    """
+    from startup import startup
+    startup.resume(warmup=True, prepare=lambda: pin_threads(threads))
@@ -0,0 +1,106 @@
+"""
+切片推理
+整桌照片中远处的麻将牌在模型输入尺寸下太小，整图推理容易漏检；
+切片模式把大图切成互相重叠的小块，与整图一起批量推理，
+再把各切片的检测结果平移回原图坐标并跨切片 NMS 合并
+"""
+
+import numpy as np
+
+from backends import nms
+
+SLICE_MODES = ('off', 'on', 'auto')
+
+# 距切片内部边界小于该像素数的框视为被截断
+EDGE_MARGIN = 2
+
+
+def slice_windows(width: int, height: int, slice_size: int, overlap: float) -> list:
+    """
+    计算覆盖整张图片、互相重叠的切片窗口
+
+    Args:
+        width: 图片宽度
+        height: 图片高度
+        slice_size: 切片边长
+        overlap: 相邻切片的重叠比例（0 ~ 0.9）
+
+    Returns:
+        [(x1, y1, x2, y2), ...]，最后一行 / 列与图片边缘对齐
+    """
+    step = max(1, int(slice_size * (1.0 - min(max(overlap, 0.0), 0.9))))
+
+    def starts(length):
+        if length <= slice_size:
+            return [0]
+        positions = list(range(0, length - slice_size, step))
+        positions.append(length - slice_size)
+        return positions
+
+    return [
+        (x, y, min(x + slice_size, width), min(y + slice_size, height))
+        for y in starts(height) for x in starts(width)
+    ]
+
+
+def should_slice(width: int, height: int, mode: str, auto_min_size: int) -> bool:
+    """按模式和图片尺寸判断是否切片推理：auto 模式下最长边不小于 auto_min_size 时切片"""
+    if mode == 'on':
+        return True
+    if mode == 'auto':
+        return max(width, height) >= auto_min_size
+    return False
+
+
+def drop_truncated(boxes: np.ndarray, window: tuple, width: int, height: int) -> np.ndarray:
+    """去掉贴着切片内部边界（不是图片边界）的框，这些牌在相邻切片中是完整的"""
+    if len(boxes) == 0:
+        return boxes
+    x1, y1, x2, y2 = window
+    keep = np.ones(len(boxes), dtype=bool)
+    if x1 > 0:
+        keep &= boxes[:, 0] > EDGE_MARGIN
+    if y1 > 0:
+        keep &= boxes[:, 1] > EDGE_MARGIN
+    if x2 < width:
+        keep &= boxes[:, 2] < (x2 - x1) - EDGE_MARGIN
+    if y2 < height:
+        keep &= boxes[:, 3] < (y2 - y1) - EDGE_MARGIN
+    return boxes[keep]
+
+
+def merge_detections(results: list, windows: list, width: int, height: int,
+                     iou_threshold: float = 0.5, max_detections: int = 1000) -> np.ndarray:
+    """
+    合并各切片的检测结果
+
+    Args:
+        results: 每个切片的 (N, 6) 检测结果 [x1, y1, x2, y2, conf, cls]，坐标为切片内坐标；
+            窗口为整张图片时即整图推理结果
+        windows: 与 results 对应的切片窗口
+        width: 原图宽度
+        height: 原图高度
+        iou_threshold: 跨切片 NMS 阈值（按交集占较小框面积的比例）
+        max_detections: 最多保留的检测数
+
+    Returns:
+        (N, 6) 原图坐标下的检测结果，按置信度降序
+    """
+    merged = []
+    for boxes, window in zip(results, windows):
+        boxes = drop_truncated(np.asarray(boxes, dtype=np.float32).reshape(-1, 6), window, width, height)
+        if len(boxes) == 0:
+            continue
+        boxes = boxes.copy()
+        boxes[:, [0, 2]] += window[0]
+        boxes[:, [1, 3]] += window[1]
+        merged.append(boxes)
+
+    if not merged:
+        return np.zeros((0, 6), dtype=np.float32)
+    boxes = np.concatenate(merged)
+
+    # 按类别偏移后统一做 NMS，等价于逐类别 NMS
+    offset = float(max(width, height) + 1)
+    keep = nms(boxes[:, :4] + boxes[:, 5:6] * offset, boxes[:, 4], iou_threshold, metric='ios')
+    return boxes[keep[:max_detections]]
@@ -0,0 +1,177 @@
+"""
+服务启动与就绪状态
+创建应用时只导入 Flask 和轻量模块，HTTP 服务绑定后 /healthz 即可访问；
+推理相关模块（OpenCV、推理后端、微批调度器等）的导入、手牌分析查找表加载、
+模型加载和首次推理在后台线程中依次完成，全部完成后 /readyz 才返回就绪
+
+gunicorn 主进程中不能在 fork 前创建线程，由 gunicorn.conf.py 推迟到每个工作进程中执行
+"""
+
+import os
+import time
+import atexit
+import threading
+import logging
+from contextlib import contextmanager
+
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PHASES = ('import', 'hand_tables', 'model_load', 'warmup')
+# 进程退出时等待后台启动任务结束的最长时间（秒），解释器在 torch 导入或推理途中退出会异常终止
+EXIT_JOIN_TIMEOUT = 60.0
+
+_IMPORTED_AT = time.time()
+
+
+def process_start_time() -> float:
+    """当前进程的启动时间（time.time() 时间戳），无法读取 /proc 时返回本模块的导入时间"""
+    try:
+        with open('/proc/self/stat', 'r') as f:
+            # 第 22 个字段为进程启动时间（开机后的时钟周期数），进程名可能包含空格，从 ')' 之后开始计数
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime', 'r') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return _IMPORTED_AT
+
+
+class StartupState:
+    """进程的启动进度：starting（未开始）/ warming（进行中）/ ready / failed"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self.status = 'starting'
+        self.error = None
+        self.phases = {}
+        self.started_at = process_start_time()
+        self.ready_at = None
+        self.deferred = False
+        self._thread = None
+
+    def defer(self):
+        """推迟启动任务（gunicorn 主进程），begin 不再执行，由工作进程调用 resume"""
+        self.deferred = True
+
+    def resume(self, warmup: bool = True, background: bool = None, prepare=None) -> bool:
+        """fork 后的工作进程中开始启动任务，启动时间从工作进程创建时算起"""
+        self.deferred = False
+        self.started_at = process_start_time()
+        return self.begin(warmup, background, prepare)
+
+    def begin(self, warmup: bool = None, background: bool = None, prepare=None) -> bool:
+        """
+        开始启动任务
+
+        Args:
+            warmup: 是否加载模型并执行首次推理，默认取配置 MAHJONG_MODEL_WARMUP；
+                不预热时导入和查找表加载完成后即就绪
+            background: 是否在后台线程中执行，默认取配置 MAHJONG_BACKGROUND_STARTUP
+            prepare: 导入推理模块前在同一线程中执行的函数（如固定推理线程数）
+
+        Returns:
+            是否开始了启动任务（已开始或被推迟时返回 False）
+        """
+        warmup = config.MODEL_WARMUP if warmup is None else warmup
+        background = config.STARTUP_BACKGROUND if background is None else background
+        with self._lock:
+            if self.deferred or self.status != 'starting':
+                return False
+            self.status = 'warming'
+
+        if background:
+            self._thread = threading.Thread(target=self._run, args=(warmup, prepare), name='mahjong-startup',
+                                            daemon=True)
+            self._thread.start()
+            atexit.register(self._join, EXIT_JOIN_TIMEOUT)
+        else:
+            self._run(warmup, prepare)
+        return True
+
+    @contextmanager
+    def _phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.phases[name] = seconds
+            metrics.STARTUP_PHASE_SECONDS.set(seconds, phase=name)
+
+    def _run(self, warmup: bool, prepare):
+        try:
+            with self._phase('import'):
+                if prepare is not None:
+                    prepare()
+                import predict  # noqa: F401
+                import streaming  # noqa: F401
+                from hand_analysis import get_tables
+                from model_manifest import manifest
+
+            # 手牌分析查找表：首次运行时构建并写入缓存，请求中只查表
+            with self._phase('hand_tables'):
+                try:
+                    get_tables()
+                except Exception as e:
+                    logger.warning(f"Hand analysis tables unavailable: {str(e)}")
+
+            # 模型清单中的所有模型（没有清单文件时为 MAHJONG_MODEL_PATH）
+            if warmup:
+                with self._phase('model_load'):
+                    manifest.warmup(run=False)
+                with self._phase('warmup'):
+                    manifest.warmup()
+        except Exception as e:
+            logger.warning(f"Model warmup failed: {str(e)}")
+            with self._lock:
+                self.status = 'failed'
+                self.error = str(e)
+            return
+
+        with self._lock:
+            self.status = 'ready'
+            self.ready_at = time.time()
+        self._ready.set()
+        elapsed = self.ready_at - self.started_at
+        breakdown = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        if elapsed > config.STARTUP_TARGET_SECONDS:
+            logger.warning(f"Ready in {elapsed:.2f}s, over target {config.STARTUP_TARGET_SECONDS}s ({breakdown})")
+        else:
+            logger.info(f"Ready in {elapsed:.2f}s ({breakdown})")
+
+    def _join(self, timeout: float):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        """等待就绪，超时返回 False"""
+        return self._ready.wait(timeout)
+
+    def snapshot(self) -> dict:
+        """/readyz 的响应内容"""
+        with self._lock:
+            status, error, ready_at = self.status, self.error, self.ready_at
+        result = {
+            'status': status,
+            'ready': status == 'ready',
+            'pid': os.getpid(),
+            'uptime_seconds': round(time.time() - self.started_at, 3),
+            'ready_seconds': round(ready_at - self.started_at, 3) if ready_at is not None else None,
+            'target_seconds': config.STARTUP_TARGET_SECONDS,
+            'phases': {name: round(seconds, 3) for name, seconds in self.phases.items()}
+        }
+        if error is not None:
+            result['error'] = error
+        return result
+
+
+# 进程级启动状态
+startup = StartupState()
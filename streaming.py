@@ -0,0 +1,494 @@
+"""
+视频流识别
+对视频文件、摄像头或客户端推送的连续帧做识别：
+与上一个识别帧几乎相同的帧（缩略灰度图的平均绝对差低于阈值）直接跳过；
+识别结果按 IoU 跨帧跟踪，只输出变化（新增 / 更新 / 移除），不重复报告没有变化的牌
+"""
+
+import sys
+import threading
+import time
+import uuid
+import logging
+from collections import deque
+
+import cv2
+import numpy as np
+
+import config
+import metrics
+import admission
+from backends import box_iou
+from detections import Detections, dumps
+from model_registry import registry
+from model_manifest import manifest
+from mahjong_predictor import get_batch_scheduler, predict_images, prepare_input, wait_batch_results
+
+logger = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = {'mp4', 'mov', 'avi', 'mkv', 'webm', 'm4v'}
+
+
+class FrameDiffer:
+    """帧差异检测：与上一个识别帧比较缩略灰度图"""
+
+    def __init__(self, threshold: float = None, width: int = None):
+        self.threshold = config.STREAM_DIFF_THRESHOLD if threshold is None else threshold
+        self.width = width or config.STREAM_DIFF_WIDTH
+        self.reference = None
+
+    def thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        height, width = frame.shape[:2]
+        size = (self.width, max(1, round(height * self.width / width)))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    def check(self, frame: np.ndarray, force: bool = False) -> tuple:
+        """
+        Args:
+            frame: BGR 帧
+            force: 无论差异大小都识别该帧
+
+        Returns:
+            (是否需要识别, 差异值)，第一帧的差异值为 None；需要识别时该帧成为新的参考帧
+        """
+        with metrics.stage('frame_diff'):
+            thumb = self.thumbnail(frame)
+            if self.reference is None or self.reference.shape != thumb.shape:
+                score = None
+            else:
+                score = float(cv2.absdiff(thumb, self.reference).mean())
+            changed = force or score is None or score >= self.threshold
+            if changed:
+                self.reference = thumb
+        return changed, score
+
+
+class Track:
+    """一张被跟踪的牌"""
+
+    __slots__ = ('track_id', 'box', 'confidence', 'class_id', 'hits', 'misses',
+                 'reported', 'reported_box', 'reported_class')
+
+    def __init__(self, track_id: int, detection: np.ndarray):
+        self.track_id = track_id
+        self.hits = 0
+        self.misses = 0
+        self.reported = False
+        self.reported_box = None
+        self.reported_class = None
+        self.observe(detection)
+
+    def observe(self, detection: np.ndarray):
+        self.box = detection[:4].copy()
+        self.confidence = float(detection[4])
+        self.class_id = int(detection[5])
+        self.hits += 1
+        self.misses = 0
+
+    def report(self):
+        self.reported = True
+        self.reported_box = self.box
+        self.reported_class = self.class_id
+
+
+class TileTracker:
+    """
+    按 IoU 贪心匹配的跨帧跟踪
+
+    新轨迹连续出现 min_hits 帧后报告为新增；已报告的轨迹类别变化或位置移动
+    （与上次报告位置的 IoU 低于 update_iou）时报告为更新；连续 max_misses 个识别帧未匹配时报告为移除
+    """
+
+    def __init__(self, iou_threshold: float = None, min_hits: int = None, max_misses: int = None,
+                 update_iou: float = None):
+        self.iou_threshold = config.STREAM_TRACK_IOU if iou_threshold is None else iou_threshold
+        self.min_hits = max(1, config.STREAM_TRACK_MIN_HITS if min_hits is None else min_hits)
+        self.max_misses = config.STREAM_TRACK_MAX_MISSES if max_misses is None else max_misses
+        self.update_iou = config.STREAM_UPDATE_IOU if update_iou is None else update_iou
+        self.tracks = []
+        self._next_id = 1
+
+    def _match(self, boxes: np.ndarray) -> tuple:
+        if not self.tracks or len(boxes) == 0:
+            return [], set(range(len(self.tracks))), set(range(len(boxes)))
+        iou = box_iou(np.stack([t.box for t in self.tracks]), boxes[:, :4])
+        candidates = np.argwhere(iou >= self.iou_threshold)
+        candidates = candidates[np.argsort(-iou[candidates[:, 0], candidates[:, 1]], kind='stable')]
+        matches = []
+        free_tracks = set(range(len(self.tracks)))
+        free_detections = set(range(len(boxes)))
+        for t, d in candidates.tolist():
+            if t in free_tracks and d in free_detections:
+                matches.append((t, d))
+                free_tracks.discard(t)
+                free_detections.discard(d)
+        return matches, free_tracks, free_detections
+
+    def update(self, detections: Detections) -> dict:
+        """
+        用一个识别帧的结果更新轨迹
+
+        Returns:
+            {'added': [...], 'updated': [...], 'removed': [track_id, ...]}，
+            新增和更新的牌与检测结果格式相同，另含 track_id
+        """
+        boxes = detections.boxes
+        added, updated, removed = [], [], []
+        with metrics.stage('track'):
+            matches, free_tracks, free_detections = self._match(boxes)
+            for t, d in matches:
+                track = self.tracks[t]
+                track.observe(boxes[d])
+                if not track.reported:
+                    if track.hits >= self.min_hits:
+                        track.report()
+                        added.append(track)
+                elif (track.class_id != track.reported_class
+                      or box_iou(track.box, track.reported_box)[0, 0] < self.update_iou):
+                    track.report()
+                    updated.append(track)
+
+            for t in free_tracks:
+                self.tracks[t].misses += 1
+
+            for d in sorted(free_detections):
+                track = Track(self._next_id, boxes[d])
+                self._next_id += 1
+                self.tracks.append(track)
+                if self.min_hits <= 1:
+                    track.report()
+                    added.append(track)
+
+            alive = []
+            for track in self.tracks:
+                if track.misses > self.max_misses:
+                    if track.reported:
+                        removed.append(track.track_id)
+                else:
+                    alive.append(track)
+            self.tracks = alive
+
+        return {'added': track_records(added), 'updated': track_records(updated), 'removed': removed}
+
+    def settled(self) -> bool:
+        """没有待确认的新增（出现次数不足）或移除（连续未匹配）时为 True"""
+        return all(t.reported and t.misses == 0 for t in self.tracks)
+
+    def snapshot(self) -> list:
+        """当前已报告的全部牌"""
+        return track_records([t for t in self.tracks if t.reported])
+
+
+def track_records(tracks: list) -> list:
+    """轨迹 -> 检测结果格式的字典列表（id 替换为 track_id）"""
+    if not tracks:
+        return []
+    boxes = [[*t.box.tolist(), t.confidence, t.class_id] for t in tracks]
+    records = Detections(boxes).records()
+    for record, track in zip(records, tracks):
+        del record['id']
+        record['track_id'] = track.track_id
+    return records
+
+
+class StreamSession:
+    """一路视频流的识别状态：帧差异、跟踪和统计"""
+
+    def __init__(self, model_path: str = None, conf_threshold: float = None, device: str = None,
+                 diff_threshold: float = None, model: str = None):
+        self.session_id = uuid.uuid4().hex
+        self.model_path = model_path
+        self.conf_threshold = conf_threshold
+        # 未指定模型文件时使用模型清单中的模型（model 为名称，默认按分流权重选择），整个会话使用同一个模型
+        self.model_name = None if model_path else manifest.current().select(model).name
+        self.device = device or config.MODEL_DEVICE
+        self.differ = FrameDiffer(diff_threshold)
+        self.tracker = TileTracker()
+        self.lock = threading.Lock()
+        self.frames_received = 0
+        self.frames_processed = 0
+        self.frames_skipped = 0
+        self.frames_dropped = 0
+        # 最近的单帧延迟（毫秒），长时间运行的流只保留最近一段
+        self.latencies = deque(maxlen=10000)
+        self.started_at = time.time()
+        self.last_active = self.started_at
+
+    def detect(self, frame: np.ndarray) -> Detections:
+        if config.PREPROCESS_ENABLED:
+            # 经过微批调度器时不复用线程缓冲区（超时返回后调度器可能仍在读取）
+            image = prepare_input(frame, reuse_buffer=not config.BATCH_ENABLED)
+        else:
+            image = frame
+        if self.model_name is None:
+            conf = config.CONF_THRESHOLD if self.conf_threshold is None else self.conf_threshold
+            return self._infer(image, self.model_path, conf, None)
+
+        if self.model_name not in manifest.current().models:
+            # 会话使用的模型已从清单中移除，改用默认模型
+            logger.warning(f"Model {self.model_name} was removed from the manifest, "
+                           f"session {self.session_id} now uses {manifest.current().default}")
+            self.model_name = manifest.current().default
+        with manifest.use(self.model_name) as spec:
+            conf = spec.conf if self.conf_threshold is None else self.conf_threshold
+            start = time.perf_counter()
+            detections = self._infer(image, spec.path, conf, spec.variant)
+            manifest.record(spec, time.perf_counter() - start, detections=len(detections))
+        return detections
+
+    def _infer(self, image, model_path: str, conf_threshold: float, variant: str) -> Detections:
+        if config.BATCH_ENABLED:
+            # 多路视频流和单张图片请求共用微批调度器
+            scheduler = get_batch_scheduler(model_path, conf_threshold, self.device, variant=variant)
+            return wait_batch_results([scheduler.submit(image, admission.current_deadline())])[0]
+        admission.check_deadline()
+        return predict_images([image], model_path, conf_threshold, self.device, variant=variant)[0]
+
+    def record_dropped(self, count: int = 1):
+        """输入端来不及处理而丢弃的帧"""
+        if count:
+            self.frames_received += count
+            self.frames_dropped += count
+            metrics.STREAM_FRAMES.inc(count, result='dropped')
+
+    def process(self, frame: np.ndarray, timestamp_ms: float = None) -> dict:
+        """
+        处理一帧
+
+        Returns:
+            帧事件（frame、timestamp_ms、diff_score、latency_ms、added、updated、removed 等），
+            与上一个识别帧几乎相同而跳过时返回 None
+        """
+        self.last_active = time.time()
+        index = self.frames_received
+        self.frames_received += 1
+        start = time.perf_counter()
+
+        # 有待确认的轨迹时即使画面没有变化也继续识别，否则静止画面中的牌永远不会被确认
+        changed, score = self.differ.check(frame, force=not self.tracker.settled())
+        if not changed:
+            self.frames_skipped += 1
+            metrics.STREAM_FRAMES.inc(result='skipped')
+            return None
+
+        detections = self.detect(frame)
+        diff = self.tracker.update(detections)
+        latency_ms = (time.perf_counter() - start) * 1000.0
+        self.latencies.append(latency_ms)
+        self.frames_processed += 1
+        metrics.STREAM_FRAMES.inc(result='processed')
+
+        event = {
+            'type': 'frame',
+            'frame': index,
+            'timestamp_ms': timestamp_ms,
+            'diff_score': score,
+            'latency_ms': latency_ms,
+            'total_detections': len(detections),
+            'tracks': sum(1 for t in self.tracker.tracks if t.reported)
+        }
+        event.update(diff)
+        return event
+
+    def stats(self) -> dict:
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        latencies = np.asarray(self.latencies, dtype=np.float64)
+        return {
+            'session_id': self.session_id,
+            'model': self.model_name,
+            'frames_received': self.frames_received,
+            'frames_processed': self.frames_processed,
+            'frames_skipped': self.frames_skipped,
+            'frames_dropped': self.frames_dropped,
+            'elapsed_s': elapsed,
+            'input_fps': self.frames_received / elapsed,
+            'processed_fps': self.frames_processed / elapsed,
+            'latency_ms': {
+                'mean': float(latencies.mean()) if len(latencies) else 0.0,
+                'p50': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+                'p99': float(np.percentile(latencies, 99)) if len(latencies) else 0.0
+            }
+        }
+
+    def summary(self) -> dict:
+        return dict(self.stats(), type='summary', tiles=self.tracker.snapshot())
+
+
+def open_capture(source) -> cv2.VideoCapture:
+    """打开视频文件或摄像头（纯数字表示摄像头编号）"""
+    capture = cv2.VideoCapture(int(source) if str(source).isdigit() else str(source))
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video: {source}")
+    return capture
+
+
+def read_frames(capture: cv2.VideoCapture):
+    """顺序读取每一帧，产生 (丢弃帧数, 时间戳毫秒, 帧)，不丢帧"""
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        yield 0, capture.get(cv2.CAP_PROP_POS_MSEC), frame
+
+
+class LatestFrameReader:
+    """
+    后台线程持续读帧，只保留最新一帧：识别跟不上输入时，来不及处理的帧被丢弃并计数
+
+    pace 为 True 时按视频帧率读取（视频文件模拟实时输入）
+    """
+
+    def __init__(self, capture: cv2.VideoCapture, pace: bool = False):
+        self.capture = capture
+        fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+        self.interval = 1.0 / fps if pace and fps > 0 else 0.0
+        self.condition = threading.Condition()
+        self.latest = None
+        self.dropped = 0
+        self.finished = False
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, daemon=True, name='frame-reader')
+        self.thread.start()
+
+    def _run(self):
+        next_time = time.perf_counter()
+        while not self.stopped:
+            ok, frame = self.capture.read()
+            if not ok:
+                break
+            timestamp = self.capture.get(cv2.CAP_PROP_POS_MSEC)
+            with self.condition:
+                if self.latest is not None:
+                    self.dropped += 1
+                self.latest = (timestamp, frame)
+                self.condition.notify()
+            if self.interval:
+                next_time += self.interval
+                time.sleep(max(0.0, next_time - time.perf_counter()))
+        with self.condition:
+            self.finished = True
+            self.condition.notify()
+
+    def __iter__(self):
+        while True:
+            with self.condition:
+                while self.latest is None and not self.finished:
+                    self.condition.wait()
+                if self.latest is None:
+                    return
+                (timestamp, frame), self.latest = self.latest, None
+                dropped, self.dropped = self.dropped, 0
+            yield dropped, timestamp, frame
+
+    def stop(self):
+        self.stopped = True
+        self.thread.join(timeout=5)
+
+
+def iter_video(source, realtime: bool = False):
+    """
+    读取视频文件或摄像头，产生 (丢弃帧数, 时间戳毫秒, 帧)
+
+    摄像头和 realtime 模式下只处理最新一帧（来不及处理的帧被丢弃），
+    否则逐帧读取视频文件
+    """
+    capture = open_capture(source)
+    reader = None
+    try:
+        if str(source).isdigit() or realtime:
+            reader = LatestFrameReader(capture, pace=not str(source).isdigit())
+            yield from reader
+        else:
+            yield from read_frames(capture)
+    finally:
+        if reader is not None:
+            reader.stop()
+        capture.release()
+
+
+def stream_events(session: StreamSession, frames, emit_empty: bool = False):
+    """
+    对帧序列逐帧识别，产生有变化的帧事件，最后产生汇总事件（summary）
+
+    Args:
+        session: 视频流会话
+        frames: (丢弃帧数, 时间戳毫秒, 帧) 迭代器
+        emit_empty: 是否输出没有变化的识别帧
+    """
+    for dropped, timestamp, frame in frames:
+        session.record_dropped(dropped)
+        event = session.process(frame, timestamp)
+        if event is not None and (emit_empty or event['added'] or event['updated'] or event['removed']):
+            yield event
+    yield session.summary()
+
+
+def run_video(args) -> int:
+    """命令行视频模式：每个有变化的帧输出一行 JSON，最后输出汇总"""
+    # 先加载并预热模型，避免首帧延迟计入统计、实时模式下积压丢帧
+    registry.warmup(args.model, config.MODEL_DEVICE, config.MODEL_WARMUP_SIZE)
+    session = StreamSession(args.model, args.conf, config.MODEL_DEVICE, args.diff_threshold)
+    try:
+        frames = iter_video(args.video, realtime=args.realtime)
+        for event in stream_events(session, frames, emit_empty=args.emit_empty):
+            sys.stdout.write(dumps(event) + '\n')
+            sys.stdout.flush()
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        sys.stdout.write(dumps(session.summary()) + '\n')
+
+    if not args.quiet:
+        stats = session.stats()
+        print(f"\n共 {stats['frames_received']} 帧：识别 {stats['frames_processed']}，"
+              f"跳过 {stats['frames_skipped']}，丢弃 {stats['frames_dropped']}；"
+              f"识别 {stats['processed_fps']:.1f} 帧/秒，"
+              f"单帧延迟 p50 {stats['latency_ms']['p50']:.1f}ms / p99 {stats['latency_ms']['p99']:.1f}ms",
+              file=sys.stderr)
+    return 0
+
+
+class SessionLimitReached(Exception):
+    """推帧会话数已达上限"""
+
+
+class StreamSessionManager:
+    """推帧会话（每个工作进程独立），空闲超过 MAHJONG_STREAM_SESSION_TTL 秒后回收"""
+
+    def __init__(self, max_sessions: int = None, ttl: float = None):
+        self.max_sessions = config.STREAM_MAX_SESSIONS if max_sessions is None else max_sessions
+        self.ttl = config.STREAM_SESSION_TTL if ttl is None else ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        now = time.time()
+        for session_id in [k for k, s in self._sessions.items() if now - s.last_active > self.ttl]:
+            del self._sessions[session_id]
+
+    def create(self, **kwargs) -> StreamSession:
+        with self._lock:
+            self._expire()
+            if len(self._sessions) >= self.max_sessions:
+                raise SessionLimitReached(f"Too many stream sessions (max {self.max_sessions})")
+            session = StreamSession(**kwargs)
+            self._sessions[session.session_id] = session
+            return session
+
+    def get(self, session_id: str) -> StreamSession:
+        with self._lock:
+            self._expire()
+            return self._sessions.get(session_id)
+
+    def close(self, session_id: str) -> StreamSession:
+        with self._lock:
+            return self._sessions.pop(session_id, None)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+
+session_manager = StreamSessionManager()
@@ -37,8 +37,10 @@ def test_predict_service():
     try:
         with open(test_image_path, 'rb') as f:
             files = {'file': f}
+            # 同时请求结果图片
+            data = {'render': '1'}
             # 设置超时时间为60秒（连接超时5秒，读取超时60秒）
-            response = requests.post(url, files=files, timeout=(10, 300))
+            response = requests.post(url, files=files, data=data, timeout=(10, 300))
         
         print(f"响应状态码: {response.status_code}")
         print(f"响应内容: {json.dumps(response.json(), indent=2, ensure_ascii=False)}")
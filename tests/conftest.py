@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+import config
+
+# 测试中加载 / 导出模型时不联网检查和安装可选依赖
+os.environ.setdefault('YOLO_OFFLINE', '1')
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """不预热模型的 Flask 测试客户端（导入和查找表加载在当前线程完成）"""
+    monkeypatch.setattr(config, 'MODEL_WARMUP', False)
+    monkeypatch.setattr(config, 'STARTUP_BACKGROUND', False)
+    from init import create_app
+
+    return create_app().test_client()
+
+
+@pytest.fixture(scope='session')
+def random_weights(tmp_path_factory):
+    """
+    随机初始化的 YOLOv8n 检测模型（34 类），不需要训练好的 best.pt
+
+    默认初始化下深层特征趋近于 0，所有位置的置信度几乎相同，框的排序无法比较：
+    重新初始化卷积权重（DFL 的固定权重除外），并放大分类层，使置信度分散在 0~1 之间
+    """
+    torch = pytest.importorskip('torch')
+    pytest.importorskip('ultralytics')
+    from ultralytics.nn.tasks import DetectionModel
+
+    torch.manual_seed(0)
+    model = DetectionModel('yolov8n.yaml', nc=34, verbose=False)
+    head = model.model[-1]
+    outputs = {id(branch[-1]) for branch in list(head.cv2) + list(head.cv3)}
+    for module in model.modules():
+        if isinstance(module, torch.nn.Conv2d) and module.weight.requires_grad and id(module) not in outputs:
+            torch.nn.init.kaiming_normal_(module.weight, nonlinearity='relu')
+    for branch in head.cv3:
+        branch[-1].weight.data *= 100
+        branch[-1].bias.data.fill_(-4.0)
+    model.eval()
+    path = str(tmp_path_factory.mktemp('weights') / 'random.pt')
+    torch.save({'model': model}, path)
+    return path
@@ -0,0 +1,46 @@
+"""
+导出模型与 PyTorch 模型的一致性
+用随机权重的 YOLOv8n（34 类，见 conftest.py）导出 ONNX，比较两个后端在同一批图片上的检测框、类别和置信度，不需要 best.pt
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('torch')
+pytest.importorskip('ultralytics')
+pytest.importorskip('onnx')
+pytest.importorskip('onnxruntime')
+
+import cv2  # noqa: E402
+
+from backends import export_model, load_backend  # noqa: E402
+from export_model import check_parity  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def images(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    path = str(tmp_path_factory.mktemp('images') / 'noise.jpg')
+    cv2.imwrite(path, rng.integers(0, 256, (480, 720, 3), dtype=np.uint8))
+    return [os.path.join(ROOT, 'augmented_1.jpg'), path]
+
+
+def test_onnx_matches_torch(random_weights, images):
+    exported = export_model(random_weights, 'onnx')
+    assert exported.endswith('.onnx') and os.path.exists(exported)
+    # 缓存命中时直接返回同一个文件，导出用的临时目录已删除
+    assert export_model(random_weights, 'onnx') == exported
+    assert not [name for name in os.listdir(os.path.dirname(exported)) if name.startswith('.export-')]
+
+    backend = load_backend(exported, 'onnx')
+    report = check_parity(random_weights, backend, images, conf_threshold=0.05, iou_threshold=0.9, min_match_rate=1.0)
+    assert report['passed'], report
+    for result in report['images']:
+        assert result['reference_boxes'] > 0
+        assert result['matched'] == result['reference_boxes'] == result['candidate_boxes']
+        assert result['max_coord_diff'] < 1.0
+        assert result['max_conf_diff'] < 1e-4
@@ -0,0 +1,169 @@
+"""
+向听数和进张与暴力搜索对照
+暴力搜索按定义枚举目标和牌形（面子 + 雀头、七对子、国士无双），求手牌最少还差几张，
+不经过查找表，覆盖同一种牌已有 4 张的手牌
+"""
+
+import random
+
+import pytest
+
+from hand_analysis import (
+    HONOR_RANGE, NUM_TILES, SUIT_RANGES, TERMINALS_AND_HONORS,
+    HandAnalyzer, HandTables, analyze_hand, counts_from_tiles
+)
+
+# 所有面子：刻子和顺子（字牌没有顺子）
+MELDS = [(t, t, t) for t in range(NUM_TILES)] + [
+    (t, t + 1, t + 2) for start, end in SUIT_RANGES for t in range(start, end - 2)
+]
+
+
+def brute_regular(counts) -> int:
+    """一般形：手牌张数 // 3 个面子加一个雀头，逐个枚举面子组合"""
+    melds = sum(counts) // 3
+    # 不含手中任何牌的面子都要摸 3 张，用"空面子"统一代替
+    candidates = [meld for meld in MELDS if any(counts[t] for t in meld)]
+    demand = [0] * NUM_TILES
+    best = [99]
+
+    def pair_cost():
+        costs = [max(demand[t] + 2 - counts[t], 0) - max(demand[t] - counts[t], 0)
+                 for t in range(NUM_TILES) if demand[t] + 2 <= 4]
+        return min(costs)
+
+    def search(first, left, missing):
+        if missing >= best[0]:
+            return
+        best[0] = min(best[0], missing + 3 * left + pair_cost())
+        if left == 0:
+            return
+        for index in range(first, len(candidates)):
+            meld = candidates[index]
+            before = sum(max(demand[t] - counts[t], 0) for t in set(meld))
+            for t in meld:
+                demand[t] += 1
+            if all(demand[t] <= 4 for t in meld):
+                after = sum(max(demand[t] - counts[t], 0) for t in set(meld))
+                search(index, left - 1, missing + after - before)
+            for t in meld:
+                demand[t] -= 1
+
+    search(0, melds, 0)
+    return best[0] - 1
+
+
+def brute_chiitoitsu(counts) -> int:
+    """七对子：7 种不同的牌各 2 张"""
+    return sum(sorted(max(2 - c, 0) for c in counts)[:7]) - 1
+
+
+def brute_kokushi(counts) -> int:
+    """国士无双：13 种幺九牌各 1 张，其中一种再多 1 张"""
+    return min(
+        sum(max((2 if t == pair else 1) - counts[t], 0) for t in TERMINALS_AND_HONORS)
+        for pair in TERMINALS_AND_HONORS
+    ) - 1
+
+
+def brute_shanten(counts) -> int:
+    value = brute_regular(counts)
+    if sum(counts) in (13, 14):
+        value = min(value, brute_chiitoitsu(counts), brute_kokushi(counts))
+    return value
+
+
+def brute_effective_tiles(counts) -> tuple:
+    current = brute_shanten(counts)
+    tiles = []
+    for t in range(NUM_TILES):
+        if counts[t] >= 4:
+            continue
+        counts[t] += 1
+        if brute_shanten(counts) < current:
+            tiles.append(t)
+        counts[t] -= 1
+    return current, tiles
+
+
+def random_hand(rng: random.Random, size: int) -> list:
+    """从少数几种牌中抽取，容易出现面子、对子和 4 张相同的牌"""
+    pool = [t for t in rng.sample(range(NUM_TILES), rng.randint(4, 9)) for _ in range(4)]
+    counts = [0] * NUM_TILES
+    for t in rng.sample(pool, size):
+        counts[t] += 1
+    return counts
+
+
+def four_of_a_kind_hands() -> list:
+    """每种花色和字牌的最后一张（九饼、九条、九万、白板）以及中间的牌各有 4 张"""
+    rest = ['一条', '二条', '三条', '四万', '五万', '六万', '东风', '东风', '南风']
+    hands = [counts_from_tiles([tile] * 4 + rest) for tile in ('九饼', '五饼', '九条', '九万', '北风', '白板')]
+    for start, end in SUIT_RANGES + (HONOR_RANGE,):
+        for t in (start, end - 1):
+            counts = [0] * NUM_TILES
+            counts[t] = 4
+            for extra in (start + 1, (t + 10) % NUM_TILES, (t + 11) % NUM_TILES):
+                counts[extra] = min(counts[extra] + 3, 4)
+            if sum(counts) % 3 != 0:
+                hands.append(counts)
+    return hands
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    return HandAnalyzer(HandTables.build())
+
+
+def hand_cases() -> list:
+    rng = random.Random(20240514)
+    hands = four_of_a_kind_hands()
+    hands += [random_hand(rng, 13) for _ in range(60)]
+    hands += [random_hand(rng, size) for size in (1, 4, 7, 10) for _ in range(10)]
+    # 国士无双和七对子
+    hands.append(counts_from_tiles(['一饼', '九饼', '一条', '九条', '一万', '九万',
+                                    '东风', '南风', '西风', '北风', '红中', '发财', '发财']))
+    hands.append(counts_from_tiles(['一饼', '一饼', '三条', '三条', '五万', '五万',
+                                    '东风', '东风', '红中', '红中', '白板', '白板', '九条']))
+    return [h for h in hands if sum(h) % 3 == 1]
+
+
+@pytest.mark.parametrize('counts', hand_cases())
+def test_effective_tiles_match_brute_force(analyzer, counts):
+    expected = brute_effective_tiles(list(counts))
+    assert analyzer.effective_tiles(list(counts)) == expected
+    assert analyzer.shanten(counts)['shanten'] == expected[0]
+
+
+@pytest.mark.parametrize('size', [14, 11, 8])
+def test_shanten_matches_brute_force(analyzer, size):
+    rng = random.Random(size)
+    hands = [random_hand(rng, size) for _ in range(25)]
+    for counts in hands:
+        assert analyzer.shanten(counts)['shanten'] == brute_shanten(counts), counts
+    assert analyzer.shanten_batch(hands).tolist() == [brute_shanten(h) for h in hands]
+
+
+def test_analyze_hand_with_four_of_a_kind_on_last_tile():
+    rest = ['一条', '二条', '三条', '四万', '五万', '六万', '东风', '东风', '南风']
+    for tile in ('九饼', '白板'):
+        result = analyze_hand(counts_from_tiles([tile] * 4 + rest))
+        assert result['shanten'] == 1
+        assert tile not in [t['class_name'] for t in result['effective_tiles']]
+
+
+@pytest.mark.parametrize('body', [
+    '"123m"', '"counts"', '[1, 2]', '["tiles"]', '42', 'null',
+    '{"tiles": 5}', '{"tiles": [null]}', '{"counts": "abc"}', '{}'
+])
+def test_analyze_hand_rejects_invalid_json(client, body):
+    response = client.post('/analyze_hand', data=body, content_type='application/json')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_analyze_hand_json(client):
+    tiles = ['九饼'] * 4 + ['一条', '二条', '三条', '四万', '五万', '六万', '东风', '东风', '南风']
+    response = client.post('/analyze_hand', json={'tiles': tiles})
+    assert response.status_code == 200
+    assert response.get_json()['analysis']['shanten'] == 1
@@ -0,0 +1,55 @@
+import io
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import config
+from model_manifest import manifest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def sliced_client(client, random_weights, monkeypatch):
+    """使用随机权重模型、开启切片推理的测试客户端"""
+    monkeypatch.setattr(config, 'MODEL_PATH', random_weights)
+    monkeypatch.setattr(config, 'CONF_THRESHOLD', 0.05)
+    monkeypatch.setattr(config, 'SLICE_MODE', 'on')
+    # 重新按配置生成默认模型清单
+    monkeypatch.setattr(manifest, '_current', None)
+    return client
+
+
+@pytest.fixture
+def large_image() -> bytes:
+    image = cv2.imread(os.path.join(ROOT, 'augmented_1.jpg'))
+    return cv2.imencode('.jpg', np.hstack([image, cv2.flip(image, 1)]))[1].tobytes()
+
+
+def boxes(detections) -> list:
+    return sorted((d['class_id'], round(d['confidence'], 4), tuple(round(d['bbox'][k], 1) for k in ('x1', 'y1', 'x2', 'y2')))
+                  for d in detections)
+
+
+def test_batch_then_single_upload_use_sliced_results(sliced_client, random_weights, large_image):
+    from mahjong_predictor import decode_image, predict_sliced
+
+    expected = boxes(predict_sliced(decode_image(large_image), random_weights, 0.05).records())
+    assert expected
+
+    response = sliced_client.post('/predict_batch', data={'files': (io.BytesIO(large_image), 'table.jpg')},
+                                  content_type='multipart/form-data')
+    assert response.status_code == 200
+    result = response.get_json()['results'][0]
+    assert result['success'] and not result['cache_hit']
+    assert boxes(result['detections']) == expected
+
+    # 同一张图片的单张识别命中批量接口写入的缓存，结果同样是切片推理的结果
+    response = sliced_client.post('/predict_image', data={'file': (io.BytesIO(large_image), 'table.jpg')},
+                                  content_type='multipart/form-data')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['cache_hit']
+    assert boxes(data['json_result'][0]['detections']) == expected
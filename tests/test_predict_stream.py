@@ -0,0 +1,43 @@
+import io
+
+import pytest
+
+import admission
+
+
+@pytest.fixture
+def video_limit(monkeypatch):
+    controller = admission.AdmissionController(1, 0, 0)
+    monkeypatch.setattr(admission, 'video_controller', controller)
+    return controller
+
+
+def upload(client, name='table.mp4'):
+    # 视频内容在流式响应中才读取，这里只检查获取名额
+    return client.post('/predict_stream', data={'file': (io.BytesIO(b'not a video'), name)},
+                       content_type='multipart/form-data')
+
+
+def test_video_uploads_beyond_limit_are_rejected(client, video_limit):
+    first = upload(client)
+    assert first.status_code == 200
+    assert video_limit.in_flight == 1
+
+    second = upload(client)
+    assert second.status_code == 503
+    assert second.headers['Retry-After'] == '1'
+    assert second.get_json()['reason'] == 'queue_full'
+
+    # 第一个视频的响应结束后释放名额
+    first.get_data()
+    first.close()
+    assert video_limit.in_flight == 0
+    third = upload(client)
+    assert third.status_code == 200
+    third.close()
+
+
+def test_rejected_video_upload_releases_slot(client, video_limit):
+    response = upload(client, name='table.txt')
+    assert response.status_code == 400
+    assert video_limit.in_flight == 0
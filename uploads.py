@@ -0,0 +1,57 @@
+"""
+上传文件校验
+/predict_image 与 /predict_jobs 等接口共用的上传文件检查
+"""
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
+
+
+def allowed_file(filename: str) -> bool:
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def file_size(file) -> int:
+    """上传文件大小（字节），读取后把文件指针重置到开头"""
+    file.seek(0, 2)  # 移动到文件末尾
+    size = file.tell()
+    file.seek(0)  # 重置到文件开头
+    return size
+
+
+def validate_upload(files, field: str = 'file') -> tuple:
+    """
+    检查请求中的上传文件
+
+    Args:
+        files: request.files
+        field: 表单字段名
+
+    Returns:
+        (文件对象, 错误信息)，校验通过时错误信息为 None
+    """
+    # 检查是否有文件上传
+    if field not in files:
+        return None, 'No file part'
+
+    file = files[field]
+
+    # 检查是否选择了文件
+    if file.filename == '':
+        return None, 'No selected file'
+
+    return file, validate_file(file)
+
+
+def validate_file(file) -> str:
+    """检查单个上传文件的大小和类型，返回错误信息，校验通过返回 None"""
+    # 检查文件大小
+    size = file_size(file)
+    if size > MAX_FILE_SIZE:
+        return f'File too large. Maximum size is {MAX_FILE_SIZE // (1024*1024)}MB'
+
+    # 检查文件类型是否允许
+    if not allowed_file(file.filename):
+        return 'File type not allowed. Supported formats: PNG, JPG, JPEG, GIF'
+
+    return None